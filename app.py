@@ -1,27 +1,79 @@
-import gradio as gr
+import logging
 
-from indiebot_arena.config import MONGO_DB_URI, MONGO_DB_NAME, LANGUAGE
+from indiebot_arena.util.startup_timer import StartupTimer
+
+logging.basicConfig(level=logging.INFO)
+timer = StartupTimer()
+
+with timer.phase("import gradio"):
+  import gradio as gr
+
+from indiebot_arena.config import MONGO_DB_URI, MONGO_DB_NAME, LANGUAGE, WARMUP_TOP_N, WARMUP_STRATEGY, WARMUP_PRELOAD, \
+  ENABLED_TABS, PROVISION_DATABASE, BATTLE_WRITE_BUFFER_ENABLED, MODEL_PIN_REFRESH_INTERVAL_SEC, INVALIDATION_BUS_MODE, \
+  GENERATION_WORKERS
+from indiebot_arena.dao.battle_write_buffer import BattleWriteBuffer
+from indiebot_arena.dao.invalidation_bus import InvalidationBus
 from indiebot_arena.dao.mongo_dao import MongoDAO
 from indiebot_arena.service.bootstrap_service import BootstrapService
-from indiebot_arena.ui.battle import battle_content
-from indiebot_arena.ui.leaderboard import leaderboard_content
-from indiebot_arena.ui.playground import playground_content
-from indiebot_arena.ui.registration import registration_content
-
-dao = MongoDAO(MONGO_DB_URI, MONGO_DB_NAME)
-bootstrap_service = BootstrapService(dao)
-bootstrap_service.provision_database()
-
-with gr.Blocks(theme=gr.themes.Citrus(primary_hue="sky"), css_paths="style.css") as demo:
-  with gr.Tabs():
-    with gr.TabItem("🏆 リーダーボード"):
-      leaderboard_content(dao, LANGUAGE)
-    with gr.TabItem("⚔️ チャット対戦"):
-      battle_content(dao, LANGUAGE)
-    with gr.TabItem("📚️ モデルの登録"):
-      registration_content(dao, LANGUAGE)
-    with gr.TabItem("💬 Playground"):
-      playground_content(dao, LANGUAGE)
+from indiebot_arena.service.model_pin_service import ModelPinService
+from indiebot_arena.service.warmup_service import WarmupService
+
+
+def verify_revision(model, revision):
+  # The registration check (transformers, the check queue) is only imported once a model has a new revision.
+  from indiebot_arena.ui.registration import verify_revision as run_registration_check
+
+  return run_registration_check(model, revision)
+
+
+with timer.phase("connect database"):
+  dao = MongoDAO(MONGO_DB_URI, MONGO_DB_NAME)
+battle_buffer = BattleWriteBuffer(dao) if BATTLE_WRITE_BUFFER_ENABLED else None
+invalidation_bus = InvalidationBus(dao, INVALIDATION_BUS_MODE) if INVALIDATION_BUS_MODE!="off" else None
+
+if PROVISION_DATABASE:
+  with timer.phase("provision database"):
+    bootstrap_service = BootstrapService(dao)
+    bootstrap_service.provision_database()
+with timer.phase("apply model pins"):
+  model_pin_service = ModelPinService(dao, verify_revision=verify_revision)
+  model_pin_service.apply_pins()
+if MODEL_PIN_REFRESH_INTERVAL_SEC > 0:
+  model_pin_service.start_background_refresh(MODEL_PIN_REFRESH_INTERVAL_SEC)
+if GENERATION_WORKERS > 0:
+  with timer.phase("start generation workers"):
+    from indiebot_arena.engine.worker_pool import get_generation_pool
+    get_generation_pool()
+if WARMUP_TOP_N > 0:
+  WarmupService(dao).start_background_warm_up(LANGUAGE, ["U-5GB", "U-10GB"], WARMUP_TOP_N, WARMUP_STRATEGY, WARMUP_PRELOAD)
+
+with timer.phase("build ui"):
+  with gr.Blocks(theme=gr.themes.Citrus(primary_hue="sky"), css_paths="style.css") as demo:
+    with gr.Tabs():
+      if "leaderboard" in ENABLED_TABS:
+        with gr.TabItem("🏆 リーダーボード"):
+          from indiebot_arena.ui.leaderboard import leaderboard_content
+          leaderboard_content(dao, LANGUAGE, invalidation_bus)
+      if "battle" in ENABLED_TABS:
+        with gr.TabItem("⚔️ チャット対戦"):
+          from indiebot_arena.ui.battle import battle_content, release_battle_session
+          battle_content(dao, LANGUAGE, battle_buffer, invalidation_bus)
+          demo.unload(release_battle_session)
+      if "registration" in ENABLED_TABS:
+        with gr.TabItem("📚️ モデルの登録"):
+          from indiebot_arena.ui.registration import registration_content
+          registration_content(dao, LANGUAGE)
+      if "playground" in ENABLED_TABS:
+        with gr.TabItem("💬 Playground"):
+          from indiebot_arena.ui.playground import playground_content, release_playground_session
+          playground_content(dao, LANGUAGE)
+          demo.unload(release_playground_session)
+
+if invalidation_bus is not None:
+  with timer.phase("start invalidation bus"):
+    invalidation_bus.start()
+
+logging.info(timer.report())
 
 if __name__=="__main__":
   demo.queue(max_size=20).launch()
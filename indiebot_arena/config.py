@@ -12,4 +12,102 @@ MAX_INPUT_TOKEN_LENGTH = int(os.getenv("MAX_INPUT_TOKEN_LENGTH", "512"))
 if LOCAL_TESTING:
   MAX_NEW_TOKENS = 20
 else:
-  MAX_NEW_TOKENS = 512
\ No newline at end of file
+  MAX_NEW_TOKENS = 512
+
+LLAMA_CPP_GGUF_PATTERN = os.getenv("LLAMA_CPP_GGUF_PATTERN", "*Q4_K_M.gguf")
+LLAMA_CPP_N_THREADS = int(os.getenv("LLAMA_CPP_N_THREADS", "0"))
+LLAMA_CPP_N_GPU_LAYERS = int(os.getenv("LLAMA_CPP_N_GPU_LAYERS", "0"))
+
+SESSION_STORE_MAX_SESSIONS = int(os.getenv("SESSION_STORE_MAX_SESSIONS", "1000"))
+SESSION_IDLE_TIMEOUT_SEC = int(os.getenv("SESSION_IDLE_TIMEOUT_SEC", "1800"))
+
+MAX_RESIDENT_MODELS = int(os.getenv("MAX_RESIDENT_MODELS", "4"))
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", "0"))
+WARMUP_STRATEGY = os.getenv("WARMUP_STRATEGY", "battles")
+WARMUP_PRELOAD = os.getenv("WARMUP_PRELOAD", "False").lower() in ["true", "1", "yes"]
+
+ENABLED_TABS = [t.strip() for t in os.getenv("ENABLED_TABS", "leaderboard,battle,registration,playground").split(",")]
+PROVISION_DATABASE = os.getenv("PROVISION_DATABASE", "True").lower() in ["true", "1", "yes"]
+
+BATTLE_WRITE_BUFFER_ENABLED = os.getenv("BATTLE_WRITE_BUFFER_ENABLED", "False").lower() in ["true", "1", "yes"]
+BATTLE_WRITE_BUFFER_MAX_BATCH_SIZE = int(os.getenv("BATTLE_WRITE_BUFFER_MAX_BATCH_SIZE", "100"))
+BATTLE_WRITE_BUFFER_FLUSH_INTERVAL_SEC = float(os.getenv("BATTLE_WRITE_BUFFER_FLUSH_INTERVAL_SEC", "1.0"))
+BATTLE_WRITE_BUFFER_MAX_PENDING = int(os.getenv("BATTLE_WRITE_BUFFER_MAX_PENDING", "1000"))
+BATTLE_WRITE_BUFFER_SUBMIT_TIMEOUT_SEC = float(os.getenv("BATTLE_WRITE_BUFFER_SUBMIT_TIMEOUT_SEC", "2.0"))
+
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "False").lower() in ["true", "1", "yes"]
+ADMISSION_USER_RATE_PER_MIN = float(os.getenv("ADMISSION_USER_RATE_PER_MIN", "30"))
+ADMISSION_USER_BURST = int(os.getenv("ADMISSION_USER_BURST", "10"))
+ADMISSION_GLOBAL_RATE_PER_MIN = float(os.getenv("ADMISSION_GLOBAL_RATE_PER_MIN", "120"))
+ADMISSION_GLOBAL_BURST = int(os.getenv("ADMISSION_GLOBAL_BURST", "20"))
+ADMISSION_MAX_DELAY_SEC = float(os.getenv("ADMISSION_MAX_DELAY_SEC", "3"))
+
+MATCHMAKING_CACHE_TTL_SEC = float(os.getenv("MATCHMAKING_CACHE_TTL_SEC", "300"))
+MATCHMAKING_EXPLORATION = float(os.getenv("MATCHMAKING_EXPLORATION", "0.2"))
+
+RATING_CHECKPOINT_INTERVAL = int(os.getenv("RATING_CHECKPOINT_INTERVAL", "500"))
+RATING_CHECKPOINT_SAFETY_SEC = float(os.getenv("RATING_CHECKPOINT_SAFETY_SEC", "60"))
+RATING_CHECKPOINT_KEEP = int(os.getenv("RATING_CHECKPOINT_KEEP", "3"))
+
+RATING_MODE = os.getenv("RATING_MODE", "elo")
+RATING_WINDOW_DAYS = int(os.getenv("RATING_WINDOW_DAYS", "0"))
+
+RECOMPUTE_MAX_WORKERS = int(os.getenv("RECOMPUTE_MAX_WORKERS", "0"))
+RECOMPUTE_PARALLEL_MIN_BATTLES = int(os.getenv("RECOMPUTE_PARALLEL_MIN_BATTLES", "20000"))
+
+TRAFFIC_RECORD_PATH = os.getenv("TRAFFIC_RECORD_PATH", "")
+
+# "fake" serves every runtime with FakeEngine (no weights or GPU) for load tests.
+GENERATION_BACKEND = os.getenv("GENERATION_BACKEND", "")
+FAKE_ENGINE_TOKENS_PER_SEC = float(os.getenv("FAKE_ENGINE_TOKENS_PER_SEC", "50"))
+FAKE_ENGINE_FIRST_TOKEN_LATENCY_SEC = float(os.getenv("FAKE_ENGINE_FIRST_TOKEN_LATENCY_SEC", "0.2"))
+FAKE_ENGINE_JITTER = float(os.getenv("FAKE_ENGINE_JITTER", "0.0"))
+FAKE_ENGINE_MAX_NEW_TOKENS = int(os.getenv("FAKE_ENGINE_MAX_NEW_TOKENS", "64"))
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "False").lower() in ["true", "1", "yes"]
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "trace.json")
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "200000"))
+TRACE_SLOW_UI_MS = float(os.getenv("TRACE_SLOW_UI_MS", "1000"))
+TRACE_SLOW_SERVICE_MS = float(os.getenv("TRACE_SLOW_SERVICE_MS", "500"))
+TRACE_SLOW_DAO_MS = float(os.getenv("TRACE_SLOW_DAO_MS", "100"))
+TRACE_EXPORT_INTERVAL_SEC = float(os.getenv("TRACE_EXPORT_INTERVAL_SEC", "60"))
+TRACE_EXPORT_BATCH_SPANS = int(os.getenv("TRACE_EXPORT_BATCH_SPANS", "10000"))
+
+REGISTRATION_JOB_WORKERS = int(os.getenv("REGISTRATION_JOB_WORKERS", "1"))
+REGISTRATION_JOB_HISTORY = int(os.getenv("REGISTRATION_JOB_HISTORY", "50"))
+
+MODEL_PIN_REFRESH_INTERVAL_SEC = int(os.getenv("MODEL_PIN_REFRESH_INTERVAL_SEC", "3600"))
+
+SHARD_LOADER_ENABLED = os.getenv("SHARD_LOADER_ENABLED", "True").lower() in ["true", "1", "yes"]
+SHARD_LOADER_WORKERS = int(os.getenv("SHARD_LOADER_WORKERS", "4"))
+
+RATING_HISTORY_RAW_RETENTION_HOURS = int(os.getenv("RATING_HISTORY_RAW_RETENTION_HOURS", "24"))
+RATING_HISTORY_HOURLY_RETENTION_DAYS = int(os.getenv("RATING_HISTORY_HOURLY_RETENTION_DAYS", "30"))
+RATING_TREND_DAYS = int(os.getenv("RATING_TREND_DAYS", "30"))
+RATING_TREND_REFRESH_SEC = float(os.getenv("RATING_TREND_REFRESH_SEC", "300"))
+
+LEADERBOARD_PUSH_INTERVAL_SEC = float(os.getenv("LEADERBOARD_PUSH_INTERVAL_SEC", "5"))
+LEADERBOARD_PUSH_MAX_AGE_SEC = float(os.getenv("LEADERBOARD_PUSH_MAX_AGE_SEC", "60"))
+
+# "off", "auto" (same as "polling"), "change_stream" or "polling"
+INVALIDATION_BUS_MODE = os.getenv("INVALIDATION_BUS_MODE", "off")
+INVALIDATION_POLL_INTERVAL_SEC = float(os.getenv("INVALIDATION_POLL_INTERVAL_SEC", "2"))
+
+# Generation worker processes (0: generate in the app process). Each worker keeps the models placed on it
+# resident, packed by file_size_gb into GENERATION_WORKER_MEMORY_GB.
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "0"))
+GENERATION_WORKER_MEMORY_GB = float(os.getenv("GENERATION_WORKER_MEMORY_GB", "16"))
+GENERATION_WORKER_HEALTH_INTERVAL_SEC = float(os.getenv("GENERATION_WORKER_HEALTH_INTERVAL_SEC", "10"))
+GENERATION_WORKER_HEALTH_TIMEOUT_SEC = float(os.getenv("GENERATION_WORKER_HEALTH_TIMEOUT_SEC", "60"))
+
+# "concurrent" streams both sides of a battle on their own threads; "interleaved" alternates their steps.
+PAIRED_BATTLE_MODE = os.getenv("PAIRED_BATTLE_MODE", "concurrent")
+PAIRED_BATTLE_METRICS_WINDOW = int(os.getenv("PAIRED_BATTLE_METRICS_WINDOW", "500"))
+
+# Load-adaptive generation budget. Level 1 halves max_new_tokens; level 2 quarters it and sends only the latest
+# exchange to the model. A level starts when the queued chat jobs or the longest recent queue wait reach its threshold.
+LOAD_DEGRADATION_ENABLED = os.getenv("LOAD_DEGRADATION_ENABLED", "True").lower() in ["true", "1", "yes"]
+LOAD_DEGRADATION_QUEUE_DEPTH = tuple(int(x) for x in os.getenv("LOAD_DEGRADATION_QUEUE_DEPTH", "6,12").split(","))
+LOAD_DEGRADATION_WAIT_SEC = tuple(float(x) for x in os.getenv("LOAD_DEGRADATION_WAIT_SEC", "10,30").split(","))
+LOAD_DEGRADATION_WINDOW_SEC = float(os.getenv("LOAD_DEGRADATION_WINDOW_SEC", "60"))
+LOAD_DEGRADATION_COOLDOWN_SEC = float(os.getenv("LOAD_DEGRADATION_COOLDOWN_SEC", "30"))
@@ -0,0 +1,182 @@
+import atexit
+import logging
+import time
+from datetime import datetime
+from threading import Condition, Lock, Thread
+from typing import Callable, Dict, List, Optional, Set
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from indiebot_arena.config import BATTLE_WRITE_BUFFER_MAX_BATCH_SIZE, BATTLE_WRITE_BUFFER_FLUSH_INTERVAL_SEC, \
+  BATTLE_WRITE_BUFFER_MAX_PENDING, BATTLE_WRITE_BUFFER_SUBMIT_TIMEOUT_SEC
+from indiebot_arena.dao.mongo_dao import MongoDAO
+from indiebot_arena.model.domain_model import Battle
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class BattleWriteBuffer:
+  """
+  Write-behind buffer for battles.
+  Battles are flushed with insert_many when max_batch_size is reached or every flush_interval_sec,
+  so at most flush_interval_sec worth of votes can be lost on a crash. Pending battles are flushed on close()
+  (registered with atexit). When max_pending battles are waiting, submit() blocks up to submit_timeout_sec
+  and then raises ValueError.
+  Battles that failed to flush are retried. Those not written by the failed attempt get a new _id and
+  vote_timestamp when they are finally written, so readers that resume after the last seen _id or
+  timestamp (rating checkpoints, the battle export) still see them.
+  flush_listeners are called with each batch after it was written, e.g. to recompute the leaderboard.
+  """
+
+  def __init__(self,
+               dao: MongoDAO,
+               max_batch_size: int = BATTLE_WRITE_BUFFER_MAX_BATCH_SIZE,
+               flush_interval_sec: float = BATTLE_WRITE_BUFFER_FLUSH_INTERVAL_SEC,
+               max_pending: int = BATTLE_WRITE_BUFFER_MAX_PENDING,
+               submit_timeout_sec: float = BATTLE_WRITE_BUFFER_SUBMIT_TIMEOUT_SEC):
+    self.dao = dao
+    self.max_batch_size = max_batch_size
+    self.flush_interval_sec = flush_interval_sec
+    self.max_pending = max_pending
+    self.submit_timeout_sec = submit_timeout_sec
+    self._pending: List[Battle] = []
+    self._retry_ids: Set[ObjectId] = set()
+    self.flush_listeners: List[Callable[[List[Battle]], None]] = []
+    self._cond = Condition()
+    self._flush_lock = Lock()
+    self._closed = False
+    self._metrics = {
+      "submitted": 0,
+      "rejected": 0,
+      "flush_count": 0,
+      "failed_flush_count": 0,
+      "flushed_battles": 0,
+      "last_flush_size": 0,
+      "last_flush_latency_ms": 0.0,
+      "max_flush_latency_ms": 0.0,
+    }
+    self._thread = Thread(target=self._run, name="battle-write-buffer", daemon=True)
+    self._thread.start()
+    atexit.register(self.close)
+
+  def submit(self, battle: Battle) -> ObjectId:
+    if battle._id is None:
+      battle._id = ObjectId()
+    deadline = time.monotonic() + self.submit_timeout_sec
+    with self._cond:
+      if self._closed:
+        raise RuntimeError("Battle write buffer is closed.")
+      while len(self._pending) >= self.max_pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+          self._metrics["rejected"] += 1
+          raise ValueError("Too many votes are being processed. Please try again later.")
+        self._cond.wait(remaining)
+      self._pending.append(battle)
+      self._metrics["submitted"] += 1
+      if len(self._pending) >= self.max_batch_size:
+        self._cond.notify_all()
+    return battle._id
+
+  def last_pending(self) -> Optional[Battle]:
+    with self._cond:
+      return self._pending[-1] if self._pending else None
+
+  def pending_count(self) -> int:
+    with self._cond:
+      return len(self._pending)
+
+  def get_metrics(self) -> Dict[str, float]:
+    with self._cond:
+      metrics = dict(self._metrics)
+      metrics["pending"] = len(self._pending)
+      return metrics
+
+  def flush(self) -> int:
+    with self._flush_lock:
+      with self._cond:
+        batch = self._pending[:self.max_batch_size]
+        del self._pending[:len(batch)]
+      if not batch:
+        return 0
+
+      start = time.perf_counter()
+      try:
+        batch = self._restamp_retries(batch)
+        if not batch:
+          return 0
+        self.dao.insert_battles(batch)
+      except BulkWriteError as e:
+        # Battles already written by a failed earlier attempt come back as duplicate keys.
+        if any(err.get("code")!=DUPLICATE_KEY_ERROR for err in e.details.get("writeErrors", [])):
+          self._requeue(batch, e)
+          return 0
+      except Exception as e:
+        self._requeue(batch, e)
+        return 0
+      latency_ms = (time.perf_counter() - start) * 1000
+
+      with self._cond:
+        self._metrics["flush_count"] += 1
+        self._metrics["flushed_battles"] += len(batch)
+        self._metrics["last_flush_size"] = len(batch)
+        self._metrics["last_flush_latency_ms"] = latency_ms
+        self._metrics["max_flush_latency_ms"] = max(self._metrics["max_flush_latency_ms"], latency_ms)
+        self._cond.notify_all()
+      logging.debug(f"Flushed {len(batch)} battles in {latency_ms:.1f} ms")
+      for listener in list(self.flush_listeners):
+        try:
+          listener(batch)
+        except Exception as e:
+          logging.error(f"Battle flush listener failed: {e}")
+      return len(batch)
+
+  def _restamp_retries(self, batch: List[Battle]) -> List[Battle]:
+    """Drop retried battles that an earlier failed attempt did write; give the others a fresh _id and timestamp."""
+    with self._cond:
+      retry_ids = [b._id for b in batch if b._id in self._retry_ids]
+    if not retry_ids:
+      return batch
+    written = self.dao.find_existing_battle_ids(retry_ids)
+    now = datetime.utcnow()
+    with self._cond:
+      self._retry_ids.difference_update(retry_ids)
+    result = []
+    for battle in batch:
+      if battle._id in written:
+        continue
+      if battle._id in retry_ids:
+        battle._id = ObjectId()
+        battle.vote_timestamp = now
+      result.append(battle)
+    return result
+
+  def _requeue(self, batch: List[Battle], error: Exception) -> None:
+    logging.error(f"Error flushing battles: {error}")
+    with self._cond:
+      self._pending[:0] = batch
+      self._retry_ids.update(b._id for b in batch)
+      self._metrics["failed_flush_count"] += 1
+
+  def _run(self) -> None:
+    while True:
+      with self._cond:
+        self._cond.wait_for(lambda: self._closed or len(self._pending) >= self.max_batch_size,
+                            timeout=self.flush_interval_sec)
+        if self._closed:
+          return
+      while self.flush()==self.max_batch_size:
+        pass
+
+  def close(self) -> None:
+    with self._cond:
+      if self._closed:
+        return
+      self._closed = True
+      self._cond.notify_all()
+    self._thread.join()
+    while self.pending_count() > 0:
+      if self.flush()==0:
+        logging.error(f"Dropping {self.pending_count()} battles that could not be flushed on close.")
+        break
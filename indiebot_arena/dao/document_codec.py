@@ -0,0 +1,43 @@
+from dataclasses import fields
+from typing import Any, Dict, Generic, Iterable, List, Mapping, Type, TypeVar
+
+from indiebot_arena.model.domain_model import Model, Battle, LeaderboardEntry, RatingCheckpoint, RatingSnapshot
+
+T = TypeVar("T")
+
+
+class DocumentCodec(Generic[T]):
+  """
+  Maps a domain dataclass to and from a BSON document without dataclasses.asdict or **doc.
+  Field names are resolved once. encode is a shallow attribute copy that leaves out a None _id;
+  decode builds the object positionally and only falls back to keyword construction (so absent
+  fields take their defaults and unknown keys are ignored) when a field is missing.
+  """
+
+  def __init__(self, cls: Type[T]):
+    self.cls = cls
+    self.names = tuple(f.name for f in fields(cls))
+    self._names_without_id = tuple(name for name in self.names if name!="_id")
+
+  def encode(self, obj: T) -> Dict[str, Any]:
+    doc = {name: getattr(obj, name) for name in self._names_without_id}
+    object_id = getattr(obj, "_id", None)
+    if object_id is not None:
+      doc["_id"] = object_id
+    return doc
+
+  def decode(self, doc: Mapping[str, Any]) -> T:
+    try:
+      return self.cls(*[doc[name] for name in self.names])
+    except KeyError:
+      return self.cls(**{name: doc[name] for name in self.names if name in doc})
+
+  def decode_many(self, docs: Iterable[Mapping[str, Any]]) -> List[T]:
+    return [self.decode(doc) for doc in docs]
+
+
+MODEL_CODEC = DocumentCodec(Model)
+BATTLE_CODEC = DocumentCodec(Battle)
+LEADERBOARD_ENTRY_CODEC = DocumentCodec(LeaderboardEntry)
+RATING_CHECKPOINT_CODEC = DocumentCodec(RatingCheckpoint)
+RATING_SNAPSHOT_CODEC = DocumentCodec(RatingSnapshot)
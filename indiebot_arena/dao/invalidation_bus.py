@@ -0,0 +1,221 @@
+import logging
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+
+from indiebot_arena.config import INVALIDATION_POLL_INTERVAL_SEC
+from indiebot_arena.dao.mongo_dao import MongoDAO
+
+WATCHED_COLLECTIONS = ("models", "battles", "leaderboard")
+VERSIONS_COLLECTION = "invalidation_versions"
+# ChangeStreamHistoryLost, ChangeStreamFatalError: the stream can't be resumed from its token.
+UNRESUMABLE_ERROR_CODES = (280, 286)
+# Documents written by this process whose change events are still expected.
+MAX_OWN_WRITES = 10000
+
+
+@dataclass(frozen=True)
+class InvalidationEvent:
+  collection: str
+  language: Optional[str] = None      # None: anything in the collection may have changed
+  weight_class: Optional[str] = None
+
+
+Subscriber = Callable[[InvalidationEvent], None]
+
+
+def _version_key(collection: str, language: Optional[str], weight_class: Optional[str]) -> str:
+  return f"{collection}|{language or '*'}|{weight_class or '*'}"
+
+
+class InvalidationBus:
+  """
+  Tells every process that models, battles or leaderboard entries changed, so per-process caches can
+  be dropped instead of expiring on a timer.
+  mode "polling" (also what "auto" uses) makes every DAO write operation bump a version document per
+  (collection, division) in invalidation_versions, counted per process, and polls them.
+  mode "change_stream" watches the database instead (requires a replica set; only covered by the
+  replica set test in tests/test_invalidation_bus.py).
+  Events arriving together are coalesced. Writes of this process are not delivered: the code that
+  made them already updated this process's caches.
+  When a change stream has to be reopened without its resume token, every subscriber gets a
+  collection-wide event because changes may have been missed.
+  """
+
+  def __init__(self, dao: MongoDAO, mode: str = "auto", poll_interval_sec: float = INVALIDATION_POLL_INTERVAL_SEC):
+    if mode not in ("auto", "change_stream", "polling"):
+      raise ValueError("Mode must be 'auto', 'change_stream' or 'polling'.")
+    self.dao = dao
+    self.mode = mode
+    self.poll_interval_sec = poll_interval_sec
+    self.versions_collection = dao.db[VERSIONS_COLLECTION]
+    self.origin = uuid.uuid4().hex
+    self._subscribers: List[Tuple[Tuple[str, ...], Subscriber]] = []
+    self._seen_versions: Dict[str, int] = {}
+    self._polled = False
+    self._own_writes: "OrderedDict[Tuple[str, ObjectId], int]" = OrderedDict()
+    self._lock = Lock()
+    self._stop = Event()
+    self._thread: Optional[Thread] = None
+
+  # ---------- Subscribers ----------
+
+  def subscribe(self, collections: Iterable[str], callback: Subscriber) -> Callable[[], None]:
+    entry = (tuple(collections), callback)
+    with self._lock:
+      self._subscribers.append(entry)
+
+    def unsubscribe():
+      with self._lock:
+        if entry in self._subscribers:
+          self._subscribers.remove(entry)
+
+    return unsubscribe
+
+  def dispatch(self, events: Iterable[InvalidationEvent]) -> None:
+    events = list(dict.fromkeys(events))
+    # A collection-wide event makes the division events of the same collection redundant.
+    wide = {e.collection for e in events if e.language is None}
+    events = [e for e in events if e.language is None or e.collection not in wide]
+    with self._lock:
+      subscribers = list(self._subscribers)
+    for event in events:
+      for collections, callback in subscribers:
+        if event.collection not in collections:
+          continue
+        try:
+          callback(event)
+        except Exception as e:
+          logging.error(f"Invalidation subscriber failed for {event}: {e}")
+
+  # ---------- Lifecycle ----------
+
+  def resolve_mode(self) -> str:
+    return "polling" if self.mode=="auto" else self.mode
+
+  def start(self) -> str:
+    mode = self.resolve_mode()
+    if mode=="polling":
+      self.dao.write_listeners.append(self.bump_version)
+      self.poll_once()  # baseline
+      target = self._poll_loop
+    else:
+      self.dao.write_listeners.append(self.record_own_write)
+      target = self._watch_loop
+    self._thread = Thread(target=target, name=f"invalidation-{mode}", daemon=True)
+    self._thread.start()
+    logging.info(f"Invalidation bus started in {mode} mode.")
+    return mode
+
+  def stop(self) -> None:
+    self._stop.set()
+    for listener in (self.bump_version, self.record_own_write):
+      if listener in self.dao.write_listeners:
+        self.dao.write_listeners.remove(listener)
+    if self._thread:
+      self._thread.join(timeout=5)
+
+  # ---------- Change streams ----------
+
+  @staticmethod
+  def event_from_change(change: dict) -> InvalidationEvent:
+    document = change.get("fullDocument") or {}
+    return InvalidationEvent(change["ns"]["coll"], document.get("language"), document.get("weight_class"))
+
+  def record_own_write(self, collection: str, language: Optional[str], weight_class: Optional[str],
+                       ids: Sequence[ObjectId] = ()) -> None:
+    if collection not in WATCHED_COLLECTIONS:
+      return
+    with self._lock:
+      for document_id in ids:
+        key = (collection, document_id)
+        self._own_writes[key] = self._own_writes.pop(key, 0) + 1
+      while len(self._own_writes) > MAX_OWN_WRITES:
+        self._own_writes.popitem(last=False)
+
+  def is_own_change(self, change: dict) -> bool:
+    key = (change["ns"]["coll"], (change.get("documentKey") or {}).get("_id"))
+    with self._lock:
+      count = self._own_writes.get(key)
+      if not count:
+        return False
+      if count==1:
+        del self._own_writes[key]
+      else:
+        self._own_writes[key] = count - 1
+      return True
+
+  def _watch_loop(self) -> None:
+    pipeline = [
+      {"$match": {"ns.coll": {"$in": list(WATCHED_COLLECTIONS)}}},
+      {"$project": {"ns": 1, "operationType": 1, "documentKey": 1, "fullDocument.language": 1,
+                    "fullDocument.weight_class": 1}},
+    ]
+    resume_token = None
+    while not self._stop.is_set():
+      try:
+        with self.dao.db.watch(pipeline, resume_after=resume_token, max_await_time_ms=500) as stream:
+          while not self._stop.is_set():
+            events = []
+            change = stream.try_next()
+            while change is not None:
+              if not self.is_own_change(change):
+                events.append(self.event_from_change(change))
+              change = stream.try_next()
+            resume_token = stream.resume_token
+            if events:
+              self.dispatch(events)
+      except PyMongoError as e:
+        logging.error(f"Invalidation change stream failed, reopening: {e}")
+        if isinstance(e, OperationFailure) and e.code in UNRESUMABLE_ERROR_CODES:
+          resume_token = None
+          self.dispatch(InvalidationEvent(c) for c in WATCHED_COLLECTIONS)
+        self._stop.wait(1.0)
+
+  # ---------- Polling fallback ----------
+
+  def bump_version(self, collection: str, language: Optional[str], weight_class: Optional[str],
+                   ids: Sequence[ObjectId] = ()) -> None:
+    if collection not in WATCHED_COLLECTIONS:
+      return
+    # Runs after the write itself succeeded, so a failure must not reach the caller (a retry would write twice).
+    # Other processes still catch up on their next bump of this division or their cache TTL.
+    try:
+      self.versions_collection.update_one(
+        {"_id": _version_key(collection, language, weight_class)},
+        {"$inc": {f"versions.{self.origin}": 1},
+         "$set": {"collection": collection, "language": language, "weight_class": weight_class}},
+        upsert=True
+      )
+    except PyMongoError as e:
+      logging.error(f"Invalidation version bump failed for {collection} {language} {weight_class}: {e}")
+
+  def poll_once(self) -> List[InvalidationEvent]:
+    """
+    Read the version documents and return an event for every one that other processes bumped since the
+    last poll.
+    """
+    events = []
+    for doc in self.versions_collection.find():
+      version = sum(count for origin, count in doc.get("versions", {}).items() if origin!=self.origin)
+      if self._seen_versions.get(doc["_id"], 0)!=version:
+        self._seen_versions[doc["_id"]] = version
+        if self._polled:
+          events.append(InvalidationEvent(doc["collection"], doc.get("language"), doc.get("weight_class")))
+    self._polled = True
+    return events
+
+  def _poll_loop(self) -> None:
+    while not self._stop.wait(self.poll_interval_sec):
+      try:
+        events = self.poll_once()
+      except PyMongoError as e:
+        logging.error(f"Invalidation poll failed: {e}")
+        continue
+      if events:
+        self.dispatch(events)
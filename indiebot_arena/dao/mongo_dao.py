@@ -1,20 +1,62 @@
-from dataclasses import asdict
-from typing import List, Optional
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple
 
 from bson import ObjectId
 from pymongo import MongoClient
 
-from indiebot_arena.model.domain_model import Model, Battle, LeaderboardEntry
+from indiebot_arena.dao.document_codec import MODEL_CODEC, BATTLE_CODEC, LEADERBOARD_ENTRY_CODEC, \
+  RATING_CHECKPOINT_CODEC, RATING_SNAPSHOT_CODEC
+from indiebot_arena.model.domain_model import Model, Battle, LeaderboardEntry, RatingCheckpoint, ModelStats, \
+  HeadToHead, RatingSnapshot
+from indiebot_arena.util.tracing import mongo_event_listeners, trace_methods
 
 
+@trace_methods("dao")
 class MongoDAO:
   def __init__(self, uri: str, db_name: str):
-    self.client = MongoClient(uri)
+    self.client = MongoClient(uri, event_listeners=mongo_event_listeners())
     self.db = self.client[db_name]
     self.models_collection = self.db["models"]
     self.battles_collection = self.db["battles"]
     self.leaderboard_collection = self.db["leaderboard"]
+    self.rating_checkpoints_collection = self.db["rating_checkpoints"]
+    self.rating_history_collection = self.db["rating_history"]
+    # Called with (collection name, language, weight_class, written _ids) after writes to
+    # models/battles/leaderboard; language and weight_class are None when the write isn't known to touch
+    # a single division.
+    self.write_listeners: List[Callable[[str, Optional[str], Optional[str], Sequence[ObjectId]], None]] = []
+    self._write_batch = threading.local()
 
+  def _notify_write(self, collection: str, language: Optional[str] = None, weight_class: Optional[str] = None,
+                    ids: Sequence[ObjectId] = ()) -> None:
+    pending = getattr(self._write_batch, "pending", None)
+    if pending is not None:
+      pending[(collection, language, weight_class)].extend(ids)
+      return
+    for listener in self.write_listeners:
+      listener(collection, language, weight_class, ids)
+
+  @contextmanager
+  def write_batch(self):
+    """
+    Notify the write listeners once per (collection, division) when the block ends, instead of after
+    every write in it (e.g. the N entries written by one leaderboard update).
+    """
+    if getattr(self._write_batch, "pending", None) is not None:
+      yield
+      return
+    self._write_batch.pending = defaultdict(list)
+    try:
+      yield
+    finally:
+      pending, self._write_batch.pending = self._write_batch.pending, None
+      for (collection, language, weight_class), ids in pending.items():
+        self._notify_write(collection, language, weight_class, ids)
+
+  def create_indexes(self) -> None:
     self.models_collection.create_index(
       [("language", 1), ("weight_class", 1), ("model_name", 1)], unique=True
     )
@@ -24,31 +66,49 @@ class MongoDAO:
     self.battles_collection.create_index(
       [("language", 1), ("weight_class", 1), ("vote_timestamp", 1)]
     )
+    self.rating_checkpoints_collection.create_index(
+      [("language", 1), ("weight_class", 1), ("last_vote_timestamp", -1)]
+    )
+    self.rating_history_collection.create_index(
+      [("language", 1), ("weight_class", 1), ("timestamp", 1)]
+    )
+    self.rating_history_collection.create_index(
+      [("language", 1), ("weight_class", 1), ("resolution", 1), ("timestamp", 1)]
+    )
 
   # ---------- Model ----------
 
   def insert_model(self, model: Model) -> ObjectId:
-    data = asdict(model)
-    if data.get("_id") is None:
-      data.pop("_id")
+    data = MODEL_CODEC.encode(model)
     result = self.models_collection.insert_one(data)
+    self._notify_write("models", model.language, model.weight_class, [result.inserted_id])
     return result.inserted_id
 
   def get_model(self, model_id: ObjectId) -> Optional[Model]:
     data = self.models_collection.find_one({"_id": model_id})
     if data:
-      return Model(**data)
+      return MODEL_CODEC.decode(data)
     return None
 
   def update_model(self, model: Model) -> bool:
-    data = asdict(model)
-    if data.get("_id") is None:
+    if model._id is None:
       raise ValueError("model _id is required for updating.")
+    data = MODEL_CODEC.encode(model)
     result = self.models_collection.replace_one({"_id": data["_id"]}, data)
+    self._notify_write("models", model.language, model.weight_class, [model._id])
+    return result.modified_count > 0
+
+  def update_model_pin(self, model_id: ObjectId, revision: str, local_path: str) -> bool:
+    result = self.models_collection.update_one(
+      {"_id": model_id},
+      {"$set": {"revision": revision, "local_path": local_path}}
+    )
+    self._notify_write("models", ids=[model_id])
     return result.modified_count > 0
 
   def delete_model(self, model_id: ObjectId) -> bool:
     result = self.models_collection.delete_one({"_id": model_id})
+    self._notify_write("models", ids=[model_id])
     return result.deleted_count > 0
 
   def find_models(self, language: str, weight_class: str) -> List[Model]:
@@ -57,7 +117,10 @@ class MongoDAO:
       "weight_class": weight_class
     }
     cursor = self.models_collection.find(query).sort("_id", 1)
-    return [Model(**doc) for doc in cursor]
+    return MODEL_CODEC.decode_many(cursor)
+
+  def find_all_models(self) -> List[Model]:
+    return MODEL_CODEC.decode_many(self.models_collection.find().sort("_id", 1))
 
   def find_one_model(self, language: str, weight_class: str, model_name: str) -> Optional[Model]:
     query = {
@@ -67,33 +130,45 @@ class MongoDAO:
     }
     data = self.models_collection.find_one(query)
     if data:
-      return Model(**data)
+      return MODEL_CODEC.decode(data)
     return None
 
   # ---------- Battle ----------
 
   def insert_battle(self, battle: Battle) -> ObjectId:
-    data = asdict(battle)
-    if data.get("_id") is None:
-      data.pop("_id")
+    data = BATTLE_CODEC.encode(battle)
     result = self.battles_collection.insert_one(data)
+    self._notify_write("battles", battle.language, battle.weight_class, [result.inserted_id])
     return result.inserted_id
 
+  def insert_battles(self, battles: List[Battle]) -> List[ObjectId]:
+    docs = [BATTLE_CODEC.encode(battle) for battle in battles]
+    result = self.battles_collection.insert_many(docs, ordered=False)
+    with self.write_batch():
+      for battle, battle_id in zip(battles, result.inserted_ids):
+        self._notify_write("battles", battle.language, battle.weight_class, [battle_id])
+    return result.inserted_ids
+
+  def find_existing_battle_ids(self, battle_ids: List[ObjectId]) -> Set[ObjectId]:
+    return {doc["_id"] for doc in self.battles_collection.find({"_id": {"$in": battle_ids}}, {"_id": 1})}
+
   def get_battle(self, battle_id: ObjectId) -> Optional[Battle]:
     data = self.battles_collection.find_one({"_id": battle_id})
     if data:
-      return Battle(**data)
+      return BATTLE_CODEC.decode(data)
     return None
 
   def update_battle(self, battle: Battle) -> bool:
-    data = asdict(battle)
-    if data.get("_id") is None:
+    if battle._id is None:
       raise ValueError("battle _id is required for updating.")
+    data = BATTLE_CODEC.encode(battle)
     result = self.battles_collection.replace_one({"_id": data["_id"]}, data)
+    self._notify_write("battles", battle.language, battle.weight_class, [battle._id])
     return result.modified_count > 0
 
   def delete_battle(self, battle_id: ObjectId) -> bool:
     result = self.battles_collection.delete_one({"_id": battle_id})
+    self._notify_write("battles", ids=[battle_id])
     return result.deleted_count > 0
 
   def find_battles(self, language: str, weight_class: str) -> List[Battle]:
@@ -102,38 +177,167 @@ class MongoDAO:
       "weight_class": weight_class
     }
     cursor = self.battles_collection.find(query)
-    return [Battle(**doc) for doc in cursor]
+    return BATTLE_CODEC.decode_many(cursor)
+
+  def find_battles_after(
+      self,
+      language: str,
+      weight_class: str,
+      vote_timestamp: datetime,
+      battle_id: ObjectId
+  ) -> List[Battle]:
+    query = {
+      "language": language,
+      "weight_class": weight_class,
+      "$or": [
+        {"vote_timestamp": {"$gt": vote_timestamp}},
+        {"vote_timestamp": vote_timestamp, "_id": {"$gt": battle_id}},
+      ]
+    }
+    cursor = self.battles_collection.find(query).sort([("vote_timestamp", 1), ("_id", 1)])
+    return BATTLE_CODEC.decode_many(cursor)
+
+  def iter_battle_batches(
+      self,
+      after_id: Optional[ObjectId] = None,
+      batch_size: int = 10000
+  ) -> Iterator[List[Battle]]:
+    query = {"_id": {"$gt": after_id}} if after_id is not None else {}
+    cursor = self.battles_collection.find(query).sort("_id", 1).batch_size(batch_size)
+    batch = []
+    for doc in cursor:
+      batch.append(BATTLE_CODEC.decode(doc))
+      if len(batch) >= batch_size:
+        yield batch
+        batch = []
+    if batch:
+      yield batch
+
+  def iter_battle_rows(self, batch_size: int = 10000) -> Iterator[tuple]:
+    """
+    Stream every battle once as (language, weight_class, vote_timestamp, _id, model_a_id, model_b_id,
+    winner_model_id), fetching only the fields needed for a rating replay.
+    """
+    projection = {"language": 1, "weight_class": 1, "vote_timestamp": 1, "model_a_id": 1, "model_b_id": 1,
+                  "winner_model_id": 1}
+    cursor = self.battles_collection.find({}, projection).batch_size(batch_size)
+    for doc in cursor:
+      yield (doc["language"], doc["weight_class"], doc["vote_timestamp"], doc["_id"],
+             doc["model_a_id"], doc["model_b_id"], doc["winner_model_id"])
 
   def find_last_battle(self) -> Optional[Battle]:
     battle_doc = self.battles_collection.find_one(sort=[("_id", -1)])
     if battle_doc:
-      return Battle(**battle_doc)
+      return BATTLE_CODEC.decode(battle_doc)
     return None
 
+  def count_battles_by_model(self, language: str, weight_class: str) -> Dict[ObjectId, int]:
+    pipeline = [
+      {"$match": {"language": language, "weight_class": weight_class}},
+      {"$project": {"model_ids": ["$model_a_id", "$model_b_id"]}},
+      {"$unwind": "$model_ids"},
+      {"$group": {"_id": "$model_ids", "count": {"$sum": 1}}},
+    ]
+    return {doc["_id"]: doc["count"] for doc in self.battles_collection.aggregate(pipeline)}
+
+  def _battle_match_stage(self, language: str, weight_class: str, since: Optional[datetime]) -> dict:
+    query = {"language": language, "weight_class": weight_class}
+    if since is not None:
+      query["vote_timestamp"] = {"$gte": since}
+    return {"$match": query}
+
+  def aggregate_model_stats(
+      self,
+      language: str,
+      weight_class: str,
+      since: Optional[datetime] = None
+  ) -> List[ModelStats]:
+    def side(model_field, opponent_field):
+      return {
+        "model_id": model_field,
+        "win": {"$cond": [{"$eq": ["$winner_model_id", model_field]}, 1, 0]},
+        "loss": {"$cond": [{"$eq": ["$winner_model_id", opponent_field]}, 1, 0]},
+      }
+
+    pipeline = [
+      self._battle_match_stage(language, weight_class, since),
+      {"$project": {"sides": [side("$model_a_id", "$model_b_id"), side("$model_b_id", "$model_a_id")]}},
+      {"$unwind": "$sides"},
+      {"$group": {
+        "_id": "$sides.model_id",
+        "battles": {"$sum": 1},
+        "wins": {"$sum": "$sides.win"},
+        "losses": {"$sum": "$sides.loss"},
+      }},
+    ]
+    return [
+      ModelStats(
+        model_id=doc["_id"],
+        battles=doc["battles"],
+        wins=doc["wins"],
+        losses=doc["losses"],
+        draws=doc["battles"] - doc["wins"] - doc["losses"]
+      )
+      for doc in self.battles_collection.aggregate(pipeline)
+    ]
+
+  def aggregate_head_to_head(
+      self,
+      language: str,
+      weight_class: str,
+      since: Optional[datetime] = None
+  ) -> List[HeadToHead]:
+    a_is_lower = {"$lt": ["$model_a_id", "$model_b_id"]}
+    pipeline = [
+      self._battle_match_stage(language, weight_class, since),
+      {"$project": {
+        "lo": {"$cond": [a_is_lower, "$model_a_id", "$model_b_id"]},
+        "hi": {"$cond": [a_is_lower, "$model_b_id", "$model_a_id"]},
+        "winner_model_id": 1,
+      }},
+      {"$group": {
+        "_id": {"lo": "$lo", "hi": "$hi"},
+        "battles": {"$sum": 1},
+        "lo_wins": {"$sum": {"$cond": [{"$eq": ["$winner_model_id", "$lo"]}, 1, 0]}},
+        "hi_wins": {"$sum": {"$cond": [{"$eq": ["$winner_model_id", "$hi"]}, 1, 0]}},
+      }},
+    ]
+    return [
+      HeadToHead(
+        model_a_id=doc["_id"]["lo"],
+        model_b_id=doc["_id"]["hi"],
+        battles=doc["battles"],
+        a_wins=doc["lo_wins"],
+        b_wins=doc["hi_wins"]
+      )
+      for doc in self.battles_collection.aggregate(pipeline)
+    ]
+
   # ---------- LeaderboardEntry ----------
 
   def insert_leaderboard_entry(self, entry: LeaderboardEntry) -> ObjectId:
-    data = asdict(entry)
-    if data.get("_id") is None:
-      data.pop("_id")
+    data = LEADERBOARD_ENTRY_CODEC.encode(entry)
     result = self.leaderboard_collection.insert_one(data)
+    self._notify_write("leaderboard", entry.language, entry.weight_class, [result.inserted_id])
     return result.inserted_id
 
   def get_leaderboard_entry(self, entry_id: ObjectId) -> Optional[LeaderboardEntry]:
     data = self.leaderboard_collection.find_one({"_id": entry_id})
     if data:
-      return LeaderboardEntry(**data)
+      return LEADERBOARD_ENTRY_CODEC.decode(data)
     return None
 
   def update_leaderboard_entry(self, entry: LeaderboardEntry) -> bool:
-    data = asdict(entry)
-    if data.get("_id") is None:
+    if entry._id is None:
       raise ValueError("leaderboard _id is required for updating.")
+    data = LEADERBOARD_ENTRY_CODEC.encode(entry)
     result = self.leaderboard_collection.replace_one({"_id": data["_id"]}, data)
+    self._notify_write("leaderboard", entry.language, entry.weight_class, [entry._id])
     return result.modified_count > 0
 
   def delete_leaderboard_entry(self, entry_id: ObjectId) -> bool:
     result = self.leaderboard_collection.delete_one({"_id": entry_id})
+    self._notify_write("leaderboard", ids=[entry_id])
     return result.deleted_count > 0
 
   def find_leaderboard_entries(self, language: str, weight_class: str) -> List[LeaderboardEntry]:
@@ -142,7 +346,10 @@ class MongoDAO:
       "weight_class": weight_class
     }
     cursor = self.leaderboard_collection.find(query).sort("elo_score", -1)
-    return [LeaderboardEntry(**doc) for doc in cursor]
+    return LEADERBOARD_ENTRY_CODEC.decode_many(cursor)
+
+  def find_all_leaderboard_entries(self) -> List[LeaderboardEntry]:
+    return LEADERBOARD_ENTRY_CODEC.decode_many(self.leaderboard_collection.find().sort("_id", 1))
 
   def find_one_leaderboard_entry(self, language: str, weight_class: str, model_id: ObjectId) -> Optional[
     LeaderboardEntry]:
@@ -152,5 +359,92 @@ class MongoDAO:
       "model_id": model_id
     })
     if data:
-      return LeaderboardEntry(**data)
+      return LEADERBOARD_ENTRY_CODEC.decode(data)
+    return None
+
+  # ---------- RatingCheckpoint ----------
+
+  def insert_rating_checkpoint(self, checkpoint: RatingCheckpoint) -> ObjectId:
+    data = RATING_CHECKPOINT_CODEC.encode(checkpoint)
+    result = self.rating_checkpoints_collection.insert_one(data)
+    return result.inserted_id
+
+  def find_latest_rating_checkpoint(self, language: str, weight_class: str) -> Optional[RatingCheckpoint]:
+    data = self.rating_checkpoints_collection.find_one(
+      {"language": language, "weight_class": weight_class},
+      sort=[("last_vote_timestamp", -1), ("last_battle_id", -1)]
+    )
+    if data:
+      return RATING_CHECKPOINT_CODEC.decode(data)
     return None
+
+  def delete_old_rating_checkpoints(self, language: str, weight_class: str, keep: int) -> int:
+    cursor = self.rating_checkpoints_collection.find(
+      {"language": language, "weight_class": weight_class}, {"_id": 1}
+    ).sort([("last_vote_timestamp", -1), ("last_battle_id", -1)]).skip(keep)
+    old_ids = [doc["_id"] for doc in cursor]
+    if not old_ids:
+      return 0
+    result = self.rating_checkpoints_collection.delete_many({"_id": {"$in": old_ids}})
+    return result.deleted_count
+
+  # ---------- RatingSnapshot ----------
+
+  def insert_rating_snapshot(self, snapshot: RatingSnapshot) -> ObjectId:
+    data = RATING_SNAPSHOT_CODEC.encode(snapshot)
+    result = self.rating_history_collection.insert_one(data)
+    return result.inserted_id
+
+  def insert_rating_snapshots(self, snapshots: List[RatingSnapshot]) -> List[ObjectId]:
+    if not snapshots:
+      return []
+    result = self.rating_history_collection.insert_many([RATING_SNAPSHOT_CODEC.encode(s) for s in snapshots])
+    return result.inserted_ids
+
+  def _rating_history_query(
+      self,
+      language: str,
+      weight_class: str,
+      since: Optional[datetime],
+      until: Optional[datetime]
+  ) -> dict:
+    query = {"language": language, "weight_class": weight_class}
+    if since is not None or until is not None:
+      query["timestamp"] = {}
+      if since is not None:
+        query["timestamp"]["$gte"] = since
+      if until is not None:
+        query["timestamp"]["$lt"] = until
+    return query
+
+  def find_rating_snapshots(
+      self,
+      language: str,
+      weight_class: str,
+      since: Optional[datetime] = None,
+      until: Optional[datetime] = None,
+      resolution: Optional[str] = None
+  ) -> List[RatingSnapshot]:
+    query = self._rating_history_query(language, weight_class, since, until)
+    if resolution is not None:
+      query["resolution"] = resolution
+    return RATING_SNAPSHOT_CODEC.decode_many(self.rating_history_collection.find(query).sort("timestamp", 1))
+
+  def find_model_rating_history(
+      self,
+      language: str,
+      weight_class: str,
+      model_id: ObjectId,
+      since: Optional[datetime] = None
+  ) -> List[Tuple[datetime, int]]:
+    key = f"ratings.{model_id}"
+    query = self._rating_history_query(language, weight_class, since, None)
+    query[key] = {"$exists": True}
+    cursor = self.rating_history_collection.find(query, {"_id": 0, "timestamp": 1, key: 1}).sort("timestamp", 1)
+    return [(doc["timestamp"], doc["ratings"][str(model_id)]) for doc in cursor]
+
+  def delete_rating_snapshots(self, snapshot_ids: List[ObjectId]) -> int:
+    if not snapshot_ids:
+      return 0
+    result = self.rating_history_collection.delete_many({"_id": {"$in": snapshot_ids}})
+    return result.deleted_count
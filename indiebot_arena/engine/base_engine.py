@@ -0,0 +1,156 @@
+import itertools
+from collections import OrderedDict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from threading import Lock, local
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from indiebot_arena.config import MAX_RESIDENT_MODELS
+
+
+class BaseEngine:
+  """
+  Common interface for inference runtimes.
+  Each engine handles one Model.runtime value and streams the cumulative response text.
+  Models passed to preload() stay resident in memory (LRU, up to max_resident_models);
+  any other model is loaded per request.
+  A pinned model is loaded from its local snapshot only, without contacting the Hub.
+  Warnings for the user go through warn(), so generation workers can send them back to the app process.
+  """
+  runtime: str = ""
+  file_formats: Tuple[str, ...] = ()
+  quantizations: Tuple[str, ...] = ()
+
+  def __init__(self, max_resident_models: int = MAX_RESIDENT_MODELS):
+    self.max_resident_models = max_resident_models
+    self._resident: "OrderedDict[str, Any]" = OrderedDict()
+    self._borrowed: Dict[str, Any] = {}
+    self._borrow_ids = itertools.count(1)
+    self._pins: Dict[str, str] = {}
+    self._load_locks: Dict[str, Lock] = {}
+    self._warning_handler = local()
+    self._lock = Lock()
+
+  def validate_registration(self, quantization: str, file_format: str) -> None:
+    if file_format not in self.file_formats:
+      raise ValueError(f"File format for runtime '{self.runtime}' must be one of {', '.join(self.file_formats)}.")
+    if quantization not in self.quantizations:
+      raise ValueError(f"Quantization for runtime '{self.runtime}' must be one of {', '.join(self.quantizations)}.")
+
+  # ---------- Model loading ----------
+
+  def prefetch(self, model_id: str) -> None:
+    """Make sure the weights are in the local Hugging Face cache without loading them."""
+    raise NotImplementedError
+
+  def snapshot(self, model_id: str, revision: str) -> str:
+    """Download `revision` of the model into the local cache and return the path to load it from."""
+    raise NotImplementedError
+
+  def pin(self, model_id: str, local_path: str) -> bool:
+    """
+    Load model_id from local_path from now on. Returns True if a resident copy of another snapshot was evicted.
+    """
+    with self._lock:
+      if self._pins.get(model_id)==local_path:
+        return False
+      self._pins[model_id] = local_path
+      if model_id not in self._resident:
+        return False
+      del self._resident[model_id]
+      return True
+
+  def pinned_path(self, model_id: str) -> Optional[str]:
+    with self._lock:
+      return self._pins.get(model_id)
+
+  def load_model(self, model_id: str, local_path: Optional[str] = None) -> Any:
+    """Load model_id from local_path, or from its pinned snapshot, or from the Hub. Doesn't make it resident."""
+    raise NotImplementedError
+
+  def _keyed_lock(self, locks: Dict[str, Lock], key: str) -> Lock:
+    with self._lock:
+      return locks.setdefault(key, Lock())
+
+  def preload(self, model_id: str) -> None:
+    # Concurrent preloads of one model wait for the first load instead of loading it again.
+    with self._keyed_lock(self._load_locks, model_id):
+      with self._lock:
+        if model_id in self._resident:
+          self._resident.move_to_end(model_id)
+          return
+      loaded = self.load_model(model_id)
+      with self._lock:
+        self._resident[model_id] = loaded
+        while len(self._resident) > self.max_resident_models:
+          self._resident.popitem(last=False)
+
+  def unload(self, model_id: str) -> bool:
+    """Drop a resident model; returns False if it wasn't resident."""
+    with self._lock:
+      if model_id not in self._resident:
+        return False
+      del self._resident[model_id]
+      return True
+
+  @contextmanager
+  def using_model(self, model_id: str, loaded: Any) -> Iterator[str]:
+    """
+    Serve an already loaded copy of model_id inside the block, without adding it to the resident LRU.
+    Yields the name to pass to generate(). The name is unique to the block, so normal traffic for model_id
+    and other blocks (e.g. a check of another revision) never get this copy.
+    """
+    key = f"{model_id}#borrowed-{next(self._borrow_ids)}"
+    with self._lock:
+      self._borrowed[key] = loaded
+    try:
+      yield key
+    finally:
+      with self._lock:
+        self._borrowed.pop(key, None)
+
+  def get_model(self, model_id: str) -> Any:
+    with self._lock:
+      if model_id in self._borrowed:
+        return self._borrowed[model_id]
+      if model_id in self._resident:
+        self._resident.move_to_end(model_id)
+        return self._resident[model_id]
+    return self.load_model(model_id)
+
+  def resident_models(self) -> List[str]:
+    with self._lock:
+      return list(self._resident.keys())
+
+  # ---------- Warnings ----------
+
+  def warn(self, message: str) -> None:
+    """Show a warning to the user of the current request."""
+    handler = getattr(self._warning_handler, "handler", None)
+    if handler is not None:
+      handler(message)
+      return
+    import gradio as gr
+
+    gr.Warning(message)
+
+  @contextmanager
+  def redirect_warnings(self, handler: Callable[[str], None]):
+    """Pass warn() calls made on this thread inside the block to handler instead of Gradio."""
+    self._warning_handler.handler = handler
+    try:
+      yield
+    finally:
+      self._warning_handler.handler = None
+
+  # ---------- Generation ----------
+
+  def generate(self,
+               chat_history: list,
+               model_id: str,
+               max_new_tokens: int,
+               temperature: float,
+               top_p: float,
+               top_k: int,
+               repetition_penalty: float) -> Iterator[str]:
+    raise NotImplementedError
@@ -0,0 +1,47 @@
+from typing import Dict, List, Optional, Type
+
+from indiebot_arena.config import GENERATION_BACKEND
+from indiebot_arena.engine.base_engine import BaseEngine
+from indiebot_arena.engine.fake_engine import FakeEngine
+from indiebot_arena.engine.llama_cpp_engine import LlamaCppEngine
+from indiebot_arena.engine.transformers_engine import TransformersEngine
+
+_engine_classes: Dict[str, Type[BaseEngine]] = {}
+_engines: Dict[str, BaseEngine] = {}
+_override_engine: Optional[BaseEngine] = None
+
+
+def register_engine(engine_class: Type[BaseEngine]) -> None:
+  if not engine_class.runtime:
+    raise ValueError("Engine runtime cannot be empty.")
+  _engine_classes[engine_class.runtime] = engine_class
+  _engines.pop(engine_class.runtime, None)
+
+
+def available_runtimes() -> List[str]:
+  return list(_engine_classes.keys())
+
+
+def set_engine_override(engine: Optional[BaseEngine]) -> None:
+  """
+  Serve every runtime with `engine` (e.g. a FakeEngine for replay and load tests); None restores the normal lookup.
+  """
+  global _override_engine
+  _override_engine = engine
+
+
+def get_engine(runtime: str) -> BaseEngine:
+  if _override_engine is not None:
+    return _override_engine
+  if runtime not in _engine_classes:
+    raise ValueError(f"Runtime must be one of {', '.join(available_runtimes())}.")
+  if runtime not in _engines:
+    _engines[runtime] = _engine_classes[runtime]()
+  return _engines[runtime]
+
+
+register_engine(TransformersEngine)
+register_engine(LlamaCppEngine)
+
+if GENERATION_BACKEND=="fake":
+  set_engine_override(FakeEngine())
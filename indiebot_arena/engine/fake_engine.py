@@ -0,0 +1,74 @@
+import hashlib
+import random
+import time
+from collections.abc import Iterator
+from typing import Optional
+
+from indiebot_arena.config import MAX_INPUT_TOKEN_LENGTH, FAKE_ENGINE_TOKENS_PER_SEC, \
+  FAKE_ENGINE_FIRST_TOKEN_LATENCY_SEC, FAKE_ENGINE_JITTER, FAKE_ENGINE_MAX_NEW_TOKENS
+from indiebot_arena.engine.base_engine import BaseEngine
+
+WORDS = ("arena", "model", "token", "battle", "vote", "answer", "japan", "tokyo", "weight", "class", "stream", "reply")
+
+
+class FakeEngine(BaseEngine):
+  """
+  Deterministic stand-in for a real runtime, for replay and load tests without weights or a GPU.
+  The response depends only on the model id and the conversation, and is streamed after
+  first_token_latency_sec at tokens_per_sec. With jitter > 0 every delay is scaled by a random
+  factor in [1 - jitter, 1 + jitter]; the text stays deterministic.
+  """
+  runtime = "fake"
+
+  def __init__(self,
+               tokens_per_sec: float = FAKE_ENGINE_TOKENS_PER_SEC,
+               first_token_latency_sec: float = FAKE_ENGINE_FIRST_TOKEN_LATENCY_SEC,
+               max_new_tokens: int = FAKE_ENGINE_MAX_NEW_TOKENS,
+               jitter: float = FAKE_ENGINE_JITTER):
+    super().__init__()
+    self.tokens_per_sec = tokens_per_sec
+    self.first_token_latency_sec = first_token_latency_sec
+    self.max_new_tokens = max_new_tokens
+    self.jitter = jitter
+    self._timing_rng = random.Random()
+
+  def validate_registration(self, quantization: str, file_format: str) -> None:
+    pass
+
+  def prefetch(self, model_id: str) -> None:
+    pass
+
+  def snapshot(self, model_id: str, revision: str) -> str:
+    return ""
+
+  def load_model(self, model_id: str, local_path: Optional[str] = None):
+    return None
+
+  def _sleep(self, seconds: float) -> None:
+    if self.jitter > 0:
+      seconds *= self._timing_rng.uniform(1 - self.jitter, 1 + self.jitter)
+    if seconds > 0:
+      time.sleep(seconds)
+
+  def generate(self,
+               chat_history: list,
+               model_id: str,
+               max_new_tokens: int,
+               temperature: float,
+               top_p: float,
+               top_k: int,
+               repetition_penalty: float) -> Iterator[str]:
+    seed_text = model_id + "\n" + "\n".join(f"{m['role']}:{m['content']}" for m in chat_history)
+    rng = random.Random(hashlib.sha256(seed_text.encode("utf-8")).hexdigest())
+    # Words stand in for tokens, so long conversations warn like the real engines do.
+    if sum(len(m["content"].split()) for m in chat_history) > MAX_INPUT_TOKEN_LENGTH:
+      self.warn(f"Trimmed input from conversation as it was longer than {MAX_INPUT_TOKEN_LENGTH} tokens.")
+    n_tokens = min(max_new_tokens, self.max_new_tokens)
+
+    self._sleep(self.first_token_latency_sec)
+    outputs = []
+    for i in range(n_tokens):
+      if i > 0 and self.tokens_per_sec > 0:
+        self._sleep(1 / self.tokens_per_sec)
+      outputs.append(rng.choice(WORDS) + " ")
+      yield "".join(outputs)
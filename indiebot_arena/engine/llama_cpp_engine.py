@@ -0,0 +1,153 @@
+import fnmatch
+import re
+from collections.abc import Iterator
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Tuple
+
+from indiebot_arena.config import MAX_INPUT_TOKEN_LENGTH, MAX_NEW_TOKENS, LLAMA_CPP_GGUF_PATTERN, LLAMA_CPP_N_THREADS, \
+  LLAMA_CPP_N_GPU_LAYERS
+from indiebot_arena.engine.base_engine import BaseEngine
+
+# Quantization types recognised in GGUF file names. Registration accepts exactly what detection can return.
+GGUF_QUANTIZATION_BITS = "2345678"
+GGUF_QUANTIZATION_PATTERN = re.compile(
+  rf"(q[{GGUF_QUANTIZATION_BITS}]_k_[sml]|q[{GGUF_QUANTIZATION_BITS}]_k|q[{GGUF_QUANTIZATION_BITS}]_[01]|bf16|f16)"
+)
+GGUF_QUANTIZATIONS = tuple(
+  f"q{bits}{suffix}" for bits in GGUF_QUANTIZATION_BITS for suffix in ("_k_s", "_k_m", "_k_l", "_k", "_0", "_1")
+) + ("bf16", "f16")
+
+
+def detect_gguf_quantization(file_name: str) -> str:
+  match = GGUF_QUANTIZATION_PATTERN.search(file_name.lower())
+  return match.group(1) if match else "unknown"
+
+
+def trim_chat_history(messages: list, count_tokens: Callable[[list], int], max_tokens: int) -> Tuple[List[dict], bool]:
+  """
+  Drop the oldest user/assistant exchanges until count_tokens(messages) fits, keeping at least the latest
+  message. The result always starts with a user turn, which most chat templates require.
+  """
+  messages = list(messages)
+  trimmed = False
+  while len(messages) > 1 and count_tokens(messages) > max_tokens:
+    messages = messages[2:] if len(messages) > 2 else messages[1:]
+    while len(messages) > 1 and messages[0]["role"]!="user":
+      messages = messages[1:]
+    trimmed = True
+  return messages, trimmed
+
+
+def select_gguf_file(model_id: str, pattern: str = LLAMA_CPP_GGUF_PATTERN, revision: Optional[str] = None) -> str:
+  from huggingface_hub import list_repo_files
+
+  gguf_files = [f for f in list_repo_files(model_id, revision=revision) if f.endswith(".gguf")]
+  if not gguf_files:
+    raise ValueError(f"No GGUF file found in {model_id}.")
+  if len(gguf_files)==1:
+    return gguf_files[0]
+  matched = sorted(f for f in gguf_files if fnmatch.fnmatch(f, pattern))
+  if not matched:
+    raise ValueError(f"No GGUF file in {model_id} matches '{pattern}'.")
+  return matched[0]
+
+
+class LlamaCppEngine(BaseEngine):
+  runtime = "llama.cpp"
+  file_formats = ("gguf",)
+  quantizations = GGUF_QUANTIZATIONS + ("none",)
+
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self._gguf_files: Dict[str, str] = {}
+    # A llama.cpp context is not thread-safe, so requests for one model take turns on it.
+    self._generation_locks: Dict[str, Lock] = {}
+
+  def _gguf_file(self, model_id: str) -> str:
+    """The GGUF file of an unpinned model, looked up on the Hub once per process."""
+    with self._lock:
+      file_name = self._gguf_files.get(model_id)
+    if file_name is None:
+      file_name = select_gguf_file(model_id)
+      with self._lock:
+        self._gguf_files[model_id] = file_name
+    return file_name
+
+  def prefetch(self, model_id: str) -> None:
+    from huggingface_hub import hf_hub_download
+
+    if self.pinned_path(model_id):
+      return
+    hf_hub_download(model_id, self._gguf_file(model_id))
+
+  def snapshot(self, model_id: str, revision: str) -> str:
+    from huggingface_hub import hf_hub_download
+
+    return hf_hub_download(model_id, select_gguf_file(model_id, revision=revision), revision=revision)
+
+  def load_model(self, model_id: str, local_path: Optional[str] = None):
+    from llama_cpp import Llama
+
+    params = dict(
+      n_ctx=MAX_INPUT_TOKEN_LENGTH + MAX_NEW_TOKENS,
+      n_threads=LLAMA_CPP_N_THREADS or None,
+      n_gpu_layers=LLAMA_CPP_N_GPU_LAYERS,
+      verbose=False
+    )
+    local_path = local_path or self.pinned_path(model_id)
+    if local_path:
+      return Llama(model_path=local_path, **params)
+    return Llama.from_pretrained(repo_id=model_id, filename=self._gguf_file(model_id), **params)
+
+  def generate(self,
+               chat_history: list,
+               model_id: str,
+               max_new_tokens: int,
+               temperature: float,
+               top_p: float,
+               top_k: int,
+               repetition_penalty: float) -> Iterator[str]:
+    llm = self.get_model(model_id)
+    with self._keyed_lock(self._generation_locks, model_id):
+      yield from self._generate(llm, chat_history, max_new_tokens, temperature, top_p, top_k, repetition_penalty)
+
+  def _generate(self, llm, chat_history: list, max_new_tokens: int, temperature: float, top_p: float, top_k: int,
+                repetition_penalty: float) -> Iterator[str]:
+    messages, trimmed = trim_chat_history(chat_history, lambda m: self._count_tokens(llm, m), MAX_INPUT_TOKEN_LENGTH)
+    if trimmed:
+      self.warn(f"Trimmed input from conversation as it was longer than {MAX_INPUT_TOKEN_LENGTH} tokens.")
+
+    stream = llm.create_chat_completion(
+      messages=messages,
+      max_tokens=max_new_tokens,
+      temperature=temperature,
+      top_p=top_p,
+      top_k=top_k,
+      repeat_penalty=repetition_penalty,
+      stream=True
+    )
+    outputs = []
+    for chunk in stream:
+      text = chunk["choices"][0]["delta"].get("content")
+      if text:
+        outputs.append(text)
+        yield "".join(outputs)
+
+  @staticmethod
+  def _render_prompt(llm, messages: list) -> str:
+    """The prompt create_chat_completion sends for messages, using the model's own chat template if it has one."""
+    template = (getattr(llm, "metadata", None) or {}).get("tokenizer.chat_template")
+    if not template:
+      return "\n".join(m["content"] for m in messages)
+    from llama_cpp.llama_chat_format import Jinja2ChatFormatter
+
+    def token_text(token: int) -> str:
+      return llm.detokenize([token]).decode("utf-8", errors="ignore")
+
+    formatter = Jinja2ChatFormatter(template, eos_token=token_text(llm.token_eos()), bos_token=token_text(llm.token_bos()))
+    return formatter(messages=messages).prompt
+
+  @classmethod
+  def _count_tokens(cls, llm, messages: list) -> int:
+    prompt = cls._render_prompt(llm, messages)
+    return len(llm.tokenize(prompt.encode("utf-8"), add_bos=False, special=True))
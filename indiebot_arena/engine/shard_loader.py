@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from indiebot_arena.config import SHARD_LOADER_WORKERS
+
+SAFETENSORS_INDEX = "model.safetensors.index.json"
+SAFETENSORS_SINGLE = "model.safetensors"
+# Share of the free GPU memory the weights may take; the rest is left for activations and the KV cache.
+DEVICE_MEMORY_FRACTION = 0.8
+
+
+@dataclass
+class ShardTiming:
+  file_name: str
+  tensors: int
+  bytes: int
+  seconds: float
+
+
+@dataclass
+class LoadReport:
+  model_path: str
+  device: str
+  shards: List[ShardTiming] = field(default_factory=list)
+  build_sec: float = 0.0
+  total_sec: float = 0.0
+
+  def format(self) -> str:
+    lines = [f"Loaded {self.model_path} on {self.device} in {self.total_sec:.2f}s (build {self.build_sec:.2f}s)"]
+    for shard in self.shards:
+      mb = shard.bytes / (1024 ** 2)
+      rate = mb / shard.seconds if shard.seconds > 0 else 0.0
+      lines.append(f"  {shard.file_name}: {shard.tensors} tensors, {mb:.0f} MB in {shard.seconds:.2f}s ({rate:.0f} MB/s)")
+    return "\n".join(lines)
+
+
+def find_shards(model_path: str) -> List[str]:
+  """Safetensors files of a local checkpoint directory, in index order; empty if there are none."""
+  index_path = os.path.join(model_path, SAFETENSORS_INDEX)
+  if os.path.exists(index_path):
+    with open(index_path, encoding="utf-8") as f:
+      weight_map = json.load(f)["weight_map"]
+    return sorted(set(weight_map.values()))
+  if os.path.exists(os.path.join(model_path, SAFETENSORS_SINGLE)):
+    return [SAFETENSORS_SINGLE]
+  return []
+
+
+def checkpoint_bytes(model_path: str) -> int:
+  return sum(os.path.getsize(os.path.join(model_path, name)) for name in find_shards(model_path))
+
+
+def device_memory_budget(device: str) -> Optional[int]:
+  """Bytes of weights that fit on device, or None if it isn't a GPU."""
+  import torch
+
+  if not device.startswith("cuda"):
+    return None
+  free, _ = torch.cuda.mem_get_info(torch.device(device))
+  return int(free * DEVICE_MEMORY_FRACTION)
+
+
+def _load_shard(model_path: str, file_name: str, dtype, device: str) -> Tuple[Dict[str, Any], ShardTiming]:
+  import torch
+  from safetensors import safe_open
+
+  start = time.perf_counter()
+  tensors = {}
+  size = 0
+  # The file is memory-mapped; each tensor is copied straight into its final dtype and device,
+  # so at most one extra tensor per worker is held on the host.
+  with safe_open(os.path.join(model_path, file_name), framework="pt", device=device) as f:
+    for name in f.keys():
+      tensor = f.get_tensor(name)
+      if tensor.is_floating_point() and tensor.dtype!=dtype:
+        tensor = tensor.to(dtype)
+      tensors[name] = tensor
+      size += tensor.numel() * tensor.element_size()
+  if device.startswith("cuda"):
+    torch.cuda.synchronize()
+  return tensors, ShardTiming(file_name, len(tensors), size, round(time.perf_counter() - start, 3))
+
+
+def load_state_dict(model_path: str, dtype, device: str = "cpu",
+                    max_workers: int = SHARD_LOADER_WORKERS) -> Tuple[Dict[str, Any], List[ShardTiming]]:
+  shards = find_shards(model_path)
+  if not shards:
+    raise ValueError(f"No safetensors weights found in {model_path}.")
+  state_dict = {}
+  timings = []
+  with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(shards)))) as executor:
+    for tensors, timing in executor.map(lambda name: _load_shard(model_path, name, dtype, device), shards):
+      state_dict.update(tensors)
+      timings.append(timing)
+  return state_dict, timings
+
+
+def load_causal_lm(model_path: str, dtype, device: Optional[str] = None, max_workers: int = SHARD_LOADER_WORKERS,
+                   max_bytes: Optional[int] = None) -> Optional[Tuple[Any, LoadReport]]:
+  """
+  Build an AutoModelForCausalLM from a local safetensors checkpoint by reading its shards in parallel.
+  The model skeleton is created without allocating weights and the loaded tensors are assigned to it.
+  All weights go to one device, so the checkpoint must fit in max_bytes (default: a share of the free
+  GPU memory, unlimited on CPU).
+  Returns the model with the LoadReport of this load, or None when the checkpoint can't be loaded this
+  way (quantized, no safetensors, too large for the device, or checkpoint keys that don't match the
+  model), in which case the caller falls back to from_pretrained with device_map="auto".
+  """
+  import torch
+  from accelerate import init_empty_weights
+  from transformers import AutoConfig, AutoModelForCausalLM, GenerationConfig
+
+  if not os.path.isdir(model_path) or not find_shards(model_path):
+    return None
+  config = AutoConfig.from_pretrained(model_path, local_files_only=True)
+  if getattr(config, "quantization_config", None):
+    return None
+  device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+  max_bytes = device_memory_budget(device) if max_bytes is None else max_bytes
+  size = checkpoint_bytes(model_path)
+  if max_bytes is not None and size > max_bytes:
+    logging.info(f"{model_path} ({size / 1024 ** 3:.1f} GB) doesn't fit on {device} "
+                 f"({max_bytes / 1024 ** 3:.1f} GB available)")
+    return None
+  report = LoadReport(model_path=model_path, device=device)
+
+  start = time.perf_counter()
+  state_dict, report.shards = load_state_dict(model_path, dtype, device, max_workers)
+  build_start = time.perf_counter()
+  with init_empty_weights(include_buffers=False):
+    model = AutoModelForCausalLM.from_config(config, torch_dtype=dtype)
+  result = model.load_state_dict(state_dict, strict=False, assign=True)
+  del state_dict
+  model.tie_weights()
+  if result.unexpected_keys or any(p.is_meta for p in model.parameters()):
+    logging.warning(f"Checkpoint keys of {model_path} don't match {type(model).__name__}; "
+                    f"missing={result.missing_keys[:5]} unexpected={result.unexpected_keys[:5]}")
+    return None
+  if os.path.exists(os.path.join(model_path, "generation_config.json")):
+    model.generation_config = GenerationConfig.from_pretrained(model_path, local_files_only=True)
+  model.to(device)
+  report.build_sec = round(time.perf_counter() - build_start, 3)
+  report.total_sec = round(time.perf_counter() - start, 3)
+  return model, report
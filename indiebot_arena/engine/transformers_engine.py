@@ -0,0 +1,98 @@
+import logging
+from collections.abc import Iterator
+from threading import Thread
+from typing import Optional
+
+from indiebot_arena.config import MAX_INPUT_TOKEN_LENGTH, SHARD_LOADER_ENABLED
+from indiebot_arena.engine.base_engine import BaseEngine
+from indiebot_arena.engine.shard_loader import load_causal_lm
+
+SNAPSHOT_PATTERNS = ["*.json", "*.safetensors", "*.model", "*.txt"]
+
+
+class TransformersEngine(BaseEngine):
+  runtime = "transformers"
+  file_formats = ("safetensors",)
+  quantizations = ("bnb", "none")
+
+  def prefetch(self, model_id: str) -> None:
+    from huggingface_hub import snapshot_download
+
+    if self.pinned_path(model_id):
+      return
+    snapshot_download(model_id, allow_patterns=SNAPSHOT_PATTERNS)
+
+  def snapshot(self, model_id: str, revision: str) -> str:
+    from huggingface_hub import snapshot_download
+
+    return snapshot_download(model_id, revision=revision, allow_patterns=SNAPSHOT_PATTERNS)
+
+  def _snapshot_path(self, model_id: str) -> str:
+    from huggingface_hub import snapshot_download
+
+    return snapshot_download(model_id, allow_patterns=SNAPSHOT_PATTERNS)
+
+  def load_model(self, model_id: str, local_path: Optional[str] = None):
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    local_path = local_path or self.pinned_path(model_id)
+    source = local_path or model_id
+    tokenizer = AutoTokenizer.from_pretrained(source, local_files_only=local_path is not None)
+    loaded = None
+    if SHARD_LOADER_ENABLED and torch.cuda.is_available():
+      # On CPU from_pretrained already maps bf16 shards without copying, so only GPU loads use the shard loader.
+      # Quantized, non-standard or too large checkpoints return None and go through from_pretrained,
+      # which can spread the model over GPU and CPU.
+      loaded = load_causal_lm(local_path or self._snapshot_path(model_id), torch.bfloat16)
+    if loaded:
+      model, report = loaded
+      logging.info(report.format())
+    else:
+      model = AutoModelForCausalLM.from_pretrained(
+        source,
+        device_map="auto",
+        torch_dtype=torch.bfloat16,
+        use_safetensors=True,
+        local_files_only=local_path is not None
+      )
+    model.eval()
+    return tokenizer, model
+
+  def generate(self,
+               chat_history: list,
+               model_id: str,
+               max_new_tokens: int,
+               temperature: float,
+               top_p: float,
+               top_k: int,
+               repetition_penalty: float) -> Iterator[str]:
+    from transformers import TextIteratorStreamer
+
+    tokenizer, model = self.get_model(model_id)
+
+    input_ids = tokenizer.apply_chat_template(chat_history, add_generation_prompt=True, return_tensors="pt")
+    if input_ids.shape[1] > MAX_INPUT_TOKEN_LENGTH:
+      input_ids = input_ids[:, -MAX_INPUT_TOKEN_LENGTH:]
+      self.warn(f"Trimmed input from conversation as it was longer than {MAX_INPUT_TOKEN_LENGTH} tokens.")
+    input_ids = input_ids.to(model.device)
+
+    streamer = TextIteratorStreamer(tokenizer, timeout=20.0, skip_prompt=True, skip_special_tokens=True)
+    generate_kwargs = dict(
+      {"input_ids": input_ids},
+      streamer=streamer,
+      max_new_tokens=max_new_tokens,
+      do_sample=True,
+      top_p=top_p,
+      top_k=top_k,
+      temperature=temperature,
+      num_beams=1,
+      repetition_penalty=repetition_penalty,
+    )
+    t = Thread(target=model.generate, kwargs=generate_kwargs)
+    t.start()
+
+    outputs = []
+    for text in streamer:
+      outputs.append(text)
+      yield "".join(outputs)
@@ -0,0 +1,432 @@
+import gc
+import logging
+import os
+import queue
+import subprocess
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Iterator
+from dataclasses import dataclass
+from multiprocessing import Pipe
+from multiprocessing.connection import Connection
+from threading import Event, Lock, Thread
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from indiebot_arena.config import GENERATION_WORKERS, GENERATION_WORKER_MEMORY_GB, \
+  GENERATION_WORKER_HEALTH_INTERVAL_SEC, GENERATION_WORKER_HEALTH_TIMEOUT_SEC
+from indiebot_arena.engine.engine_registry import get_engine
+
+# Messages in both directions are (kind, request_id, payload) tuples.
+# pool -> worker: generate, preload, cancel, unload, ping, stop; worker -> pool: chunk, warning, done, error, pong.
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@dataclass
+class PlacedModel:
+  runtime: str
+  size_gb: float
+
+
+class GenerationWorker:
+  """
+  One generation worker process, started as `python -m indiebot_arena.engine.worker_pool <fd>` and
+  connected over a socket pair. `models` holds the models placed on it, least recently used first.
+  """
+
+  def __init__(self, index: int, memory_budget_gb: float, env: Optional[Dict[str, str]] = None):
+    self.index = index
+    self.memory_budget_gb = memory_budget_gb
+    self.env = env or {}
+    self.models: "OrderedDict[str, PlacedModel]" = OrderedDict()
+    self.restarts = 0
+    self.restarting = False
+    self.last_pong = 0.0
+    self.process: Optional[subprocess.Popen] = None
+    self._conn: Optional[Connection] = None
+    self._streams: Dict[str, queue.Queue] = {}
+    self._lock = Lock()
+
+  def used_gb(self) -> float:
+    return sum(m.size_gb for m in self.models.values())
+
+  def free_gb(self) -> float:
+    return self.memory_budget_gb - self.used_gb()
+
+  # ---------- Process ----------
+
+  def start(self) -> None:
+    parent_conn, child_conn = Pipe()
+    env = dict(os.environ, **self.env)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (PACKAGE_ROOT, env.get("PYTHONPATH")) if p)
+    process = subprocess.Popen(
+      [sys.executable, "-m", "indiebot_arena.engine.worker_pool", str(child_conn.fileno())],
+      pass_fds=(child_conn.fileno(),), env=env
+    )
+    child_conn.close()
+    streams: Dict[str, queue.Queue] = {}
+    with self._lock:
+      self.process, self._conn, self._streams = process, parent_conn, streams
+      self.last_pong = time.monotonic()
+    Thread(target=self._read_loop, args=(parent_conn, streams), name=f"generation-worker-{self.index}",
+           daemon=True).start()
+
+  def stop(self, timeout: float = 5.0) -> None:
+    """Ask the worker to exit and kill it if it doesn't exit in time."""
+    with self._lock:
+      process, conn, streams = self.process, self._conn, self._streams
+    if conn is not None:
+      try:
+        conn.send(("stop", None, None))
+      except OSError:
+        pass
+      conn.close()
+    if process is not None:
+      try:
+        process.wait(timeout)
+      except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    self._fail_streams(streams, f"Generation worker {self.index} stopped.")
+
+  def restart(self, reason: str) -> None:
+    logging.warning(f"Restarting generation worker {self.index}: {reason}")
+    if self.is_alive():
+      self.process.kill()
+    self.stop()
+    self.restarts += 1
+    self.start()
+
+  def is_alive(self) -> bool:
+    return self.process is not None and self.process.poll() is None
+
+  # ---------- Messages ----------
+
+  def send(self, kind: str, request_id: Optional[str] = None, payload: Any = None) -> None:
+    with self._lock:
+      try:
+        self._conn.send((kind, request_id, payload))
+      except (OSError, AttributeError) as e:
+        raise RuntimeError(f"Generation worker {self.index} is not available.") from e
+
+  def open_stream(self) -> Tuple[str, queue.Queue]:
+    request_id = uuid.uuid4().hex
+    stream: queue.Queue = queue.Queue()
+    with self._lock:
+      self._streams[request_id] = stream
+    return request_id, stream
+
+  def close_stream(self, request_id: str) -> None:
+    with self._lock:
+      self._streams.pop(request_id, None)
+
+  def _read_loop(self, conn: Connection, streams: Dict[str, queue.Queue]) -> None:
+    while True:
+      try:
+        kind, request_id, payload = conn.recv()
+      except (EOFError, OSError):
+        break
+      if kind=="pong":
+        self.last_pong = time.monotonic()
+        continue
+      with self._lock:
+        stream = streams.get(request_id)
+      if stream is not None:
+        stream.put((kind, payload))
+    self._fail_streams(streams, f"Generation worker {self.index} exited.")
+
+  def _fail_streams(self, streams: Dict[str, queue.Queue], message: str) -> None:
+    with self._lock:
+      pending = list(streams.values())
+      streams.clear()
+    for stream in pending:
+      stream.put(("error", message))
+
+
+class GenerationWorkerPool:
+  """
+  Runs generation in worker processes, so tokenization and decoding don't share the GIL with the UI
+  handlers and a crashed or OOM-killed model only takes down its worker.
+  Each model is placed on one worker and its requests (and preloads) are routed there; warnings the
+  engine shows to the user are sent back and shown in the app process. Placement packs models by
+  Model.file_size_gb into the per-worker memory budget (best fit); when no worker has room, the least
+  recently used models of the emptiest worker are unloaded. Responses are streamed back as text deltas.
+  A monitor thread pings the workers and restarts any that exited or stopped answering; requests in
+  flight on it fail, and its models are placed again on their next request, on the other workers
+  while it is restarting.
+  """
+
+  def __init__(self,
+               num_workers: int = GENERATION_WORKERS,
+               memory_budget_gb: float = GENERATION_WORKER_MEMORY_GB,
+               health_interval_sec: float = GENERATION_WORKER_HEALTH_INTERVAL_SEC,
+               health_timeout_sec: float = GENERATION_WORKER_HEALTH_TIMEOUT_SEC,
+               env: Optional[Dict[str, str]] = None):
+    if num_workers < 1:
+      raise ValueError("A generation worker pool needs at least one worker.")
+    self.workers = [GenerationWorker(i, memory_budget_gb, env) for i in range(num_workers)]
+    self.health_interval_sec = health_interval_sec
+    self.health_timeout_sec = health_timeout_sec
+    self._lock = Lock()
+    self._stop = Event()
+    self._monitor: Optional[Thread] = None
+
+  def start(self) -> None:
+    for worker in self.workers:
+      worker.start()
+    self._monitor = Thread(target=self._monitor_loop, name="generation-worker-monitor", daemon=True)
+    self._monitor.start()
+
+  def stop(self) -> None:
+    self._stop.set()
+    for worker in self.workers:
+      worker.stop()
+    if self._monitor:
+      self._monitor.join(timeout=5)
+
+  # ---------- Placement ----------
+
+  def place(self, model_id: str, runtime: str,
+            size_gb: float) -> Tuple[GenerationWorker, List[Tuple[str, PlacedModel]]]:
+    """Return the worker serving model_id, placing it first if needed, and the models evicted to make room."""
+    with self._lock:
+      for worker in self.workers:
+        if model_id in worker.models:
+          worker.models.move_to_end(model_id)
+          return worker, []
+      available = [w for w in self.workers if not w.restarting]
+      if not available:
+        raise RuntimeError("No generation worker is available.")
+      fitting = [w for w in available if w.free_gb() >= size_gb]
+      evicted = []
+      if fitting:
+        worker = min(fitting, key=lambda w: w.free_gb())
+      else:
+        # A model larger than the budget still gets a worker to itself.
+        worker = max(available, key=lambda w: w.free_gb())
+        while worker.models and worker.free_gb() < size_gb:
+          evicted.append(worker.models.popitem(last=False))
+      worker.models[model_id] = PlacedModel(runtime, size_gb)
+      return worker, evicted
+
+  def is_placed(self, model_id: str) -> bool:
+    with self._lock:
+      return any(model_id in worker.models for worker in self.workers)
+
+  def _route(self, model_id: str, runtime: str, size_gb: float) -> Tuple[GenerationWorker, Optional[str]]:
+    worker, evicted = self.place(model_id, runtime, size_gb)
+    for evicted_id, placed in evicted:
+      worker.send("unload", None, (placed.runtime, evicted_id))
+    # Pins are applied in the app process, so the pinned snapshot travels with each request.
+    return worker, get_engine(runtime).pinned_path(model_id)
+
+  # ---------- Generation ----------
+
+  def preload(self, model_id: str, runtime: str = "transformers", file_size_gb: float = 0.0) -> None:
+    """Load model_id on the worker it is placed on (reloading it if its pin changed) and wait until it is loaded."""
+    worker, local_path = self._route(model_id, runtime, file_size_gb)
+    request_id, stream = worker.open_stream()
+    try:
+      worker.send("preload", request_id, (runtime, model_id, local_path))
+      kind, payload = stream.get()
+      if kind=="error":
+        raise RuntimeError(payload)
+    finally:
+      worker.close_stream(request_id)
+
+  def generate(self,
+               chat_history: list,
+               model_id: str,
+               max_new_tokens: int,
+               temperature: float,
+               top_p: float,
+               top_k: int,
+               repetition_penalty: float,
+               runtime: str = "transformers",
+               file_size_gb: float = 0.0) -> Iterator[str]:
+    worker, local_path = self._route(model_id, runtime, file_size_gb)
+    request_id, stream = worker.open_stream()
+    finished = False
+    try:
+      worker.send("generate", request_id, (runtime, model_id, local_path, (
+        chat_history, model_id, max_new_tokens, temperature, top_p, top_k, repetition_penalty
+      )))
+      text = ""
+      while True:
+        kind, payload = stream.get()
+        if kind=="chunk":
+          offset, delta = payload
+          text = text[:offset] + delta
+          yield text
+        elif kind=="warning":
+          get_engine(runtime).warn(payload)
+        elif kind=="done":
+          finished = True
+          return
+        else:
+          finished = True
+          raise RuntimeError(payload)
+    finally:
+      worker.close_stream(request_id)
+      if not finished:
+        try:
+          worker.send("cancel", request_id)
+        except RuntimeError:
+          pass
+
+  # ---------- Health ----------
+
+  def check_health(self) -> None:
+    now = time.monotonic()
+    for worker in self.workers:
+      if not worker.is_alive():
+        reason = f"exited with code {worker.process.returncode if worker.process else None}"
+      elif now - worker.last_pong > self.health_timeout_sec:
+        reason = f"no answer to health checks for {now - worker.last_pong:.0f}s"
+      else:
+        try:
+          worker.send("ping")
+        except RuntimeError:
+          pass
+        continue
+      # Placement only skips the worker while it restarts; the pool lock isn't held during the restart.
+      with self._lock:
+        worker.models.clear()
+        worker.restarting = True
+      try:
+        worker.restart(reason)
+      finally:
+        with self._lock:
+          worker.restarting = False
+
+  def _monitor_loop(self) -> None:
+    while not self._stop.wait(self.health_interval_sec):
+      try:
+        self.check_health()
+      except Exception as e:
+        logging.error(f"Generation worker health check failed: {e}")
+
+  def status(self) -> List[Dict[str, Any]]:
+    with self._lock:
+      return [{
+        "worker": w.index,
+        "pid": w.process.pid if w.process else None,
+        "alive": w.is_alive(),
+        "restarting": w.restarting,
+        "restarts": w.restarts,
+        "used_gb": round(w.used_gb(), 2),
+        "models": list(w.models.keys()),
+      } for w in self.workers]
+
+
+_pool: Optional[GenerationWorkerPool] = None
+_pool_lock = Lock()
+
+
+def get_generation_pool() -> Optional[GenerationWorkerPool]:
+  """The shared pool, started on first use, when GENERATION_WORKERS > 0; otherwise None (generate in process)."""
+  global _pool
+  if GENERATION_WORKERS <= 0:
+    return None
+  with _pool_lock:
+    if _pool is None:
+      _pool = GenerationWorkerPool()
+      _pool.start()
+    return _pool
+
+
+# ---------- Worker process ----------
+
+def _release_memory() -> None:
+  gc.collect()
+  torch = sys.modules.get("torch")
+  if torch is not None and torch.cuda.is_available():
+    torch.cuda.empty_cache()
+
+
+def serve(conn: Connection) -> None:
+  """Worker process loop: run the pool's requests until the connection is closed."""
+  send_lock = Lock()
+  # Only ids of generations still running are kept, so cancels that arrive too late don't accumulate.
+  requests_lock = Lock()
+  active: Set[str] = set()
+  cancelled: Set[str] = set()
+
+  def send(kind: str, request_id: Optional[str], payload: Any = None) -> None:
+    try:
+      with send_lock:
+        conn.send((kind, request_id, payload))
+    except OSError:
+      pass  # the pool is gone; the main loop exits on EOF
+
+  def engine_for(runtime: str):
+    engine = get_engine(runtime)
+    # The pool decides what stays resident, so the engine's own LRU must not evict placed models.
+    engine.max_resident_models = sys.maxsize
+    return engine
+
+  def load(runtime: str, model_id: str, local_path: Optional[str]):
+    engine = engine_for(runtime)
+    if local_path:
+      engine.pin(model_id, local_path)
+    engine.preload(model_id)
+    return engine
+
+  def run_preload(request_id: str, runtime: str, model_id: str, local_path: Optional[str]) -> None:
+    try:
+      load(runtime, model_id, local_path)
+      send("done", request_id)
+    except Exception as e:
+      logging.exception(f"Preload failed for {model_id}")
+      send("error", request_id, f"{type(e).__name__}: {e}")
+
+  def run_generate(request_id: str, runtime: str, model_id: str, local_path: Optional[str], args: tuple) -> None:
+    try:
+      engine = load(runtime, model_id, local_path)
+      sent = ""
+      with engine.redirect_warnings(lambda message: send("warning", request_id, message)):
+        for text in engine.generate(*args):
+          if request_id in cancelled:
+            break
+          offset = len(sent) if text.startswith(sent) else 0
+          send("chunk", request_id, (offset, text[offset:]))
+          sent = text
+      send("done", request_id)
+    except Exception as e:
+      logging.exception(f"Generation failed for {model_id}")
+      send("error", request_id, f"{type(e).__name__}: {e}")
+    finally:
+      with requests_lock:
+        active.discard(request_id)
+        cancelled.discard(request_id)
+
+  while True:
+    try:
+      kind, request_id, payload = conn.recv()
+    except (EOFError, OSError):
+      return
+    if kind=="stop":
+      return
+    if kind=="ping":
+      send("pong", request_id)
+    elif kind=="generate":
+      with requests_lock:
+        active.add(request_id)
+      Thread(target=run_generate, args=(request_id, *payload), daemon=True).start()
+    elif kind=="preload":
+      Thread(target=run_preload, args=(request_id, *payload), daemon=True).start()
+    elif kind=="cancel":
+      with requests_lock:
+        if request_id in active:
+          cancelled.add(request_id)
+    elif kind=="unload":
+      runtime, model_id = payload
+      if engine_for(runtime).unload(model_id):
+        _release_memory()
+
+
+if __name__=="__main__":
+  logging.basicConfig(level=logging.INFO)
+  serve(Connection(int(sys.argv[1])))
@@ -1,11 +1,11 @@
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional
+from typing import Dict, Optional
 
 from bson import ObjectId
 
 
-@dataclass
+@dataclass(slots=True)
 class Model:
   language: str               # 言語区分 (例: "ja", "en")
   weight_class: str           # サイズ区分 (例: "U-5GB", "U-10GB")
@@ -15,11 +15,13 @@ class Model:
   file_format: str            # 保存形式 (例: "safetensors", "gguf")
   file_size_gb: float         # ファイルサイズ（単位: GB）
   description: Optional[str] = None
+  revision: Optional[str] = None    # 固定したHubリビジョン（コミットsha）
+  local_path: Optional[str] = None  # 固定リビジョンのローカルスナップショット
   created_at: datetime = field(default_factory=datetime.utcnow)
   _id: Optional[ObjectId] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class Battle:
   language: str
   weight_class: str
@@ -31,7 +33,7 @@ class Battle:
   _id: Optional[ObjectId] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class LeaderboardEntry:
   language: str
   weight_class: str
@@ -39,3 +41,53 @@ class LeaderboardEntry:
   elo_score: int
   last_updated: datetime = field(default_factory=datetime.utcnow)
   _id: Optional[ObjectId] = None
+
+
+@dataclass(slots=True)
+class RatingCheckpoint:
+  language: str
+  weight_class: str
+  ratings: Dict[str, float]     # model_id(文字列) -> 丸める前のレーティング
+  last_battle_id: ObjectId      # チェックポイントに反映済みの最後のバトル
+  last_vote_timestamp: datetime
+  battle_count: int
+  initial_rating: int
+  k_factor: int
+  created_at: datetime = field(default_factory=datetime.utcnow)
+  _id: Optional[ObjectId] = None
+
+
+@dataclass(slots=True)
+class RatingSnapshot:
+  language: str
+  weight_class: str
+  ratings: Dict[str, int]       # model_id(文字列) -> その時点のレーティング
+  resolution: str = "raw"       # "raw" / "hour" / "day"（ダウンサンプリング後の粒度）
+  timestamp: datetime = field(default_factory=datetime.utcnow)
+  _id: Optional[ObjectId] = None
+
+
+@dataclass(slots=True)
+class ModelStats:
+  model_id: ObjectId
+  battles: int
+  wins: int
+  losses: int
+  draws: int
+
+  @property
+  def win_rate(self) -> float:
+    return self.wins / self.battles if self.battles else 0.0
+
+
+@dataclass(slots=True)
+class HeadToHead:
+  model_a_id: ObjectId
+  model_b_id: ObjectId
+  battles: int
+  a_wins: int
+  b_wins: int
+
+  @property
+  def draws(self) -> int:
+    return self.battles - self.a_wins - self.b_wins
@@ -1,20 +1,93 @@
+import bisect
+import logging
+import multiprocessing
+import os
 import random
 import re
-from datetime import datetime
-from typing import List, Optional, Tuple, Dict
+import time
+from collections import defaultdict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Tuple, Dict
 
 from bson import ObjectId
 
+from indiebot_arena.config import RATING_CHECKPOINT_INTERVAL, RATING_CHECKPOINT_SAFETY_SEC, RATING_CHECKPOINT_KEEP, \
+  RATING_MODE, RATING_WINDOW_DAYS, RECOMPUTE_MAX_WORKERS, RECOMPUTE_PARALLEL_MIN_BATTLES
+from indiebot_arena.dao.battle_write_buffer import BattleWriteBuffer
 from indiebot_arena.dao.mongo_dao import MongoDAO
-from indiebot_arena.model.domain_model import Model, Battle, LeaderboardEntry
+from indiebot_arena.engine.engine_registry import get_engine
+from indiebot_arena.model.domain_model import Model, Battle, LeaderboardEntry, RatingCheckpoint, ModelStats, \
+  HeadToHead, RatingSnapshot
+from indiebot_arena.service.leaderboard_channel import LeaderboardChannel, leaderboard_channel
+from indiebot_arena.service.matchmaking_service import AdaptivePairSampler
+from indiebot_arena.service.rating_history import COMPACTION_LEVELS, compaction_cutoff, downsample
+from indiebot_arena.service.rating import INITIAL_RATING, K_FACTOR, apply_elo, bradley_terry_ratings, replay_elo
+from indiebot_arena.util.tracing import trace_methods
 
-INITIAL_RATING = 1000
-K_FACTOR = 32
 
+@dataclass
+class RecomputeProgress:
+  language: str
+  weight_class: str
+  battles: int
+  done: int
+  total: int
+  elapsed_sec: float
 
+
+def _log_progress(p: RecomputeProgress) -> None:
+  logging.info(f"Recomputed {p.language}/{p.weight_class} ({p.battles} battles): "
+               f"{p.done}/{p.total} divisions in {p.elapsed_sec}s")
+
+
+def _replay_division(
+    pair_results: List[Tuple[str, str, str]],
+    stable: int
+) -> Tuple[Dict[str, float], Dict[str, float]]:
+  """
+  Returns the ratings after the first `stable` battles (for a checkpoint) and after all battles.
+  """
+  stable_ratings = replay_elo(pair_results[:stable])
+  return stable_ratings, replay_elo(pair_results[stable:], stable_ratings)
+
+
+def _worker_pool(max_workers: int) -> Executor:
+  # fork keeps the workers from re-importing app.py as __main__; the replay itself only touches its arguments.
+  if "fork" in multiprocessing.get_all_start_methods():
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("fork"))
+  return ThreadPoolExecutor(max_workers=max_workers)
+
+
+def _completed(value) -> Future:
+  future = Future()
+  future.set_result(value)
+  return future
+
+
+@trace_methods("service")
 class ArenaService:
-  def __init__(self, dao: MongoDAO):
+  def __init__(
+      self,
+      dao: MongoDAO,
+      battle_buffer: Optional[BattleWriteBuffer] = None,
+      pair_sampler: Optional[AdaptivePairSampler] = None,
+      channel: LeaderboardChannel = leaderboard_channel
+  ):
     self.dao = dao
+    self.battle_buffer = battle_buffer
+    self.pair_sampler = pair_sampler
+    self.channel = channel
+    self.checkpoint_interval = RATING_CHECKPOINT_INTERVAL
+    self.checkpoint_safety_sec = RATING_CHECKPOINT_SAFETY_SEC
+    self.rating_mode = RATING_MODE
+    self.rating_window_days = RATING_WINDOW_DAYS
+    self.recompute_parallel_min_battles = RECOMPUTE_PARALLEL_MIN_BATTLES
+    self._history_compacted_until: Dict[Tuple[str, str, str], datetime] = {}
+    if battle_buffer:
+      # Buffered battles reach Mongo later, so the leaderboard is recomputed once they were written.
+      battle_buffer.flush_listeners.append(self._on_battles_flushed)
 
   # ---------- Model ----------
 
@@ -27,7 +100,9 @@ class ArenaService:
       quantization: str,
       file_format: str,
       file_size_gb: float,
-      description: Optional[str] = ""
+      description: Optional[str] = "",
+      revision: Optional[str] = None,
+      local_path: Optional[str] = None
   ) -> ObjectId:
     # Non-empty checks
     if not model_name.strip():
@@ -40,12 +115,7 @@ class ArenaService:
       raise ValueError("File format cannot be empty.")
 
     # Validation
-    if runtime!="transformers":
-      raise ValueError("Runtime must be 'transformers'.")
-    if quantization not in ("bnb", "none"):
-      raise ValueError("Quantization must be 'bnb' or 'none'.")
-    if file_format!="safetensors":
-      raise ValueError("File format must be 'safetensors'.")
+    get_engine(runtime).validate_registration(quantization, file_format)
     if language not in ("ja", "en"):
       raise ValueError("Language must be 'ja' or 'en'.")
     if weight_class not in ("U-5GB", "U-10GB"):
@@ -75,7 +145,9 @@ class ArenaService:
       file_size_gb=file_size_gb,
       language=language,
       weight_class=weight_class,
-      description=description
+      description=description,
+      revision=revision,
+      local_path=local_path
     )
     return self.dao.insert_model(model)
 
@@ -97,6 +169,16 @@ class ArenaService:
       raise ValueError("Need at least 2 models for a battle.")
     return tuple(random.sample(models, 2))
 
+  def get_two_adaptive_models(
+      self,
+      language: str,
+      weight_class: str
+  ) -> Tuple[Model, Model]:
+    if self.pair_sampler is None:
+      return self.get_two_random_models(language, weight_class)
+    models = self.dao.find_models(language, weight_class)
+    return self.pair_sampler.sample(language, weight_class, models)
+
   def get_model_dropdown_list(
       self,
       language: str,
@@ -110,6 +192,13 @@ class ArenaService:
 
   # ---------- Battle ----------
 
+  def _on_battles_flushed(self, battles: List[Battle]) -> None:
+    for language, weight_class in sorted({(b.language, b.weight_class) for b in battles}):
+      try:
+        self.update_leaderboard(language, weight_class)
+      except Exception as e:
+        logging.error(f"Error updating leaderboard for {language}/{weight_class}: {e}")
+
   def record_battle(
       self,
       language: str,
@@ -135,7 +224,9 @@ class ArenaService:
       raise ValueError("Winner model ID must be either model_a_id or model_b_id.")
 
     # Check duplicate
-    last_battle = self.dao.find_last_battle()
+    last_battle = self.battle_buffer.last_pending() if self.battle_buffer else None
+    if last_battle is None:
+      last_battle = self.dao.find_last_battle()
     if last_battle is not None:
       if (last_battle.language==language and
           last_battle.weight_class==weight_class and
@@ -159,7 +250,12 @@ class ArenaService:
       winner_model_id=winner_model_id,
       user_id=user_id,
     )
-    battle_id = self.dao.insert_battle(battle)
+    if self.battle_buffer:
+      battle_id = self.battle_buffer.submit(battle)
+    else:
+      battle_id = self.dao.insert_battle(battle)
+    if self.pair_sampler:
+      self.pair_sampler.record_battle(language, weight_class, str(model_a_id), str(model_b_id))
     return battle_id
 
   # ---------- LeaderboardEntry ----------
@@ -171,6 +267,128 @@ class ArenaService:
   ) -> List[LeaderboardEntry]:
     return self.dao.find_leaderboard_entries(language, weight_class)
 
+  def get_model_stats(
+      self,
+      language: str,
+      weight_class: str,
+      since: Optional[datetime] = None
+  ) -> List[ModelStats]:
+    return self.dao.aggregate_model_stats(language, weight_class, since)
+
+  def get_head_to_head(
+      self,
+      language: str,
+      weight_class: str,
+      since: Optional[datetime] = None
+  ) -> List[HeadToHead]:
+    return self.dao.aggregate_head_to_head(language, weight_class, since)
+
+  def compute_aggregate_ratings(
+      self,
+      language: str,
+      weight_class: str,
+      since: Optional[datetime] = None
+  ) -> Dict[str, float]:
+    """
+    Fit Bradley-Terry ratings from head-to-head totals aggregated in Mongo.
+    Only one document per model pair is transferred, whatever the number of battles.
+    """
+    pair_results = [
+      (str(h.model_a_id), str(h.model_b_id), h.a_wins + h.draws / 2, h.b_wins + h.draws / 2)
+      for h in self.dao.aggregate_head_to_head(language, weight_class, since)
+    ]
+    model_ids = sorted({model_id for a, b, _, _ in pair_results for model_id in (a, b)})
+    return bradley_terry_ratings(model_ids, pair_results)
+
+  def compute_ratings(
+      self,
+      language: str,
+      weight_class: str,
+      use_checkpoint: bool = True,
+      save_checkpoint: bool = True
+  ) -> Dict[str, float]:
+    """
+    Replay battles into unrounded Elo ratings keyed by model id string.
+    Starts from the latest rating checkpoint of the division and replays only the battles after it.
+    A new checkpoint is saved after checkpoint_interval replayed battles, covering only battles older
+    than checkpoint_safety_sec so votes still waiting in a write buffer are never skipped.
+    """
+    checkpoint = self.dao.find_latest_rating_checkpoint(language, weight_class) if use_checkpoint else None
+    if checkpoint and (checkpoint.initial_rating!=INITIAL_RATING or checkpoint.k_factor!=K_FACTOR):
+      checkpoint = None
+
+    if checkpoint:
+      ratings = dict(checkpoint.ratings)
+      battle_count = checkpoint.battle_count
+      battles = self.dao.find_battles_after(
+        language, weight_class, checkpoint.last_vote_timestamp, checkpoint.last_battle_id
+      )
+    else:
+      ratings = {}
+      battle_count = 0
+      battles = self.dao.find_battles(language, weight_class)
+      battles.sort(key=lambda b: (b.vote_timestamp, b._id))
+
+    cutoff = datetime.utcnow() - timedelta(seconds=self.checkpoint_safety_sec)
+    stable = 0
+    while stable < len(battles) and battles[stable].vote_timestamp <= cutoff:
+      stable += 1
+
+    for battle in battles[:stable]:
+      apply_elo(ratings, str(battle.model_a_id), str(battle.model_b_id), str(battle.winner_model_id))
+    if save_checkpoint and stable > 0 and stable >= self.checkpoint_interval:
+      last_battle = battles[stable - 1]
+      self._save_checkpoint(language, weight_class, ratings, last_battle._id, last_battle.vote_timestamp,
+                            battle_count + stable)
+    for battle in battles[stable:]:
+      apply_elo(ratings, str(battle.model_a_id), str(battle.model_b_id), str(battle.winner_model_id))
+    return ratings
+
+  def _save_checkpoint(
+      self,
+      language: str,
+      weight_class: str,
+      ratings: Dict[str, float],
+      last_battle_id: ObjectId,
+      last_vote_timestamp: datetime,
+      battle_count: int
+  ) -> None:
+    self.dao.insert_rating_checkpoint(RatingCheckpoint(
+      language=language,
+      weight_class=weight_class,
+      ratings=dict(ratings),
+      last_battle_id=last_battle_id,
+      last_vote_timestamp=last_vote_timestamp,
+      battle_count=battle_count,
+      initial_rating=INITIAL_RATING,
+      k_factor=K_FACTOR,
+    ))
+    self.dao.delete_old_rating_checkpoints(language, weight_class, RATING_CHECKPOINT_KEEP)
+
+  def verify_rating_checkpoint(
+      self,
+      language: str,
+      weight_class: str,
+      tolerance: float = 1e-6
+  ) -> Dict:
+    """
+    Compare checkpoint + tail replay against a replay from the first battle.
+    """
+    checkpoint = self.dao.find_latest_rating_checkpoint(language, weight_class)
+    from_checkpoint = self.compute_ratings(language, weight_class, save_checkpoint=False)
+    from_scratch = self.compute_ratings(language, weight_class, use_checkpoint=False, save_checkpoint=False)
+    model_ids = set(from_checkpoint) | set(from_scratch)
+    max_abs_diff = max(
+      (abs(from_checkpoint.get(m, INITIAL_RATING) - from_scratch.get(m, INITIAL_RATING)) for m in model_ids),
+      default=0.0
+    )
+    return {
+      "checkpoint_id": checkpoint._id if checkpoint else None,
+      "checkpoint_battle_count": checkpoint.battle_count if checkpoint else 0,
+      "max_abs_diff": max_abs_diff,
+      "ok": max_abs_diff <= tolerance,
+    }
+
   def update_leaderboard(
       self,
       language: str,
@@ -179,6 +397,8 @@ class ArenaService:
     """
     Update the leaderboard using battle history.
     Each model starts at INITIAL_RATING and K is K_FACTOR.
+    With rating_mode "aggregate", Bradley-Terry ratings are fitted from Mongo-side aggregates instead,
+    optionally restricted to the last rating_window_days.
     """
     models = self.dao.find_models(language, weight_class)
     if not models:
@@ -187,46 +407,182 @@ class ArenaService:
     ratings = {
       str(model._id): INITIAL_RATING for model in models if model._id is not None
     }
+    if self.rating_mode=="aggregate":
+      since = datetime.utcnow() - timedelta(days=self.rating_window_days) if self.rating_window_days > 0 else None
+      ratings.update(self.compute_aggregate_ratings(language, weight_class, since))
+    else:
+      ratings.update(self.compute_ratings(language, weight_class))
 
-    battles = self.dao.find_battles(language, weight_class)
-    battles.sort(key=lambda b: b.vote_timestamp)
-
-    for battle in battles:
-      model_a_id_str = str(battle.model_a_id)
-      model_b_id_str = str(battle.model_b_id)
-
-      if model_a_id_str not in ratings:
-        ratings[model_a_id_str] = INITIAL_RATING
-      if model_b_id_str not in ratings:
-        ratings[model_b_id_str] = INITIAL_RATING
-
-      if str(battle.winner_model_id)==model_a_id_str:
-        score_a, score_b = 1, 0
-      else:
-        score_a, score_b = 0, 1
-
-      exp_a = 1 / (1 + 10 ** ((ratings[model_b_id_str] - ratings[model_a_id_str]) / 400))
-      exp_b = 1 / (1 + 10 ** ((ratings[model_a_id_str] - ratings[model_b_id_str]) / 400))
-
-      ratings[model_a_id_str] += K_FACTOR * (score_a - exp_a)
-      ratings[model_b_id_str] += K_FACTOR * (score_b - exp_b)
+    self._save_leaderboard(language, weight_class, models, ratings)
+    return True
 
-    for model in models:
-      if model._id is None:
+  def _save_leaderboard(
+      self,
+      language: str,
+      weight_class: str,
+      models: List[Model],
+      ratings: Dict[str, float]
+  ) -> None:
+    if self.pair_sampler:
+      self.pair_sampler.update_ratings(language, weight_class, ratings)
+
+    snapshot = {}
+    # Other processes are told about the whole update once, not once per entry.
+    with self.dao.write_batch():
+      for model in models:
+        if model._id is None:
+          continue
+        model_id_str = str(model._id)
+        new_rating = round(ratings.get(model_id_str, INITIAL_RATING))
+        snapshot[model_id_str] = new_rating
+        entry = self.dao.find_one_leaderboard_entry(language, weight_class, model._id)
+        if entry:
+          entry.elo_score = new_rating
+          entry.last_updated = datetime.utcnow()
+          self.dao.update_leaderboard_entry(entry)
+        else:
+          new_entry = LeaderboardEntry(
+            model_id=model._id,
+            language=language,
+            weight_class=weight_class,
+            elo_score=new_rating,
+          )
+          self.dao.insert_leaderboard_entry(new_entry)
+
+    self.record_rating_snapshot(language, weight_class, snapshot)
+    self.channel.publish(language, weight_class)
+
+  def update_all_leaderboards(
+      self,
+      divisions: Optional[List[Tuple[str, str]]] = None,
+      max_workers: int = RECOMPUTE_MAX_WORKERS,
+      progress: Optional[Callable[[RecomputeProgress], None]] = None
+  ) -> Dict[Tuple[str, str], bool]:
+    """
+    Rebuild the leaderboards of several (language, weight_class) divisions from the first battle.
+    Battles of all divisions are read in one streamed pass and grouped by division, then every division
+    is replayed in its own worker process, so the rebuild takes about as long as the largest division.
+    Small rebuilds (fewer than recompute_parallel_min_battles battles) are replayed in-process.
+    Defaults to every division with registered models; progress is called after each finished division.
+    With rating_mode "aggregate" every division is fitted from Mongo-side aggregates instead.
+    """
+    models_by_division: Dict[Tuple[str, str], List[Model]] = defaultdict(list)
+    for model in self.dao.find_all_models():
+      models_by_division[(model.language, model.weight_class)].append(model)
+    if divisions is None:
+      divisions = sorted(models_by_division)
+    results = {division: False for division in divisions}
+    report = progress or _log_progress
+    started = time.monotonic()
+
+    if self.rating_mode=="aggregate":
+      for done, (language, weight_class) in enumerate(divisions, 1):
+        results[(language, weight_class)] = self.update_leaderboard(language, weight_class)
+        report(RecomputeProgress(language, weight_class, 0, done, len(divisions),
+                                 round(time.monotonic() - started, 3)))
+      return results
+
+    rows_by_division = {division: [] for division in divisions if models_by_division.get(division)}
+    for language, weight_class, vote_timestamp, battle_id, model_a_id, model_b_id, winner_model_id \
+        in self.dao.iter_battle_rows():
+      rows = rows_by_division.get((language, weight_class))
+      if rows is not None:
+        rows.append((vote_timestamp, battle_id, str(model_a_id), str(model_b_id), str(winner_model_id)))
+
+    cutoff = datetime.utcnow() - timedelta(seconds=self.checkpoint_safety_sec)
+    stable_counts = {}
+    for division, rows in rows_by_division.items():
+      rows.sort(key=lambda row: (row[0], row[1]))
+      stable_counts[division] = bisect.bisect_right(rows, cutoff, key=lambda row: row[0])
+
+    total_battles = sum(len(rows) for rows in rows_by_division.values())
+    if len(rows_by_division) > 1 and total_battles >= self.recompute_parallel_min_battles:
+      executor = _worker_pool(max_workers or min(len(rows_by_division), os.cpu_count() or 1))
+    else:
+      executor = None
+
+    try:
+      futures = {}
+      for division, rows in rows_by_division.items():
+        pair_results = [row[2:] for row in rows]
+        if executor:
+          futures[executor.submit(_replay_division, pair_results, stable_counts[division])] = division
+        else:
+          futures[_completed(_replay_division(pair_results, stable_counts[division]))] = division
+
+      for done, future in enumerate(as_completed(futures), 1):
+        language, weight_class = futures[future]
+        rows = rows_by_division[(language, weight_class)]
+        stable = stable_counts[(language, weight_class)]
+        stable_ratings, ratings = future.result()
+        if stable > 0 and stable >= self.checkpoint_interval:
+          self._save_checkpoint(language, weight_class, stable_ratings, rows[stable - 1][1], rows[stable - 1][0],
+                                stable)
+        self._save_leaderboard(language, weight_class, models_by_division[(language, weight_class)], ratings)
+        results[(language, weight_class)] = True
+        report(RecomputeProgress(language, weight_class, len(rows), done, len(futures),
+                                 round(time.monotonic() - started, 3)))
+    finally:
+      if executor:
+        executor.shutdown()
+    return results
+
+  # ---------- Rating history ----------
+
+  def record_rating_snapshot(
+      self,
+      language: str,
+      weight_class: str,
+      ratings: Dict[str, int],
+      timestamp: Optional[datetime] = None
+  ) -> ObjectId:
+    snapshot = RatingSnapshot(language=language, weight_class=weight_class, ratings=ratings)
+    if timestamp is not None:
+      snapshot.timestamp = timestamp
+    snapshot_id = self.dao.insert_rating_snapshot(snapshot)
+    self.compact_rating_history(language, weight_class, timestamp)
+    return snapshot_id
+
+  def compact_rating_history(
+      self,
+      language: str,
+      weight_class: str,
+      now: Optional[datetime] = None
+  ) -> int:
+    """
+    Downsample old snapshots: raw snapshots become hourly after RATING_HISTORY_RAW_RETENTION_HOURS and
+    hourly ones daily after RATING_HISTORY_HOURLY_RETENTION_DAYS. Each level is checked at most once per
+    target bucket, so the recompute path usually skips it without a query.
+    Returns the number of snapshots that were replaced.
+    """
+    now = now or datetime.utcnow()
+    compacted = 0
+    for source, target, retention in COMPACTION_LEVELS:
+      cutoff = compaction_cutoff(now, retention, target)
+      key = (language, weight_class, source)
+      if self._history_compacted_until.get(key, datetime.min) >= cutoff:
         continue
-      model_id_str = str(model._id)
-      new_rating = round(ratings.get(model_id_str, INITIAL_RATING))
-      entry = self.dao.find_one_leaderboard_entry(language, weight_class, model._id)
-      if entry:
-        entry.elo_score = new_rating
-        entry.last_updated = datetime.utcnow()
-        self.dao.update_leaderboard_entry(entry)
-      else:
-        new_entry = LeaderboardEntry(
-          model_id=model._id,
-          language=language,
-          weight_class=weight_class,
-          elo_score=new_rating,
-        )
-        self.dao.insert_leaderboard_entry(new_entry)
-    return True
+      old = self.dao.find_rating_snapshots(language, weight_class, until=cutoff, resolution=source)
+      if old:
+        self.dao.insert_rating_snapshots(downsample(old, target))
+        compacted += self.dao.delete_rating_snapshots([s._id for s in old])
+      self._history_compacted_until[key] = cutoff
+    return compacted
+
+  def get_rating_history(
+      self,
+      language: str,
+      weight_class: str,
+      since: Optional[datetime] = None
+  ) -> List[RatingSnapshot]:
+    """Rating snapshots of the whole division, oldest first, at the resolution each period is kept at."""
+    return self.dao.find_rating_snapshots(language, weight_class, since)
+
+  def get_model_rating_history(
+      self,
+      language: str,
+      weight_class: str,
+      model_id: ObjectId,
+      since: Optional[datetime] = None
+  ) -> List[Tuple[datetime, int]]:
+    return self.dao.find_model_rating_history(language, weight_class, model_id, since)
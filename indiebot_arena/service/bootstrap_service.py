@@ -10,6 +10,7 @@ class BootstrapService:
     self.arena_service = ArenaService(dao);
 
   def provision_database(self):
+    self.dao.create_indexes()
     if self.dao.models_collection.count_documents({}) > 0:
       logging.info("Database already provisioned. Skipping initial data insertion.")
       return
@@ -26,7 +27,6 @@ class BootstrapService:
       self.arena_service.register_model("ja", "U-10GB", "indiebot-community/gemma-3-12b-it-bnb-4bit", "transformers", "bnb", "safetensors", 7.51)
       self.arena_service.register_model("ja", "U-10GB", "indiebot-community/gemma-2-9b-it-bnb-4bit", "transformers", "bnb", "safetensors", 6.07)
 
-      self.arena_service.update_leaderboard("ja", "U-5GB")
-      self.arena_service.update_leaderboard("ja", "U-10GB")
+      self.arena_service.update_all_leaderboards([("ja", "U-5GB"), ("ja", "U-10GB")])
     except Exception as e:
       logging.error(f"Error register_model: {e}")
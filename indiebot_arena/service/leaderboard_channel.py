@@ -0,0 +1,65 @@
+import logging
+from collections import defaultdict
+from threading import Condition
+from typing import Callable, Dict, List, Tuple
+
+Division = Tuple[str, str]
+Subscriber = Callable[[str, str, int], None]
+
+
+class LeaderboardChannel:
+  """
+  In-process publish/subscribe channel for leaderboard changes.
+  ArenaService publishes a division after rewriting its entries, which bumps the division's version.
+  Subscribers either register a callback (called on the publishing thread) or compare version()
+  with the last version they rendered, e.g. from a UI timer.
+  """
+
+  def __init__(self):
+    self._versions: Dict[Division, int] = defaultdict(int)
+    self._subscribers: List[Subscriber] = []
+    self._cond = Condition()
+
+  def publish(self, language: str, weight_class: str) -> int:
+    with self._cond:
+      self._versions[(language, weight_class)] += 1
+      version = self._versions[(language, weight_class)]
+      subscribers = list(self._subscribers)
+      self._cond.notify_all()
+    for callback in subscribers:
+      try:
+        callback(language, weight_class, version)
+      except Exception as e:
+        logging.error(f"Leaderboard subscriber failed: {e}")
+    return version
+
+  def publish_all(self) -> None:
+    """Publish every division that has been published or asked for, e.g. after a change of unknown scope."""
+    with self._cond:
+      divisions = list(self._versions.keys())
+    for language, weight_class in divisions:
+      self.publish(language, weight_class)
+
+  def version(self, language: str, weight_class: str) -> int:
+    with self._cond:
+      return self._versions[(language, weight_class)]
+
+  def wait(self, language: str, weight_class: str, seen_version: int, timeout: float) -> int:
+    """Block until the division's version differs from seen_version or timeout passes; returns the version."""
+    with self._cond:
+      self._cond.wait_for(lambda: self._versions[(language, weight_class)]!=seen_version, timeout)
+      return self._versions[(language, weight_class)]
+
+  def subscribe(self, callback: Subscriber) -> Callable[[], None]:
+    with self._cond:
+      self._subscribers.append(callback)
+
+    def unsubscribe():
+      with self._cond:
+        if callback in self._subscribers:
+          self._subscribers.remove(callback)
+
+    return unsubscribe
+
+
+leaderboard_channel = LeaderboardChannel()
@@ -0,0 +1,108 @@
+import math
+import random
+import time
+from dataclasses import dataclass, field
+from itertools import combinations
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from indiebot_arena.config import MATCHMAKING_CACHE_TTL_SEC, MATCHMAKING_EXPLORATION
+from indiebot_arena.dao.mongo_dao import MongoDAO
+from indiebot_arena.model.domain_model import Model
+from indiebot_arena.service.rating import INITIAL_RATING, expected_score
+
+
+def pair_weights(
+    model_ids: List[str],
+    battle_counts: Dict[str, int],
+    ratings: Dict[str, float],
+    exploration: float = MATCHMAKING_EXPLORATION
+) -> List[Tuple[Tuple[str, str], float]]:
+  """
+  Weight every pair by how informative its next vote is.
+  Under-sampled models get 1/sqrt(1 + battles) and the outcome uncertainty 4p(1-p) of the pair
+  (1.0 for equal ratings) is mixed with a uniform exploration term so no pair is ever excluded.
+  """
+  weights = []
+  for a, b in combinations(model_ids, 2):
+    sampling = 1 / math.sqrt(1 + battle_counts.get(a, 0)) * 1 / math.sqrt(1 + battle_counts.get(b, 0))
+    p = expected_score(ratings.get(a, INITIAL_RATING), ratings.get(b, INITIAL_RATING))
+    uncertainty = 4 * p * (1 - p)
+    weights.append(((a, b), sampling * (exploration + (1 - exploration) * uncertainty)))
+  return weights
+
+
+def sample_pair(weights: List[Tuple[Tuple[str, str], float]], rng: random.Random = random) -> Tuple[str, str]:
+  pairs = [pair for pair, _ in weights]
+  pair = rng.choices(pairs, weights=[w for _, w in weights], k=1)[0]
+  return pair if rng.random() < 0.5 else (pair[1], pair[0])
+
+
+@dataclass
+class DivisionStats:
+  battle_counts: Dict[str, int] = field(default_factory=dict)
+  ratings: Dict[str, float] = field(default_factory=dict)
+  loaded_at: float = 0.0
+
+
+class AdaptivePairSampler:
+  """
+  Picks battle pairs that favor under-sampled models and close ratings.
+  Per-division stats are loaded from the battles/leaderboard collections, updated incrementally
+  on each vote and leaderboard recompute, and reloaded after cache_ttl_sec.
+  """
+
+  def __init__(self, dao: MongoDAO, cache_ttl_sec: float = MATCHMAKING_CACHE_TTL_SEC):
+    self.dao = dao
+    self.cache_ttl_sec = cache_ttl_sec
+    self._stats: Dict[Tuple[str, str], DivisionStats] = {}
+    self._lock = Lock()
+
+  def _get_stats(self, language: str, weight_class: str) -> DivisionStats:
+    key = (language, weight_class)
+    with self._lock:
+      stats = self._stats.get(key)
+      if stats is not None and time.monotonic() - stats.loaded_at < self.cache_ttl_sec:
+        return stats
+    counts = self.dao.count_battles_by_model(language, weight_class)
+    entries = self.dao.find_leaderboard_entries(language, weight_class)
+    stats = DivisionStats(
+      battle_counts={str(model_id): count for model_id, count in counts.items()},
+      ratings={str(entry.model_id): entry.elo_score for entry in entries},
+      loaded_at=time.monotonic()
+    )
+    with self._lock:
+      self._stats[key] = stats
+    return stats
+
+  def sample(self, language: str, weight_class: str, models: List[Model]) -> Tuple[Model, Model]:
+    if len(models) < 2:
+      raise ValueError("Need at least 2 models for a battle.")
+    stats = self._get_stats(language, weight_class)
+    by_id = {str(model._id): model for model in models}
+    with self._lock:
+      weights = pair_weights(list(by_id.keys()), stats.battle_counts, stats.ratings)
+    a, b = sample_pair(weights)
+    return by_id[a], by_id[b]
+
+  def record_battle(self, language: str, weight_class: str, model_a_id: str, model_b_id: str) -> None:
+    with self._lock:
+      stats = self._stats.get((language, weight_class))
+      if stats is None:
+        return
+      for model_id in (model_a_id, model_b_id):
+        stats.battle_counts[model_id] = stats.battle_counts.get(model_id, 0) + 1
+
+  def invalidate(self, language: Optional[str] = None, weight_class: Optional[str] = None) -> None:
+    """Drop cached stats of a division (or of every division) so the next sample reloads them."""
+    with self._lock:
+      if language is None:
+        self._stats.clear()
+      else:
+        self._stats.pop((language, weight_class), None)
+
+  def update_ratings(self, language: str, weight_class: str, ratings: Dict[str, float]) -> None:
+    with self._lock:
+      stats = self._stats.get((language, weight_class))
+      if stats is not None:
+        stats.ratings = dict(ratings)
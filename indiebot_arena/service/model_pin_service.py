@@ -0,0 +1,133 @@
+import logging
+import os
+import time
+from threading import Thread
+from typing import Callable, Dict, Optional, Tuple
+
+from bson import ObjectId
+
+from indiebot_arena.dao.mongo_dao import MongoDAO
+from indiebot_arena.engine.engine_registry import get_engine
+from indiebot_arena.engine.worker_pool import get_generation_pool
+from indiebot_arena.model.domain_model import Model
+
+
+def latest_revision(model_id: str) -> str:
+  from huggingface_hub import model_info
+
+  return model_info(model_id).sha
+
+
+def delete_cached_revision(model_id: str, revision: str) -> None:
+  """Remove a revision from the Hugging Face cache, with the files no other revision uses."""
+  from huggingface_hub import scan_cache_dir
+
+  cache = scan_cache_dir()
+  for repo in cache.repos:
+    if repo.repo_id==model_id and any(r.commit_hash==revision for r in repo.revisions):
+      strategy = cache.delete_revisions(revision)
+      strategy.execute()
+      logging.info(f"Deleted snapshot {revision} of {model_id} ({strategy.expected_freed_size_str})")
+
+
+class ModelPinService:
+  """
+  Pins every registered model to a resolved Hub revision and a local snapshot, so the engines load
+  weights from disk and the generation path never contacts the Hub.
+  apply_pins() only uses snapshots already on this machine; refresh_all() resolves the latest revision
+  of each repo, downloads new snapshots and updates the pins stored on the models.
+  A model that already has a revision only moves to a new one after verify_revision(model, revision)
+  accepted it (the registration size check and chat test); without a verifier it stays where it is.
+  Rejected revisions aren't checked again. The snapshot a model moved away from is deleted once no
+  registered model uses it anymore.
+  """
+
+  def __init__(self, dao: MongoDAO, resolve_revision: Callable[[str], str] = latest_revision,
+               verify_revision: Optional[Callable[[Model, str], Optional[str]]] = None,
+               delete_revision: Callable[[str, str], None] = delete_cached_revision):
+    self.dao = dao
+    self.resolve_revision = resolve_revision
+    self.verify_revision = verify_revision
+    self.delete_revision = delete_revision
+    self._rejected: Dict[ObjectId, str] = {}
+
+  def apply_pins(self) -> int:
+    count = 0
+    for model in self.dao.find_all_models():
+      if model.local_path and os.path.exists(model.local_path):
+        get_engine(model.runtime).pin(model.model_name, model.local_path)
+        count += 1
+    return count
+
+  def refresh_model(self, model: Model, revision: Optional[str] = None) -> bool:
+    """Returns True if the model was moved to a new snapshot."""
+    engine = get_engine(model.runtime)
+    revision = revision or self.resolve_revision(model.model_name)
+    has_snapshot = model.local_path and os.path.exists(model.local_path)
+    if revision==model.revision and has_snapshot:
+      engine.pin(model.model_name, model.local_path)
+      return False
+    old_revision = model.revision
+    if old_revision and revision!=old_revision and not self._accept(model, revision):
+      if has_snapshot:
+        engine.pin(model.model_name, model.local_path)
+        return False
+      revision = old_revision
+    local_path = engine.snapshot(model.model_name, revision)
+    self.dao.update_model_pin(model._id, revision, local_path)
+    model.revision, model.local_path = revision, local_path
+    evicted = engine.pin(model.model_name, local_path)
+    # If the model was loaded from the old snapshot, load the new one before the next chat needs it.
+    pool = get_generation_pool()
+    if pool is not None:
+      # Generation runs in the workers; the new pin travels with the preload and replaces the old copy there.
+      if pool.is_placed(model.model_name):
+        pool.preload(model.model_name, model.runtime, model.file_size_gb)
+    elif evicted:
+      engine.preload(model.model_name)
+    logging.info(f"Pinned {model.model_name} to {revision} ({local_path})")
+    if old_revision and old_revision!=revision:
+      self._delete_unused_revision(model.model_name, old_revision)
+    return True
+
+  def _accept(self, model: Model, revision: str) -> bool:
+    if self.verify_revision is None or self._rejected.get(model._id)==revision:
+      return False
+    error = self.verify_revision(model, revision)
+    if error:
+      self._rejected[model._id] = revision
+      logging.warning(f"Keeping {model.model_name} on {model.revision}: revision {revision} failed the check: {error}")
+      return False
+    return True
+
+  def _delete_unused_revision(self, model_name: str, revision: str) -> None:
+    if any(m.model_name==model_name and m.revision==revision for m in self.dao.find_all_models()):
+      return
+    try:
+      self.delete_revision(model_name, revision)
+    except Exception as e:
+      logging.error(f"Error deleting snapshot {revision} of {model_name}: {e}")
+
+  def refresh_all(self) -> int:
+    revisions: Dict[Tuple[str, str], str] = {}
+    updated = 0
+    for model in self.dao.find_all_models():
+      try:
+        key = (model.runtime, model.model_name)
+        if key not in revisions:
+          revisions[key] = self.resolve_revision(model.model_name)
+        if self.refresh_model(model, revisions[key]):
+          updated += 1
+      except Exception as e:
+        logging.error(f"Error refreshing pin of {model.model_name}: {e}")
+    return updated
+
+  def start_background_refresh(self, interval_sec: float) -> Thread:
+    def loop():
+      while True:
+        self.refresh_all()
+        time.sleep(interval_sec)
+
+    t = Thread(target=loop, name="model-pin-refresh", daemon=True)
+    t.start()
+    return t
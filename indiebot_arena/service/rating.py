@@ -0,0 +1,80 @@
+import math
+from typing import Dict, List, Optional, Tuple
+
+INITIAL_RATING = 1000
+K_FACTOR = 32
+
+
+def expected_score(rating_a: float, rating_b: float) -> float:
+  return 1 / (1 + 10 ** ((rating_b - rating_a) / 400))
+
+
+def apply_elo(ratings: Dict[str, float], model_a_id: str, model_b_id: str, winner_model_id: str) -> None:
+  if model_a_id not in ratings:
+    ratings[model_a_id] = INITIAL_RATING
+  if model_b_id not in ratings:
+    ratings[model_b_id] = INITIAL_RATING
+
+  if winner_model_id==model_a_id:
+    score_a, score_b = 1, 0
+  else:
+    score_a, score_b = 0, 1
+
+  exp_a = expected_score(ratings[model_a_id], ratings[model_b_id])
+  exp_b = expected_score(ratings[model_b_id], ratings[model_a_id])
+
+  ratings[model_a_id] += K_FACTOR * (score_a - exp_a)
+  ratings[model_b_id] += K_FACTOR * (score_b - exp_b)
+
+
+def replay_elo(pair_results: List[Tuple[str, str, str]], ratings: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+  """
+  Replay (model_a, model_b, winner) results in order on top of `ratings` and return the updated ratings.
+  Module-level so it can run in a worker process.
+  """
+  ratings = dict(ratings) if ratings else {}
+  for model_a_id, model_b_id, winner_model_id in pair_results:
+    apply_elo(ratings, model_a_id, model_b_id, winner_model_id)
+  return ratings
+
+
+def bradley_terry_ratings(
+    model_ids: List[str],
+    pair_results: List[Tuple[str, str, float, float]],
+    iterations: int = 200,
+    prior: float = 1.0,
+    tolerance: float = 1e-9
+) -> Dict[str, float]:
+  """
+  Fit Bradley-Terry strengths from (model_a, model_b, a_wins, b_wins) totals with the MM algorithm
+  and map them onto the Elo scale (mean rating INITIAL_RATING, 400 points per factor of 10 in odds).
+  Every model also gets `prior` virtual wins and losses against an average opponent so that
+  undefeated or winless models stay finite. Draws should be passed as half a win for each side.
+  """
+  if not model_ids:
+    return {}
+  strengths = {m: 1.0 for m in model_ids}
+  wins = {m: prior for m in model_ids}
+  for a, b, a_wins, b_wins in pair_results:
+    wins[a] = wins.get(a, prior) + a_wins
+    wins[b] = wins.get(b, prior) + b_wins
+    strengths.setdefault(a, 1.0)
+    strengths.setdefault(b, 1.0)
+
+  for _ in range(iterations):
+    denominators = {m: 2 * prior / (strengths[m] + 1.0) for m in strengths}
+    for a, b, a_wins, b_wins in pair_results:
+      n = a_wins + b_wins
+      if n==0:
+        continue
+      d = n / (strengths[a] + strengths[b])
+      denominators[a] += d
+      denominators[b] += d
+    updated = {m: wins[m] / denominators[m] for m in strengths}
+    geo_mean = math.exp(sum(math.log(v) for v in updated.values()) / len(updated))
+    updated = {m: v / geo_mean for m, v in updated.items()}
+    delta = max(abs(updated[m] - strengths[m]) for m in strengths)
+    strengths = updated
+    if delta < tolerance:
+      break
+  return {m: INITIAL_RATING + 400 * math.log10(v) for m, v in strengths.items()}
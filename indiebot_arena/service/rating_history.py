@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+from indiebot_arena.config import RATING_HISTORY_RAW_RETENTION_HOURS, RATING_HISTORY_HOURLY_RETENTION_DAYS
+from indiebot_arena.model.domain_model import RatingSnapshot
+
+# (source resolution, target resolution, how long source snapshots are kept before being downsampled)
+COMPACTION_LEVELS: List[Tuple[str, str, timedelta]] = [
+  ("raw", "hour", timedelta(hours=RATING_HISTORY_RAW_RETENTION_HOURS)),
+  ("hour", "day", timedelta(days=RATING_HISTORY_HOURLY_RETENTION_DAYS)),
+]
+
+
+def bucket_start(timestamp: datetime, resolution: str) -> datetime:
+  if resolution=="hour":
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+  if resolution=="day":
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+  raise ValueError("Resolution must be 'hour' or 'day'.")
+
+
+def compaction_cutoff(now: datetime, retention: timedelta, resolution: str) -> datetime:
+  """Snapshots before the cutoff are downsampled; it is aligned to a bucket so no bucket is split."""
+  return bucket_start(now - retention, resolution)
+
+
+def downsample(snapshots: List[RatingSnapshot], resolution: str) -> List[RatingSnapshot]:
+  """
+  Keep the last snapshot of every bucket. Ratings are a state, so the value at the end of a bucket
+  is what a trend line passes through.
+  """
+  last = {}
+  for snapshot in sorted(snapshots, key=lambda s: s.timestamp):
+    last[bucket_start(snapshot.timestamp, resolution)] = snapshot
+  return [
+    RatingSnapshot(s.language, s.weight_class, s.ratings, resolution, s.timestamp)
+    for s in last.values()
+  ]
@@ -0,0 +1,119 @@
+import logging
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from threading import Condition, Lock
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from indiebot_arena.config import REGISTRATION_JOB_WORKERS, REGISTRATION_JOB_HISTORY
+
+# runner(model_id, revision, progress) -> result; progress(line) appends a line to the job log.
+JobRunner = Callable[[str, str, Callable[[str], None]], Any]
+
+
+class RegistrationJob:
+  def __init__(self, model_id: str, revision: str):
+    self.job_id = uuid.uuid4().hex[:12]
+    self.model_id = model_id
+    self.revision = revision
+    self.status = "queued"
+    self.progress: List[str] = []
+    self.result: Any = None
+    self.error: Optional[str] = None
+    self.created_at = datetime.utcnow()
+    self.finished_at: Optional[datetime] = None
+    self._cond = Condition()
+
+  @property
+  def key(self) -> Tuple[str, str]:
+    return self.model_id, self.revision
+
+  @property
+  def done(self) -> bool:
+    return self.status in ("succeeded", "failed")
+
+  def add_progress(self, line: str) -> None:
+    with self._cond:
+      self.progress.append(line)
+      self._cond.notify_all()
+
+  def _finish(self, status: str, result: Any = None, error: Optional[str] = None) -> None:
+    with self._cond:
+      self.status = status
+      self.result = result
+      self.error = error
+      self.finished_at = datetime.utcnow()
+      self._cond.notify_all()
+
+  def follow(self, poll_sec: float = 1.0) -> Iterator[List[str]]:
+    """
+    Yield a snapshot of the progress lines whenever a line is added, ending once the job is done.
+    """
+    seen = -1
+    while True:
+      with self._cond:
+        while len(self.progress)==seen and not self.done:
+          self._cond.wait(poll_sec)
+        lines = list(self.progress)
+        done = self.done
+      seen = len(lines)
+      yield lines
+      if done:
+        return
+
+
+class RegistrationJobQueue:
+  """
+  Runs registration checks in background workers.
+  A job for a (model_id, revision) that is queued, running or already succeeded is shared instead of
+  started again, so concurrent users testing the same repo revision wait on one model load.
+  Finished jobs are kept in a bounded history (oldest dropped first).
+  """
+
+  def __init__(self, runner: JobRunner, max_workers: int = REGISTRATION_JOB_WORKERS,
+               max_history: int = REGISTRATION_JOB_HISTORY):
+    self.runner = runner
+    self.max_history = max_history
+    self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="registration-job")
+    self._active: Dict[Tuple[str, str], RegistrationJob] = {}
+    self._history: "OrderedDict[str, RegistrationJob]" = OrderedDict()
+    self._lock = Lock()
+
+  def submit(self, model_id: str, revision: str) -> RegistrationJob:
+    key = (model_id, revision)
+    with self._lock:
+      job = self._active.get(key)
+      if job is not None:
+        return job
+      for finished in reversed(self._history.values()):
+        if finished.key==key and finished.status=="succeeded":
+          return finished
+      job = RegistrationJob(model_id, revision)
+      self._active[key] = job
+    self._executor.submit(self._run, job)
+    return job
+
+  def _run(self, job: RegistrationJob) -> None:
+    job.status = "running"
+    try:
+      outcome = {"status": "succeeded", "result": self.runner(job.model_id, job.revision, job.add_progress)}
+    except Exception as e:
+      logging.error(f"Registration job {job.model_id}@{job.revision} failed: {e}")
+      outcome = {"status": "failed", "error": str(e)}
+    # Finished under the queue lock so followers never see a done job missing from the history.
+    with self._lock:
+      job._finish(**outcome)
+      self._active.pop(job.key, None)
+      self._history[job.job_id] = job
+      while len(self._history) > self.max_history:
+        self._history.popitem(last=False)
+
+  def history(self) -> List[RegistrationJob]:
+    """Finished jobs, newest first."""
+    with self._lock:
+      return list(reversed(self._history.values()))
+
+  def active_jobs(self) -> List[RegistrationJob]:
+    with self._lock:
+      return list(self._active.values())
@@ -0,0 +1,101 @@
+import logging
+import time
+from dataclasses import dataclass
+from threading import Thread
+from typing import List, Optional
+
+from indiebot_arena.dao.mongo_dao import MongoDAO
+from indiebot_arena.engine.engine_registry import get_engine
+from indiebot_arena.engine.worker_pool import get_generation_pool
+from indiebot_arena.model.domain_model import Model
+from indiebot_arena.util.cache_manager import clear_hf_cache_if_low_disk_space
+
+
+@dataclass
+class WarmupResult:
+  model_name: str
+  runtime: str
+  weight_class: str
+  download_sec: Optional[float] = None
+  load_sec: Optional[float] = None
+  error: Optional[str] = None
+
+
+class WarmupService:
+  """
+  Warms up the most used models of each weight class after a restart.
+  Weights are downloaded into the local HF cache and, if preload is enabled,
+  kept resident in the engine so the first chat doesn't pay the load latency. With generation
+  workers the models are preloaded on the worker each one is placed on, not in this process.
+  """
+
+  def __init__(self, dao: MongoDAO):
+    self.dao = dao
+    self.last_report: List[WarmupResult] = []
+
+  def select_models(self, language: str, weight_class: str, top_n: int, strategy: str = "battles") -> List[Model]:
+    models = self.dao.find_models(language, weight_class)
+    if strategy=="leaderboard":
+      ranks = {
+        entry.model_id: rank
+        for rank, entry in enumerate(self.dao.find_leaderboard_entries(language, weight_class))
+      }
+      models.sort(key=lambda m: ranks.get(m._id, len(ranks)))
+    elif strategy=="battles":
+      counts = self.dao.count_battles_by_model(language, weight_class)
+      models.sort(key=lambda m: counts.get(m._id, 0), reverse=True)
+    else:
+      raise ValueError("Strategy must be 'battles' or 'leaderboard'.")
+    return models[:top_n]
+
+  def warm_up(
+      self,
+      language: str,
+      weight_classes: List[str],
+      top_n: int,
+      strategy: str = "battles",
+      preload: bool = False
+  ) -> List[WarmupResult]:
+    clear_hf_cache_if_low_disk_space()
+
+    report = []
+    for weight_class in weight_classes:
+      for model in self.select_models(language, weight_class, top_n, strategy):
+        result = WarmupResult(model_name=model.model_name, runtime=model.runtime, weight_class=weight_class)
+        try:
+          engine = get_engine(model.runtime)
+          start = time.perf_counter()
+          engine.prefetch(model.model_name)
+          result.download_sec = round(time.perf_counter() - start, 2)
+          if preload:
+            start = time.perf_counter()
+            pool = get_generation_pool()
+            if pool is not None:
+              pool.preload(model.model_name, model.runtime, model.file_size_gb)
+            else:
+              engine.preload(model.model_name)
+            result.load_sec = round(time.perf_counter() - start, 2)
+        except Exception as e:
+          result.error = str(e)
+          logging.error(f"Error warm_up {model.model_name}: {e}")
+        report.append(result)
+        logging.info(f"Warm-up {weight_class} {model.model_name}: download={result.download_sec}s load={result.load_sec}s")
+    self.last_report = report
+    return report
+
+  def start_background_warm_up(
+      self,
+      language: str,
+      weight_classes: List[str],
+      top_n: int,
+      strategy: str = "battles",
+      preload: bool = False
+  ) -> Thread:
+    t = Thread(
+      target=self.warm_up,
+      args=(language, weight_classes, top_n, strategy, preload),
+      name="model-warmup",
+      daemon=True
+    )
+    t.start()
+    return t
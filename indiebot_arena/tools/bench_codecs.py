@@ -0,0 +1,99 @@
+"""
+Micro-benchmark of the BSON mapping of domain objects (no database needed).
+
+  python -m indiebot_arena.tools.bench_codecs --docs 200000
+
+Compares the previous mapping (plain dataclass, Battle(**doc) and dataclasses.asdict + pop("_id"))
+with the slotted domain classes and DocumentCodec, on battle documents decoded by bson as a cursor would.
+Reports per-document decode/encode time and memory per object.
+"""
+import argparse
+import dataclasses
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+import bson
+from bson import ObjectId
+
+from indiebot_arena.dao.document_codec import BATTLE_CODEC
+from indiebot_arena.model.domain_model import Battle
+
+LegacyBattle = dataclasses.make_dataclass(
+  "LegacyBattle", [(f.name, f.type, f) for f in dataclasses.fields(Battle)]
+)
+
+
+def legacy_encode(battle) -> dict:
+  data = dataclasses.asdict(battle)
+  if data.get("_id") is None:
+    data.pop("_id")
+  return data
+
+
+def make_raw_docs(n: int) -> bytes:
+  model_ids = [ObjectId() for _ in range(20)]
+  start = datetime(2025, 1, 1)
+  return b"".join(
+    bson.encode({
+      "_id": ObjectId(),
+      "language": "ja",
+      "weight_class": "U-5GB",
+      "model_a_id": model_ids[i % 20],
+      "model_b_id": model_ids[(i + 1) % 20],
+      "winner_model_id": model_ids[i % 20],
+      "user_id": f"user{i % 1000:016d}",
+      "vote_timestamp": start + timedelta(seconds=i),
+    })
+    for i in range(n)
+  )
+
+
+def per_doc_us(fn: Callable, items: list, repeats: int) -> float:
+  best = float("inf")
+  for _ in range(repeats):
+    start = time.perf_counter()
+    fn(items)
+    best = min(best, time.perf_counter() - start)
+  return best / len(items) * 1e6
+
+
+def bytes_per_object(factory: Callable[[dict], object], docs: List[dict]) -> float:
+  tracemalloc.start()
+  before = tracemalloc.get_traced_memory()[0]
+  objects = [factory(doc) for doc in docs]
+  after = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+  # The list itself holds one pointer per object.
+  return (after - before) / len(objects) - 8
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--docs", type=int, default=100000)
+  parser.add_argument("--repeats", type=int, default=5)
+  args = parser.parse_args()
+
+  raw = make_raw_docs(args.docs)
+  docs = bson.decode_all(raw)
+  legacy_objects = [LegacyBattle(**doc) for doc in docs]
+  objects = BATTLE_CODEC.decode_many(docs)
+
+  bson_us = per_doc_us(lambda _: bson.decode_all(raw), docs, args.repeats)
+  rows = [
+    ("decode us/doc", per_doc_us(lambda ds: [LegacyBattle(**d) for d in ds], docs, args.repeats),
+     per_doc_us(BATTLE_CODEC.decode_many, docs, args.repeats)),
+    ("encode us/doc", per_doc_us(lambda bs: [legacy_encode(b) for b in bs], legacy_objects, args.repeats),
+     per_doc_us(lambda bs: [BATTLE_CODEC.encode(b) for b in bs], objects, args.repeats)),
+    ("bytes/object", bytes_per_object(lambda d: LegacyBattle(**d), docs),
+     bytes_per_object(BATTLE_CODEC.decode, docs)),
+  ]
+  print(f"{args.docs} battle documents (bson.decode_all: {bson_us:.2f} us/doc)")
+  print(f"{'':<16}{'previous':>10}{'codec':>10}{'ratio':>8}")
+  for name, previous, current in rows:
+    print(f"{name:<16}{previous:>10.2f}{current:>10.2f}{previous / current:>7.1f}x")
+
+
+if __name__=="__main__":
+  main()
@@ -0,0 +1,207 @@
+"""
+Microbenchmark of the generation path with tiny random-initialized models (CPU, no network).
+
+  python -m indiebot_arena.tools.bench_generation
+  python -m indiebot_arena.tools.bench_generation --prompt-words 16 512 --max-new-tokens 32 128 --max-input-tokens 256 4096
+
+A Llama-architecture model with a word-level tokenizer and a Gemma-style chat template is built from a local
+config, so model speed is negligible and the numbers are dominated by our own code.
+For every (prompt length, MAX_NEW_TOKENS, MAX_INPUT_TOKEN_LENGTH) combination it reports, per path:
+  model     model.generate with a bare TextIteratorStreamer (baseline)
+  engine    TransformersEngine.generate (chat template, trimming, streamer thread)
+  bot       ui.battle.stream_bot_message, one side of battle_responses (conversation store, remove_chat_tokens,
+            history snapshots)
+TTFT, tokens/sec and overhead/token = (path time - baseline time) / tokens.
+A second table times the pure-Python steps on synthetic text: apply_chat_template per call (it runs once per
+generation), the others per streamed token.
+"""
+import argparse
+import os
+import tempfile
+import time
+from itertools import product
+from threading import Thread
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from indiebot_arena.engine import transformers_engine
+from indiebot_arena.engine.engine_registry import get_engine, set_engine_override
+
+SPECIAL_TOKENS = ["<pad>", "<bos>", "<eos>", "<unk>", "<start_of_turn>", "<end_of_turn>"]
+CHAT_TEMPLATE = (
+  "{{ bos_token }}{% for message in messages %}"
+  "<start_of_turn>{{ 'model' if message['role'] == 'assistant' else message['role'] }}\n"
+  "{{ message['content'] }}<end_of_turn>\n"
+  "{% endfor %}{% if add_generation_prompt %}<start_of_turn>model\n{% endif %}"
+)
+
+
+def build_tiny_model(out_dir: str, vocab_words: int = 1000, hidden_size: int = 64, num_layers: int = 2,
+                     max_position_embeddings: int = 8192) -> str:
+  """
+  Save a random-initialized Llama model and a word-level tokenizer to out_dir and return the path.
+  EOS is disabled in the generation config so every run produces exactly max_new_tokens tokens.
+  """
+  import torch
+  from tokenizers import Tokenizer, models, pre_tokenizers
+  from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+  vocab = {token: i for i, token in enumerate(SPECIAL_TOKENS)}
+  for i in range(vocab_words):
+    vocab[f"w{i}"] = len(vocab)
+  backend = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+  backend.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+  tokenizer = PreTrainedTokenizerFast(
+    tokenizer_object=backend,
+    bos_token="<bos>", eos_token="<eos>", unk_token="<unk>", pad_token="<pad>",
+    additional_special_tokens=["<start_of_turn>", "<end_of_turn>"],
+  )
+  tokenizer.chat_template = CHAT_TEMPLATE
+  tokenizer.save_pretrained(out_dir)
+
+  torch.manual_seed(0)
+  config = LlamaConfig(
+    vocab_size=len(vocab),
+    hidden_size=hidden_size,
+    intermediate_size=hidden_size * 2,
+    num_hidden_layers=num_layers,
+    num_attention_heads=4,
+    num_key_value_heads=4,
+    max_position_embeddings=max_position_embeddings,
+    bos_token_id=vocab["<bos>"],
+    eos_token_id=vocab["<eos>"],
+    pad_token_id=vocab["<pad>"],
+  )
+  model = LlamaForCausalLM(config)
+  model.generation_config.eos_token_id = None
+  model.save_pretrained(out_dir, safe_serialization=True)
+  return out_dir
+
+
+def make_history(prompt_words: int, vocab_words: int = 1000) -> List[Dict[str, str]]:
+  return [{"role": "user", "content": " ".join(f"w{i % vocab_words}" for i in range(prompt_words))}]
+
+
+def time_stream(stream: Iterator) -> Tuple[float, float, int]:
+  """Returns (ttft, total seconds, number of chunks)."""
+  start = time.perf_counter()
+  ttft = None
+  chunks = 0
+  for _ in stream:
+    if ttft is None:
+      ttft = time.perf_counter() - start
+    chunks += 1
+  total = time.perf_counter() - start
+  return (ttft if ttft is not None else total), total, chunks
+
+
+def baseline_stream(model_dir: str, history: List[Dict[str, str]], max_new_tokens: int) -> Iterator[str]:
+  from transformers import TextIteratorStreamer
+
+  tokenizer, model = get_engine("transformers").get_model(model_dir)
+  input_ids = tokenizer.apply_chat_template(history, add_generation_prompt=True, return_tensors="pt")
+  input_ids = input_ids[:, -transformers_engine.MAX_INPUT_TOKEN_LENGTH:]
+  streamer = TextIteratorStreamer(tokenizer, timeout=20.0, skip_prompt=True, skip_special_tokens=True)
+  t = Thread(target=model.generate, kwargs=dict(input_ids=input_ids, streamer=streamer,
+                                                max_new_tokens=max_new_tokens, do_sample=True, top_p=0.9,
+                                                top_k=50, temperature=0.6, num_beams=1, repetition_penalty=1.2))
+  t.start()
+  yield from streamer
+
+
+def bot_stream(model_dir: str, history: List[Dict[str, str]], max_new_tokens: int) -> Iterator:
+  from indiebot_arena.ui import battle
+
+  session_id = "bench:session"
+  battle.conversation_store.clear(session_id)
+  for message in history:
+    battle.conversation_store.append_message(session_id, "a", message["role"], message["content"])
+  return battle.stream_bot_message(session_id, "a", model_dir, "transformers", max_new_tokens)
+
+
+def engine_stream(model_dir: str, history: List[Dict[str, str]], max_new_tokens: int) -> Iterator[str]:
+  return get_engine("transformers").generate(history, model_dir, max_new_tokens, 0.6, 0.9, 50, 1.2)
+
+
+PATHS: Dict[str, Callable[[str, List[Dict[str, str]], int], Iterator]] = {
+  "model": baseline_stream,
+  "engine": engine_stream,
+  "bot": bot_stream,
+}
+
+
+def run_matrix(model_dir: str, prompt_words: List[int], max_new_tokens: List[int], max_input_tokens: List[int],
+               repeats: int) -> None:
+  print(f"{'prompt':>7}{'new':>6}{'max_in':>8}  {'path':<7}{'ttft ms':>9}{'tok/s':>9}{'overhead us/tok':>17}")
+  for words, new_tokens, max_in in product(prompt_words, max_new_tokens, max_input_tokens):
+    transformers_engine.MAX_INPUT_TOKEN_LENGTH = max_in
+    history = make_history(words)
+    runs = {name: [] for name in PATHS}
+    # Paths are interleaved and the fastest run is kept, which filters out scheduler noise.
+    for _ in range(repeats):
+      for name, path in PATHS.items():
+        runs[name].append(time_stream(path(model_dir, history, new_tokens)))
+    results = {name: (min(r[0] for r in rs), min(r[1] for r in rs)) for name, rs in runs.items()}
+    baseline_total = results["model"][1]
+    for name, (ttft, total) in results.items():
+      overhead = (total - baseline_total) / new_tokens * 1e6 if name!="model" else 0.0
+      print(f"{words:>7}{new_tokens:>6}{max_in:>8}  {name:<7}{ttft * 1000:>9.1f}{new_tokens / total:>9.1f}"
+            f"{overhead:>17.1f}")
+
+
+def run_python_steps(model_dir: str, prompt_words: List[int], max_new_tokens: List[int]) -> None:
+  from indiebot_arena.ui.battle import remove_chat_tokens
+  from indiebot_arena.util.session_store import ConversationStore
+
+  tokenizer, _ = get_engine("transformers").get_model(model_dir)
+  print(f"\n{'prompt':>7}{'new':>6}  {'step':<24}{'us':>10}  per")
+  for words, new_tokens in product(prompt_words, max_new_tokens):
+    history = make_history(words)
+    chunks = ["".join(f"w{j} " for j in range(i + 1)) for i in range(new_tokens)]
+
+    calls = 10
+    start = time.perf_counter()
+    for _ in range(calls):
+      tokenizer.apply_chat_template(history, add_generation_prompt=True, return_tensors="pt")
+    template_us = (time.perf_counter() - start) * 1e6 / calls
+
+    start = time.perf_counter()
+    for text in chunks:
+      remove_chat_tokens(text)
+    clean_us = (time.perf_counter() - start) * 1e6 / new_tokens
+
+    store = ConversationStore()
+    store.append_message("s", "a", "user", history[0]["content"])
+    store.append_message("s", "a", "assistant", "")
+    start = time.perf_counter()
+    for text in chunks:
+      store.update_last_message("s", "a", text)
+    store_us = (time.perf_counter() - start) * 1e6 / new_tokens
+
+    for step, us, per in (("apply_chat_template", template_us, "call"), ("remove_chat_tokens", clean_us, "token"),
+                          ("update_last_message", store_us, "token")):
+      print(f"{words:>7}{new_tokens:>6}  {step:<24}{us:>10.2f}  {per}")
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--prompt-words", type=int, nargs="+", default=[16, 256, 1024])
+  parser.add_argument("--max-new-tokens", type=int, nargs="+", default=[32, 128])
+  parser.add_argument("--max-input-tokens", type=int, nargs="+", default=[512, 4096])
+  parser.add_argument("--repeats", type=int, default=5)
+  parser.add_argument("--hidden-size", type=int, default=64)
+  parser.add_argument("--layers", type=int, default=2)
+  args = parser.parse_args()
+
+  os.environ.setdefault("HF_HUB_OFFLINE", "1")
+  set_engine_override(None)
+  with tempfile.TemporaryDirectory() as model_dir:
+    build_tiny_model(model_dir, hidden_size=args.hidden_size, num_layers=args.layers,
+                     max_position_embeddings=max(args.max_input_tokens) + max(args.max_new_tokens) + 64)
+    get_engine("transformers").preload(model_dir)
+    time_stream(engine_stream(model_dir, make_history(8), 4))  # warm up
+    run_matrix(model_dir, args.prompt_words, args.max_new_tokens, args.max_input_tokens, args.repeats)
+    run_python_steps(model_dir, args.prompt_words, args.max_new_tokens)
+
+
+if __name__=="__main__":
+  main()
@@ -0,0 +1,79 @@
+"""
+Compare cold-load time of the parallel shard loader with from_pretrained on a random-initialized model.
+
+  python -m indiebot_arena.tools.bench_model_load --hidden-size 1024 --layers 16 --max-shard-size 200MB
+  python -m indiebot_arena.tools.bench_model_load --model-path /path/to/local/snapshot
+
+The shard loader is used by TransformersEngine for GPU loads only: on CPU, from_pretrained maps
+checkpoints stored in the target dtype without copying, which the loader can't beat.
+The page cache is not dropped between runs, so the numbers measure our parsing/copy path rather than
+the disk; run against a real snapshot after `echo 3 > /proc/sys/vm/drop_caches` for a truly cold read.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from indiebot_arena.engine.shard_loader import find_shards, load_causal_lm
+
+
+def time_from_pretrained(model_path: str, dtype) -> float:
+  from transformers import AutoModelForCausalLM
+
+  start = time.perf_counter()
+  AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=dtype, device_map="auto", use_safetensors=True,
+                                       local_files_only=True)
+  return time.perf_counter() - start
+
+
+def time_shard_loader(model_path: str, dtype, workers: int) -> float:
+  start = time.perf_counter()
+  loaded = load_causal_lm(model_path, dtype, max_workers=workers)
+  if loaded is None:
+    raise ValueError(f"{model_path} can't be loaded by the shard loader.")
+  elapsed = time.perf_counter() - start
+  print(loaded[1].format())
+  return elapsed
+
+
+def run(model_path: str, workers: list, repeats: int) -> None:
+  import torch
+
+  print(f"{model_path}: {len(find_shards(model_path))} shards")
+  print(f"{'loader':<20}{'best s':>9}")
+  best = min(time_from_pretrained(model_path, torch.bfloat16) for _ in range(repeats))
+  print(f"{'from_pretrained':<20}{best:>9.2f}")
+  for n in workers:
+    best = min(time_shard_loader(model_path, torch.bfloat16, n) for _ in range(repeats))
+    print(f"{f'shards x{n}':<20}{best:>9.2f}")
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--model-path", default=None, help="Local checkpoint directory (default: build a random model)")
+  parser.add_argument("--hidden-size", type=int, default=512)
+  parser.add_argument("--layers", type=int, default=8)
+  parser.add_argument("--max-shard-size", default="50MB")
+  parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+  parser.add_argument("--repeats", type=int, default=3)
+  args = parser.parse_args()
+
+  os.environ.setdefault("HF_HUB_OFFLINE", "1")
+  if args.model_path:
+    run(args.model_path, args.workers, args.repeats)
+    return
+
+  import torch
+  from transformers import AutoModelForCausalLM
+  from indiebot_arena.tools.bench_generation import build_tiny_model
+
+  with tempfile.TemporaryDirectory() as model_dir:
+    build_tiny_model(model_dir, vocab_words=32000, hidden_size=args.hidden_size, num_layers=args.layers)
+    AutoModelForCausalLM.from_pretrained(model_dir, torch_dtype=torch.bfloat16).save_pretrained(
+      model_dir, max_shard_size=args.max_shard_size)
+    os.remove(os.path.join(model_dir, "model.safetensors"))
+    run(model_dir, args.workers, args.repeats)
+
+
+if __name__=="__main__":
+  main()
@@ -0,0 +1,168 @@
+"""
+Export battles, models and leaderboard to Parquet (or Arrow IPC) files for offline analysis.
+
+  python -m indiebot_arena.tools.export_battles --out ./export
+
+Battles are streamed in _id order and written as
+  <out>/battles/language=<ja>/weight_class=<U-5GB>/month=<YYYY-MM>/part-<first _id>.<ext>
+The last exported battle _id is kept in <out>/_export_state.json, so the next run only exports new battles.
+--full exports every battle into a fresh directory that replaces <out>/battles once it is complete.
+Models and leaderboard are small and are rewritten as a full snapshot on every run.
+Requires pyarrow (pip install pyarrow).
+"""
+import argparse
+import json
+import os
+import shutil
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+
+from indiebot_arena.config import MONGO_DB_URI, MONGO_DB_NAME
+from indiebot_arena.dao.mongo_dao import MongoDAO
+from indiebot_arena.model.domain_model import Battle
+
+STATE_FILE = "_export_state.json"
+
+
+def _import_pyarrow():
+  try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+  except ImportError as e:
+    raise ImportError("pyarrow is required for the export. Install it with 'pip install pyarrow'.") from e
+  return pa, pq, feather
+
+
+def load_state(out_dir: str) -> Dict[str, str]:
+  path = os.path.join(out_dir, STATE_FILE)
+  if not os.path.exists(path):
+    return {}
+  with open(path, "r", encoding="utf-8") as f:
+    return json.load(f)
+
+
+def save_state(out_dir: str, state: Dict[str, str]) -> None:
+  path = os.path.join(out_dir, STATE_FILE)
+  tmp_path = path + ".tmp"
+  with open(tmp_path, "w", encoding="utf-8") as f:
+    json.dump(state, f)
+  os.replace(tmp_path, path)
+
+
+def write_table(table, path: str, file_format: str) -> None:
+  _, pq, feather = _import_pyarrow()
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  if file_format=="parquet":
+    pq.write_table(table, path, compression="zstd")
+  else:
+    feather.write_feather(table, path, compression="zstd")
+
+
+def battles_to_table(battles: List[Battle]):
+  pa, _, _ = _import_pyarrow()
+  return pa.table({
+    "battle_id": pa.array([str(b._id) for b in battles], pa.string()),
+    "language": pa.array([b.language for b in battles], pa.string()),
+    "weight_class": pa.array([b.weight_class for b in battles], pa.string()),
+    "model_a_id": pa.array([str(b.model_a_id) for b in battles], pa.string()),
+    "model_b_id": pa.array([str(b.model_b_id) for b in battles], pa.string()),
+    "winner_model_id": pa.array([str(b.winner_model_id) for b in battles], pa.string()),
+    "user_id": pa.array([b.user_id for b in battles], pa.string()),
+    "vote_timestamp": pa.array([b.vote_timestamp for b in battles], pa.timestamp("ms")),
+  })
+
+
+def export_battles(dao: MongoDAO, out_dir: str, file_format: str = "parquet", batch_size: int = 50000,
+                   full: bool = False) -> int:
+  battles_dir = os.path.join(out_dir, "battles")
+  state = {} if full else load_state(out_dir)
+  if state.get("battles_format", file_format)!=file_format:
+    raise ValueError(f"Battles were exported as {state['battles_format']}. Use --full to export them as {file_format}.")
+  state["battles_format"] = file_format
+  after_id: Optional[ObjectId] = ObjectId(state["battles_last_id"]) if state.get("battles_last_id") else None
+  ext = "parquet" if file_format=="parquet" else "arrow"
+  exported = 0
+  if full:
+    # Build the full export next to the old one and swap it in at the end, so no old part files are left behind.
+    target_dir = battles_dir + ".tmp"
+    shutil.rmtree(target_dir, ignore_errors=True)
+  else:
+    target_dir = battles_dir
+
+  for batch in dao.iter_battle_batches(after_id, batch_size):
+    partitions: Dict[tuple, List[Battle]] = defaultdict(list)
+    for battle in batch:
+      month = battle.vote_timestamp.strftime("%Y-%m")
+      partitions[(battle.language, battle.weight_class, month)].append(battle)
+    for (language, weight_class, month), battles in partitions.items():
+      path = os.path.join(target_dir, f"language={language}", f"weight_class={weight_class}",
+                          f"month={month}", f"part-{battles[0]._id}.{ext}")
+      write_table(battles_to_table(battles), path, file_format)
+    exported += len(batch)
+    state["battles_last_id"] = str(batch[-1]._id)
+    if not full:
+      save_state(out_dir, state)
+    print(f"exported {exported} battles (last _id {state['battles_last_id']})")
+
+  if full:
+    shutil.rmtree(battles_dir, ignore_errors=True)
+    if os.path.exists(target_dir):
+      os.replace(target_dir, battles_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    save_state(out_dir, state)
+  return exported
+
+
+def export_snapshots(dao: MongoDAO, out_dir: str, file_format: str = "parquet") -> None:
+  pa, _, _ = _import_pyarrow()
+  ext = "parquet" if file_format=="parquet" else "arrow"
+
+  models = dao.find_all_models()
+  write_table(pa.table({
+    "model_id": pa.array([str(m._id) for m in models], pa.string()),
+    "language": pa.array([m.language for m in models], pa.string()),
+    "weight_class": pa.array([m.weight_class for m in models], pa.string()),
+    "model_name": pa.array([m.model_name for m in models], pa.string()),
+    "runtime": pa.array([m.runtime for m in models], pa.string()),
+    "quantization": pa.array([m.quantization for m in models], pa.string()),
+    "file_format": pa.array([m.file_format for m in models], pa.string()),
+    "file_size_gb": pa.array([m.file_size_gb for m in models], pa.float64()),
+    "description": pa.array([m.description for m in models], pa.string()),
+    "created_at": pa.array([m.created_at for m in models], pa.timestamp("ms")),
+  }), os.path.join(out_dir, "models", f"models.{ext}"), file_format)
+
+  entries = dao.find_all_leaderboard_entries()
+  write_table(pa.table({
+    "model_id": pa.array([str(e.model_id) for e in entries], pa.string()),
+    "language": pa.array([e.language for e in entries], pa.string()),
+    "weight_class": pa.array([e.weight_class for e in entries], pa.string()),
+    "elo_score": pa.array([e.elo_score for e in entries], pa.int64()),
+    "last_updated": pa.array([e.last_updated for e in entries], pa.timestamp("ms")),
+  }), os.path.join(out_dir, "leaderboard", f"leaderboard.{ext}"), file_format)
+  print(f"exported {len(models)} models and {len(entries)} leaderboard entries")
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--out", required=True, help="Output directory")
+  parser.add_argument("--format", choices=["parquet", "arrow"], default="parquet")
+  parser.add_argument("--batch-size", type=int, default=50000)
+  parser.add_argument("--full", action="store_true", help="Ignore the saved state and export all battles again")
+  parser.add_argument("--mongo-uri", default=MONGO_DB_URI)
+  parser.add_argument("--db-name", default=MONGO_DB_NAME)
+  args = parser.parse_args()
+
+  _import_pyarrow()
+  dao = MongoDAO(args.mongo_uri, args.db_name)
+  try:
+    export_battles(dao, args.out, args.format, args.batch_size, args.full)
+    export_snapshots(dao, args.out, args.format)
+  finally:
+    dao.client.close()
+
+
+if __name__=="__main__":
+  main()
@@ -0,0 +1,46 @@
+from collections import defaultdict
+from threading import Lock
+from typing import Dict, List
+
+from indiebot_arena.util.stats import percentile
+
+
+class LatencyStats:
+  """
+  Thread-safe latency samples per operation name, with errors counted separately.
+  """
+
+  def __init__(self):
+    self._samples: Dict[str, List[float]] = defaultdict(list)
+    self._errors: Dict[str, int] = defaultdict(int)
+    self._lock = Lock()
+
+  def add(self, op: str, seconds: float) -> None:
+    with self._lock:
+      self._samples[op].append(seconds)
+
+  def add_error(self, op: str) -> None:
+    with self._lock:
+      self._errors[op] += 1
+
+  def summary(self) -> Dict[str, Dict[str, float]]:
+    with self._lock:
+      ops = sorted(set(self._samples) | set(self._errors))
+      return {
+        op: {
+          "count": len(self._samples[op]),
+          "errors": self._errors[op],
+          "p50": percentile(self._samples[op], 50),
+          "p90": percentile(self._samples[op], 90),
+          "p99": percentile(self._samples[op], 99),
+          "max": max(self._samples[op], default=float("nan")),
+        }
+        for op in ops
+      }
+
+  def format_report(self) -> str:
+    lines = [f"{'operation':<20}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+    for op, s in self.summary().items():
+      lines.append(f"{op:<20}{s['count']:>8}{s['errors']:>8}{s['p50'] * 1000:>10.1f}{s['p90'] * 1000:>10.1f}"
+                   f"{s['p99'] * 1000:>10.1f}{s['max'] * 1000:>10.1f}")
+    return "\n".join(lines)
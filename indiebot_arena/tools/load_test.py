@@ -0,0 +1,117 @@
+"""
+Drive N concurrent battle sessions against a running arena through the Gradio queue.
+
+  GENERATION_BACKEND=fake ADMISSION_CONTROL_ENABLED=False python app.py
+  python -m indiebot_arena.tools.load_test http://127.0.0.1:7860 --sessions 20 --battles 5
+
+Every session is its own Gradio client (own session hash) and loops over:
+submit a message, stream both bots (one paired job), vote, reset.
+Reported per operation:
+  queue_wait   time from submitting the battle job until the queue starts processing it
+  ttft         time from submitting the battle job until its first streamed chunk
+  generation   time from submitting the battle job until both sides finished
+  submit/vote  round-trip latency of the message submit and vote handlers
+Model pairs are sampled from the models registered for --language/--weight-class unless --models is given.
+"""
+import argparse
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from indiebot_arena.config import MONGO_DB_URI, MONGO_DB_NAME, LANGUAGE
+from indiebot_arena.tools.latency_stats import LatencyStats
+
+PROCESSING_CODES = ("PROCESSING", "ITERATING", "PROGRESS", "FINISHED")
+
+
+def run_battle_job(client, model_a: str, model_b: str, weight_class: str, stats: LatencyStats) -> None:
+  submitted = time.monotonic()
+  job = client.submit(model_a, model_b, weight_class, api_name="/battle_bots")
+  started = None
+  first_chunk = None
+  while not job.done():
+    now = time.monotonic()
+    if started is None and job.status().code.name in PROCESSING_CODES:
+      started = now
+    if first_chunk is None and job.outputs():
+      first_chunk = now
+    time.sleep(0.005)
+  job.result()
+  finished = time.monotonic()
+  stats.add("queue_wait", (started or finished) - submitted)
+  stats.add("ttft", (first_chunk or finished) - submitted)
+  stats.add("generation", finished - submitted)
+
+
+def timed(stats: LatencyStats, op: str, fn, *args, **kwargs):
+  start = time.monotonic()
+  try:
+    result = fn(*args, **kwargs)
+  except Exception:
+    stats.add_error(op)
+    raise
+  stats.add(op, time.monotonic() - start)
+  return result
+
+
+def run_session(url: str, models: List[str], weight_class: str, battles: int, think_time: float,
+                stats: LatencyStats, seed: int) -> None:
+  from gradio_client import Client
+
+  rng = random.Random(seed)
+  client = Client(url, verbose=False)
+  for i in range(battles):
+    model_a, model_b = rng.sample(models, 2)
+    try:
+      timed(stats, "submit", client.predict, f"load test message {seed}-{i}", [], [],
+            api_name="/battle_submit")
+      run_battle_job(client, model_a, model_b, weight_class, stats)
+      vote_api = "/battle_vote_a" if rng.random() < 0.5 else "/battle_vote_b"
+      timed(stats, "vote", client.predict, weight_class, model_a, model_b, api_name=vote_api)
+      client.predict(weight_class, api_name="/battle_reset")
+    except Exception:
+      stats.add_error("battle")
+    if think_time > 0:
+      time.sleep(rng.uniform(0, 2 * think_time))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("url", help="URL of the running app")
+  parser.add_argument("--sessions", type=int, default=10)
+  parser.add_argument("--battles", type=int, default=3, help="Battles per session")
+  parser.add_argument("--think-time", type=float, default=1.0, help="Mean pause between battles in seconds")
+  parser.add_argument("--language", default=LANGUAGE)
+  parser.add_argument("--weight-class", default="U-5GB")
+  parser.add_argument("--models", nargs="*", default=None, help="Model names to pair (default: registered models)")
+  parser.add_argument("--mongo-uri", default=MONGO_DB_URI)
+  parser.add_argument("--db-name", default=MONGO_DB_NAME)
+  args = parser.parse_args()
+
+  models = args.models
+  if not models:
+    from indiebot_arena.dao.mongo_dao import MongoDAO
+
+    dao = MongoDAO(args.mongo_uri, args.db_name)
+    models = [m.model_name for m in dao.find_models(args.language, args.weight_class)]
+    dao.client.close()
+  if len(models) < 2:
+    parser.error("Need at least 2 models.")
+
+  stats = LatencyStats()
+  started = time.monotonic()
+  with ThreadPoolExecutor(max_workers=args.sessions) as sessions:
+    futures = [
+      sessions.submit(run_session, args.url, models, args.weight_class, args.battles, args.think_time, stats, seed)
+      for seed in range(args.sessions)
+    ]
+    for future in futures:
+      future.result()
+  elapsed = time.monotonic() - started
+  print(f"{args.sessions} sessions x {args.battles} battles in {elapsed:.1f}s")
+  print(stats.format_report())
+
+
+if __name__=="__main__":
+  main()
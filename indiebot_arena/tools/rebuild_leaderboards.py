@@ -0,0 +1,43 @@
+"""
+Rebuild the leaderboards of all divisions from the full battle history.
+
+  python -m indiebot_arena.tools.rebuild_leaderboards
+  python -m indiebot_arena.tools.rebuild_leaderboards --division ja:U-5GB --division en:U-10GB
+
+Battles are read once for all divisions and every division is replayed in parallel worker processes.
+"""
+import argparse
+import logging
+
+from indiebot_arena.config import MONGO_DB_URI, MONGO_DB_NAME, RECOMPUTE_MAX_WORKERS
+from indiebot_arena.dao.mongo_dao import MongoDAO
+from indiebot_arena.service.arena_service import ArenaService, RecomputeProgress
+
+
+def print_progress(p: RecomputeProgress) -> None:
+  print(f"[{p.done}/{p.total}] {p.language}/{p.weight_class}: {p.battles} battles ({p.elapsed_sec}s)")
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--division", action="append", default=None,
+                      help="language:weight_class to rebuild (repeatable, default: all divisions with models)")
+  parser.add_argument("--workers", type=int, default=RECOMPUTE_MAX_WORKERS, help="0 = one per division")
+  parser.add_argument("--mongo-uri", default=MONGO_DB_URI)
+  parser.add_argument("--db-name", default=MONGO_DB_NAME)
+  args = parser.parse_args()
+
+  divisions = [tuple(d.split(":", 1)) for d in args.division] if args.division else None
+  dao = MongoDAO(args.mongo_uri, args.db_name)
+  try:
+    results = ArenaService(dao).update_all_leaderboards(divisions, args.workers, print_progress)
+    for (language, weight_class), updated in results.items():
+      if not updated:
+        print(f"{language}/{weight_class}: no models, skipped")
+  finally:
+    dao.client.close()
+
+
+if __name__=="__main__":
+  logging.basicConfig(level=logging.INFO)
+  main()
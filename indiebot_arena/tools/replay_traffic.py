@@ -0,0 +1,146 @@
+"""
+Replay a recorded traffic log against a scratch database with a fake generation backend.
+
+  TRAFFIC_RECORD_PATH=traffic.jsonl python app.py          # record
+  python -m indiebot_arena.tools.replay_traffic traffic.jsonl --speedup 10
+
+Events are started at their recorded offsets divided by --speedup (0 = as fast as possible) on a thread pool:
+  chat         ui.battle.stream_bot_message, streamed by FakeEngine (TTFT is reported as chat_ttft)
+  vote         the battle tab's vote handler: ArenaService.record_battle + update_leaderboard
+  leaderboard  the leaderboard tab's data load: get_leaderboard + get_model per entry
+  register     ArenaService.register_model + update_leaderboard
+Models that only appear in votes are registered before the replay starts.
+"start_lag" reports how late events started against the schedule; a growing lag means the replay saturated.
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from indiebot_arena.config import MONGO_DB_URI, MONGO_DB_NAME
+from indiebot_arena.dao.battle_write_buffer import BattleWriteBuffer
+from indiebot_arena.dao.mongo_dao import MongoDAO
+from indiebot_arena.engine.engine_registry import set_engine_override
+from indiebot_arena.engine.fake_engine import FakeEngine
+from indiebot_arena.service.arena_service import ArenaService
+from indiebot_arena.tools.latency_stats import LatencyStats
+from indiebot_arena.util.traffic_recorder import read_events
+
+
+class TrafficReplayer:
+  def __init__(self, arena_service: ArenaService, stats: LatencyStats):
+    self.arena_service = arena_service
+    self.stats = stats
+
+  def prepare_models(self, events: List[Dict]) -> int:
+    registered_in_log = {(e["l"], e["w"], e["m"]) for e in events if e["op"]=="register"}
+    needed = set()
+    for e in events:
+      if e["op"]=="vote":
+        needed.update({(e["l"], e["w"], e["a"]), (e["l"], e["w"], e["b"])})
+    count = 0
+    for language, weight_class, model_name in sorted(needed - registered_in_log):
+      if self.arena_service.get_one_model(language, weight_class, model_name) is None:
+        self.arena_service.register_model(language, weight_class, model_name, "transformers", "none", "safetensors", 1.0)
+        count += 1
+    return count
+
+  def run_event(self, event: Dict, scheduled: float) -> None:
+    op = event["op"]
+    self.stats.add("start_lag", max(0.0, time.monotonic() - scheduled))
+    start = time.monotonic()
+    try:
+      getattr(self, f"_{op}")(event, start)
+      self.stats.add(op, time.monotonic() - start)
+    except Exception:
+      self.stats.add_error(op)
+
+  def _chat(self, event: Dict, start: float) -> None:
+    from indiebot_arena.ui.battle import conversation_store, stream_bot_message
+
+    session_id = f"replay:{event['s']}"
+    history = conversation_store.get_history(session_id, event["slot"])
+    if not history or history[-1]["role"]!="user":
+      conversation_store.append_message(session_id, event["slot"], "user", "x" * event["n"])
+    first = None
+    for _ in stream_bot_message(session_id, event["slot"], event["m"], event["r"]):
+      if first is None:
+        first = time.monotonic()
+        self.stats.add("chat_ttft", first - start)
+
+  def _vote(self, event: Dict, start: float) -> None:
+    language, weight_class = event["l"], event["w"]
+    model_a = self.arena_service.get_one_model(language, weight_class, event["a"])
+    model_b = self.arena_service.get_one_model(language, weight_class, event["b"])
+    winner = model_a if event["v"]=="a" else model_b
+    self.arena_service.record_battle(language, weight_class, model_a._id, model_b._id, winner._id, event["u"])
+    if self.arena_service.battle_buffer is None:
+      self.arena_service.update_leaderboard(language, weight_class)
+
+  def _leaderboard(self, event: Dict, start: float) -> None:
+    for entry in self.arena_service.get_leaderboard(event["l"], event["w"]):
+      self.arena_service.dao.get_model(entry.model_id)
+
+  def _register(self, event: Dict, start: float) -> None:
+    self.arena_service.register_model(event["l"], event["w"], event["m"], event["r"], event["q"], event["f"], event["g"])
+    self.arena_service.update_leaderboard(event["l"], event["w"])
+
+  def replay(self, events: List[Dict], speedup: float, workers: int) -> float:
+    events = sorted(events, key=lambda e: e["t"])
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+      for event in events:
+        scheduled = started + event["t"] / speedup if speedup > 0 else time.monotonic()
+        delay = scheduled - time.monotonic()
+        if delay > 0:
+          time.sleep(delay)
+        executor.submit(self.run_event, event, scheduled)
+    return time.monotonic() - started
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("log", help="Traffic log recorded with TRAFFIC_RECORD_PATH")
+  parser.add_argument("--speedup", type=float, default=1.0, help="Replay speed factor (0 = as fast as possible)")
+  parser.add_argument("--workers", type=int, default=32)
+  parser.add_argument("--tokens-per-sec", type=float, default=50.0)
+  parser.add_argument("--first-token-latency", type=float, default=0.2)
+  parser.add_argument("--rating-mode", choices=["elo", "aggregate"], default=None)
+  parser.add_argument("--write-buffer", action="store_true", help="Record votes through a BattleWriteBuffer")
+  parser.add_argument("--mongo-uri", default=MONGO_DB_URI)
+  parser.add_argument("--db-name", default="indiebot_replay", help="Scratch database, cleared before the replay")
+  args = parser.parse_args()
+
+  if args.db_name==MONGO_DB_NAME:
+    parser.error("--db-name must not be the production database.")
+
+  events = list(read_events(args.log))
+  dao = MongoDAO(args.mongo_uri, args.db_name)
+  for collection in (dao.models_collection, dao.battles_collection, dao.leaderboard_collection,
+                     dao.rating_checkpoints_collection, dao.rating_history_collection):
+    collection.delete_many({})
+  dao.create_indexes()
+  set_engine_override(FakeEngine(args.tokens_per_sec, args.first_token_latency))
+
+  battle_buffer = BattleWriteBuffer(dao) if args.write_buffer else None
+  arena_service = ArenaService(dao, battle_buffer)
+  if args.rating_mode:
+    arena_service.rating_mode = args.rating_mode
+  stats = LatencyStats()
+  replayer = TrafficReplayer(arena_service, stats)
+  try:
+    prepared = replayer.prepare_models(events)
+    elapsed = replayer.replay(events, args.speedup, args.workers)
+  finally:
+    if battle_buffer:
+      battle_buffer.close()
+    dao.client.close()
+
+  recorded = max((e["t"] for e in events), default=0.0)
+  print(f"replayed {len(events)} events ({prepared} models pre-registered) in {elapsed:.1f}s "
+        f"(recorded span {recorded:.1f}s, speedup {args.speedup})")
+  print(stats.format_report())
+
+
+if __name__=="__main__":
+  main()
@@ -0,0 +1,133 @@
+"""
+Simulate votes-to-convergence of uniform vs adaptive pair sampling on synthetic models.
+
+  python -m indiebot_arena.tools.simulate_matchmaking --models 12 --trials 20
+
+Every model gets a hidden true rating, votes are drawn from the Elo win probability of the true ratings,
+and the leaderboard ratings are updated with the same Elo rule as ArenaService.update_leaderboard.
+Two numbers are reported per strategy:
+  - votes until the rank correlation with the true ratings stays above --target
+  - votes until a model added after --warmup votes stays within one rank of its true rank
+"""
+import argparse
+import random
+import statistics
+from typing import Callable, Dict, List, Optional, Tuple
+
+from indiebot_arena.service.matchmaking_service import pair_weights, sample_pair
+from indiebot_arena.service.rating import INITIAL_RATING, apply_elo, expected_score
+
+Sampler = Callable[[List[str], Dict[str, int], Dict[str, float], random.Random], Tuple[str, str]]
+
+
+def uniform_sampler(model_ids, battle_counts, ratings, rng) -> Tuple[str, str]:
+  a, b = rng.sample(model_ids, 2)
+  return a, b
+
+
+def adaptive_sampler(model_ids, battle_counts, ratings, rng) -> Tuple[str, str]:
+  return sample_pair(pair_weights(model_ids, battle_counts, ratings), rng)
+
+
+def ranks(values: Dict[str, float]) -> Dict[str, int]:
+  ordered = sorted(values, key=lambda k: values[k], reverse=True)
+  return {model_id: rank for rank, model_id in enumerate(ordered)}
+
+
+def spearman(estimated: Dict[str, float], truth: Dict[str, float]) -> float:
+  n = len(truth)
+  est_ranks, true_ranks = ranks(estimated), ranks(truth)
+  d2 = sum((est_ranks[m] - true_ranks[m]) ** 2 for m in truth)
+  return 1 - 6 * d2 / (n * (n ** 2 - 1))
+
+
+def simulate(
+    sampler: Sampler,
+    true_ratings: Dict[str, float],
+    rng: random.Random,
+    target: float,
+    stable_votes: int,
+    max_votes: int,
+    new_model: Optional[Tuple[str, float]] = None,
+    warmup: int = 0
+) -> Tuple[Optional[int], Optional[int]]:
+  truth = dict(true_ratings)
+  model_ids = list(truth.keys())
+  ratings = {m: float(INITIAL_RATING) for m in model_ids}
+  counts = {m: 0 for m in model_ids}
+  converged_at = None
+  new_model_at = None
+  streak = 0
+  new_streak = 0
+
+  for vote in range(1, max_votes + 1):
+    if new_model and vote==warmup + 1:
+      truth[new_model[0]] = new_model[1]
+      model_ids.append(new_model[0])
+      ratings[new_model[0]] = float(INITIAL_RATING)
+      counts[new_model[0]] = 0
+
+    a, b = sampler(model_ids, counts, ratings, rng)
+    winner = a if rng.random() < expected_score(truth[a], truth[b]) else b
+    apply_elo(ratings, a, b, winner)
+    counts[a] += 1
+    counts[b] += 1
+
+    if converged_at is None and vote > warmup:
+      streak = streak + 1 if spearman(ratings, truth) >= target else 0
+      if streak >= stable_votes:
+        converged_at = vote - warmup - stable_votes + 1
+    if new_model and new_model_at is None and vote > warmup:
+      est_rank, true_rank = ranks(ratings)[new_model[0]], ranks(truth)[new_model[0]]
+      new_streak = new_streak + 1 if abs(est_rank - true_rank) <= 1 else 0
+      if new_streak >= stable_votes:
+        new_model_at = vote - warmup - stable_votes + 1
+    if converged_at is not None and (new_model is None or new_model_at is not None):
+      break
+  return converged_at, new_model_at
+
+
+def summarize(values: List[Optional[int]], max_votes: int) -> str:
+  done = [v for v in values if v is not None]
+  if not done:
+    return f"not converged within {max_votes} votes"
+  return (f"median={statistics.median(done):.0f} mean={statistics.mean(done):.0f} "
+          f"converged={len(done)}/{len(values)}")
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--models", type=int, default=10)
+  parser.add_argument("--spread", type=float, default=300.0, help="Std-dev of the true ratings")
+  parser.add_argument("--trials", type=int, default=20)
+  parser.add_argument("--target", type=float, default=0.9, help="Spearman rank correlation to reach")
+  parser.add_argument("--stable-votes", type=int, default=50)
+  parser.add_argument("--max-votes", type=int, default=20000)
+  parser.add_argument("--warmup", type=int, default=2000, help="Votes before a new model is added")
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+
+  samplers = {"uniform": uniform_sampler, "adaptive": adaptive_sampler}
+  results = {name: ([], []) for name in samplers}
+  for trial in range(args.trials):
+    setup_rng = random.Random(args.seed + trial)
+    true_ratings = {f"model{i}": setup_rng.gauss(INITIAL_RATING, args.spread) for i in range(args.models)}
+    new_model = ("new_model", setup_rng.gauss(INITIAL_RATING, args.spread))
+    for name, sampler in samplers.items():
+      rng = random.Random(args.seed * 1000 + trial)
+      converged, _ = simulate(sampler, true_ratings, rng, args.target, args.stable_votes, args.max_votes)
+      rng = random.Random(args.seed * 1000 + trial)
+      _, new_model_votes = simulate(sampler, true_ratings, rng, args.target, args.stable_votes, args.max_votes,
+                                    new_model, args.warmup)
+      results[name][0].append(converged)
+      results[name][1].append(new_model_votes)
+
+  print(f"{args.models} models, {args.trials} trials, target spearman >= {args.target}")
+  for name, (converged, new_model_votes) in results.items():
+    print(f"[{name}]")
+    print(f"  votes to converge:           {summarize(converged, args.max_votes)}")
+    print(f"  votes to place a new model:  {summarize(new_model_votes, args.max_votes)}")
+
+
+if __name__=="__main__":
+  main()
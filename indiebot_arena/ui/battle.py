@@ -1,133 +1,255 @@
 import hashlib
+import logging
+import math
 import os
 import random
 import re
+import time
 from collections.abc import Iterator
-from threading import Thread
+from threading import Lock
+from typing import Any, Dict
 
 import gradio as gr
-import spaces
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, TextIteratorStreamer
 
-from indiebot_arena.config import MODEL_SELECTION_MODE, MAX_INPUT_TOKEN_LENGTH, MAX_NEW_TOKENS
+from indiebot_arena.config import MODEL_SELECTION_MODE, MAX_NEW_TOKENS, ADMISSION_CONTROL_ENABLED
+from indiebot_arena.engine.engine_registry import get_engine
+from indiebot_arena.engine.worker_pool import get_generation_pool
 from indiebot_arena.service.arena_service import ArenaService
+from indiebot_arena.service.matchmaking_service import AdaptivePairSampler
 from indiebot_arena.util.cache_manager import clear_hf_cache_if_low_disk_space
+from indiebot_arena.util.generation_budget import GenerationBudget
+from indiebot_arena.util.gpu import gpu
+from indiebot_arena.util.paired_battle import PairedBattleExecutor
+from indiebot_arena.util.rate_limiter import AdmissionController
+from indiebot_arena.util.session_store import ConversationStore
+from indiebot_arena.util.traffic_recorder import record_event, short_hash
+from indiebot_arena.util.tracing import traced
 
 DESCRIPTION = "### 💬 チャットバトル"
 
 base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
 docs_path = os.path.join(base_dir, "docs", "battle_header.md")
 
+conversation_store = ConversationStore()
+admission_controller = AdmissionController() if ADMISSION_CONTROL_ENABLED else None
+paired_executor = PairedBattleExecutor()
+generation_budget = GenerationBudget()
+# session_id -> seconds the next queued chat job of the session waits before starting (admission control)
+admission_delays: Dict[str, float] = {}
+admission_delays_lock = Lock()
+
 
 def remove_chat_tokens(text: str) -> str:
   pattern = re.compile(r'</?(?:start_of_turn|end_of_turn)>')
   return pattern.sub('', text).strip()
 
 
-@spaces.GPU(duration=30)
+@gpu(duration=30)
 def generate(chat_history: list,
              model_id: str,
              max_new_tokens: int = MAX_NEW_TOKENS,
              temperature: float = 0.6,
              top_p: float = 0.9,
              top_k: int = 50,
-             repetition_penalty: float = 1.2) -> Iterator[str]:
-  tokenizer = AutoTokenizer.from_pretrained(model_id)
-  model = AutoModelForCausalLM.from_pretrained(
-    model_id,
-    device_map="auto",
-    torch_dtype=torch.bfloat16,
-    use_safetensors=True
-  )
-  model.eval()
-
-  input_ids = tokenizer.apply_chat_template(chat_history, add_generation_prompt=True, return_tensors="pt")
-  if input_ids.shape[1] > MAX_INPUT_TOKEN_LENGTH:
-    input_ids = input_ids[:, -MAX_INPUT_TOKEN_LENGTH:]
-    gr.Warning(f"Trimmed input from conversation as it was longer than {MAX_INPUT_TOKEN_LENGTH} tokens.")
-  input_ids = input_ids.to(model.device)
-
-  streamer = TextIteratorStreamer(tokenizer, timeout=20.0, skip_prompt=True, skip_special_tokens=True)
-  generate_kwargs = dict(
-    {"input_ids": input_ids},
-    streamer=streamer,
-    max_new_tokens=max_new_tokens,
-    do_sample=True,
-    top_p=top_p,
-    top_k=top_k,
-    temperature=temperature,
-    num_beams=1,
-    repetition_penalty=repetition_penalty,
-  )
-  t = Thread(target=model.generate, kwargs=generate_kwargs)
-  t.start()
+             repetition_penalty: float = 1.2,
+             runtime: str = "transformers",
+             file_size_gb: float = 0.0) -> Iterator[str]:
+  pool = get_generation_pool()
+  if pool is not None:
+    yield from pool.generate(chat_history, model_id, max_new_tokens, temperature, top_p, top_k, repetition_penalty,
+                             runtime, file_size_gb)
+    return
+  engine = get_engine(runtime)
+  yield from engine.generate(chat_history, model_id, max_new_tokens, temperature, top_p, top_k, repetition_penalty)
+
+
+def generate_anonymous_user_id(request: gr.Request):
+  user_ip = request.headers.get('x-forwarded-for')
+  if user_ip:
+    user_id = "indiebot:" + user_ip
+    hashed_user_id = hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:16]
+    return hashed_user_id
+  else:
+    return "anonymous"
+
+
+def admission_key(request: gr.Request) -> str:
+  """Rate limit key: the client address, or the Gradio session when there is no x-forwarded-for header."""
+  if request.headers.get('x-forwarded-for'):
+    return generate_anonymous_user_id(request)
+  return f"session:{request.session_hash}"
+
+
+def admit_chat_request(request: gr.Request, session_id: str, cost: int = 1) -> None:
+  """
+  Admit a chat submission. Runs in the non-queued submit handler, so an admitted request's delay isn't slept
+  here but by start_generation() in the queued job.
+  """
+  if admission_controller is None:
+    return
+  admitted, wait_sec = admission_controller.admit(admission_key(request), cost)
+  if not admitted:
+    raise gr.Error(f"リクエストが多すぎます。{math.ceil(wait_sec)}秒ほど待ってから再度お試しください。")
+  with admission_delays_lock:
+    if wait_sec > 0:
+      admission_delays[session_id] = wait_sec
+    else:
+      admission_delays.pop(session_id, None)
+
+
+def get_session_id(request: gr.Request, namespace: str) -> str:
+  return f"{namespace}:{request.session_hash or 'anonymous'}"
+
+
+def stream_bot_message(session_id, slot, model_id, runtime="transformers", max_new_tokens=MAX_NEW_TOKENS,
+                       file_size_gb=0.0, max_history_messages=None):
+  conv_history = conversation_store.get_history(session_id, slot)
+  if max_history_messages:
+    conv_history = conv_history[-max_history_messages:]
+  record_event("chat", s=short_hash(session_id), slot=slot, m=model_id, r=runtime,
+               n=len(conv_history[-1]["content"]) if conv_history else 0, turns=len(conv_history))
+  conversation_store.append_message(session_id, slot, "assistant", "")
+  try:
+    for text in generate(conv_history, model_id, max_new_tokens=max_new_tokens, runtime=runtime,
+                         file_size_gb=file_size_gb):
+      cleaned_text = remove_chat_tokens(text)
+      yield conversation_store.update_last_message(session_id, slot, cleaned_text)
+  except BaseException:
+    # Failed or cancelled before any text: don't leave an empty reply in the conversation.
+    conversation_store.discard_empty_reply(session_id, slot)
+    raise
 
-  outputs = []
-  for text in streamer:
-    outputs.append(text)
-    yield "".join(outputs)
 
+def restore_conversation(session_id, shown_histories):
+  """Rebuild conversations the store lost (idle or LRU eviction) from what the chatbots still show."""
+  restored = [conversation_store.restore(session_id, slot, shown or []) for slot, shown in shown_histories.items()]
+  if any(restored):
+    logging.info(f"Restored the evicted conversation of {short_hash(session_id)} from the client.")
 
-def update_user_message(user_message, history_a, history_b):
+
+def update_user_message(user_message, shown_a, shown_b, request: gr.Request):
+  session_id = get_session_id(request, "battle")
+  # Both sides of a battle are queued, so a battle submission costs two tokens.
+  admit_chat_request(request, session_id, cost=2)
   clear_hf_cache_if_low_disk_space()
+  restore_conversation(session_id, {"a": shown_a, "b": shown_b})
 
-  new_history_a = history_a + [{"role": "user", "content": user_message}]
-  new_history_b = history_b + [{"role": "user", "content": user_message}]
+  generation_budget.submitted(session_id)
+  new_history_a = conversation_store.append_message(session_id, "a", "user", user_message)
+  new_history_b = conversation_store.append_message(session_id, "b", "user", user_message)
   return "", new_history_a, new_history_b, gr.update(interactive=False)
 
 
-def bot1_response(history, model_id):
-  history = history.copy()
-  history.append({"role": "assistant", "content": ""})
-  conv_history = history[:-1]
-  for text in generate(conv_history, model_id):
-    cleaned_text = remove_chat_tokens(text)
-    history[-1]["content"] = cleaned_text
-    yield history, gr.update(interactive=True), gr.update(interactive=True)
+def release_session(session_id: str) -> None:
+  """Forget a closed tab: its queued submission, its admission delay and its conversation."""
+  generation_budget.cancelled(session_id)
+  with admission_delays_lock:
+    admission_delays.pop(session_id, None)
+  conversation_store.clear(session_id)
+
+
+def release_battle_session(request: gr.Request):
+  release_session(get_session_id(request, "battle"))
+
+
+def battle_responses(session_id, model_a, model_b, runtime_a="transformers", runtime_b="transformers",
+                     max_new_tokens=MAX_NEW_TOKENS, file_size_gb_a=0.0, file_size_gb_b=0.0, max_history_messages=None):
+  """Stream both sides of a battle as one queued job; yields (history_a, history_b) as either side advances."""
+  history_a = conversation_store.get_history(session_id, "a")
+  history_b = conversation_store.get_history(session_id, "b")
+  pairs = paired_executor.run(
+    lambda: stream_bot_message(session_id, "a", model_a, runtime_a, max_new_tokens, file_size_gb_a,
+                               max_history_messages),
+    lambda: stream_bot_message(session_id, "b", model_b, runtime_b, max_new_tokens, file_size_gb_b,
+                               max_history_messages),
+  )
+  for latest_a, latest_b in pairs:
+    history_a = latest_a if latest_a is not None else history_a
+    history_b = latest_b if latest_b is not None else history_b
+    yield history_a, history_b
+
+
+def start_generation(session_id):
+  """Return the generation budget for a queued chat job that is starting, telling the user if it is reduced."""
+  with admission_delays_lock:
+    delay = admission_delays.pop(session_id, 0.0)
+  if delay > 0:
+    time.sleep(delay)
+  budget = generation_budget.started(session_id)
+  if budget.notice:
+    gr.Info(budget.notice)
+  return budget
 
 
-def bot2_response(history, model_id):
-  history = history.copy()
-  history.append({"role": "assistant", "content": ""})
-  conv_history = history[:-1]
-  for text in generate(conv_history, model_id):
-    cleaned_text = remove_chat_tokens(text)
-    history[-1]["content"] = cleaned_text
-    yield history, gr.update(interactive=True), gr.update(interactive=True)
+def generation_metrics() -> Dict[str, Any]:
+  pool = get_generation_pool()
+  return {
+    "budget": generation_budget.get_metrics(),
+    "paired_battles": paired_executor.get_metrics(),
+    "workers": pool.status() if pool is not None else [],
+  }
 
 
 def get_random_values(model_labels):
-  if MODEL_SELECTION_MODE=="random":
+  if MODEL_SELECTION_MODE in ("random", "adaptive"):
     return random.sample(model_labels, 2)
   if MODEL_SELECTION_MODE=="manual":
     return model_labels[0], model_labels[0]
 
 
-def battle_content(dao, language):
-  arena_service = ArenaService(dao)
+def battle_content(dao, language, battle_buffer=None, invalidation_bus=None):
+  pair_sampler = AdaptivePairSampler(dao) if MODEL_SELECTION_MODE=="adaptive" else None
+  if pair_sampler is not None and invalidation_bus is not None:
+    invalidation_bus.subscribe(["models", "leaderboard"],
+                               lambda event: pair_sampler.invalidate(event.language, event.weight_class))
+  arena_service = ArenaService(dao, battle_buffer, pair_sampler)
   default_weight = "U-5GB"
   initial_models = arena_service.get_model_dropdown_list(language, default_weight)
   initial_choices = [m["label"] for m in initial_models]
   initial_value_a, initial_value_b = get_random_values(initial_choices)
-  dropdown_visible = False if MODEL_SELECTION_MODE=="random" else True
+  dropdown_visible = True if MODEL_SELECTION_MODE=="manual" else False
+
+  def select_pair(weight_class, model_labels):
+    if pair_sampler is None:
+      return get_random_values(model_labels)
+    model_a, model_b = arena_service.get_two_adaptive_models(language, weight_class)
+    return model_a.model_name, model_b.model_name
 
   def fetch_model_dropdown(weight_class):
     models = arena_service.get_model_dropdown_list(language, weight_class)
     model_labels = [m["label"] for m in models]
-    value_a, value_b = get_random_values(model_labels)
+    value_a, value_b = select_pair(weight_class, model_labels)
     update_obj_a = gr.update(choices=model_labels, value=value_a)
     update_obj_b = gr.update(choices=model_labels, value=value_b)
     return update_obj_a, update_obj_b, model_labels
 
+  def get_model_spec(weight_class, model_name):
+    model = arena_service.get_one_model(language, weight_class, model_name)
+    return (model.runtime, model.file_size_gb) if model else ("transformers", 0.0)
+
+  def battle_responses_for_models(model_name_a, model_name_b, weight_class, request: gr.Request):
+    session_id = get_session_id(request, "battle")
+    budget = start_generation(session_id)
+    runtime_a, file_size_gb_a = get_model_spec(weight_class, model_name_a)
+    runtime_b, file_size_gb_b = get_model_spec(weight_class, model_name_b)
+    responses = battle_responses(session_id, model_name_a, model_name_b, runtime_a, runtime_b, budget.max_new_tokens,
+                                 file_size_gb_a, file_size_gb_b, budget.max_history_messages)
+    for history_a, history_b in responses:
+      yield history_a, history_b, gr.update(interactive=True), gr.update(interactive=True)
+
+  @traced("ui")
   def submit_vote(vote_choice, weight_class, model_a_name, model_b_name, request: gr.Request):
     user_id = generate_anonymous_user_id(request)
     model_a = arena_service.get_one_model(language, weight_class, model_a_name)
     model_b = arena_service.get_one_model(language, weight_class, model_b_name)
     winner = model_a if vote_choice=="Chatbot A" else model_b
+    record_event("vote", u=short_hash(user_id), l=language, w=weight_class, a=model_a_name, b=model_b_name,
+                 v="a" if vote_choice=="Chatbot A" else "b")
     try:
       arena_service.record_battle(language, weight_class, model_a._id, model_b._id, winner._id, user_id)
-      arena_service.update_leaderboard(language, weight_class)
+      if arena_service.battle_buffer is None:
+        # With the write buffer the leaderboard is recomputed once the battle was written.
+        arena_service.update_leaderboard(language, weight_class)
       return "投票が完了しました"
     except Exception as e:
       return f"エラー: {e}"
@@ -142,23 +264,15 @@ def battle_content(dao, language):
       gr.update(visible=True, interactive=True)
     )
 
-  def generate_anonymous_user_id(request: gr.Request):
-    user_ip = request.headers.get('x-forwarded-for')
-    if user_ip:
-      user_id = "indiebot:" + user_ip
-      hashed_user_id = hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:16]
-      return hashed_user_id
-    else:
-      return "anonymous"
-
   def on_vote_a_click(weight, a, b, request: gr.Request):
     return handle_vote("Chatbot A", weight, a, b, request)
 
   def on_vote_b_click(weight, a, b, request: gr.Request):
     return handle_vote("Chatbot B", weight, a, b, request)
 
-  def reset_battle(dropdown_options):
-    value_a, value_b = get_random_values(dropdown_options)
+  def reset_battle(dropdown_options, weight_class, request: gr.Request):
+    conversation_store.clear(get_session_id(request, "battle"))
+    value_a, value_b = select_pair(weight_class, dropdown_options)
     return (
       [],  # chatbot_aのリセット
       [],  # chatbot_bのリセット
@@ -221,39 +335,40 @@ def battle_content(dao, language):
       update_user_message,
       inputs=[user_input, chatbot_a, chatbot_b],
       outputs=[user_input, chatbot_a, chatbot_b, weight_class_radio],
-      queue=False
-    )
-    user_event.then(
-      bot1_response,
-      inputs=[chatbot_a, model_dropdown_a],
-      outputs=[chatbot_a, vote_a_btn, vote_b_btn],
-      queue=True
+      queue=False,
+      api_name="battle_submit"
     )
-    user_event.then(
-      bot2_response,
-      inputs=[chatbot_b, model_dropdown_b],
-      outputs=[chatbot_b, vote_a_btn, vote_b_btn],
-      queue=True
+    # Both sides are one queued job, so they start together and the battle takes as long as the slower model.
+    user_event.success(
+      battle_responses_for_models,
+      inputs=[model_dropdown_a, model_dropdown_b, weight_class_radio],
+      outputs=[chatbot_a, chatbot_b, vote_a_btn, vote_b_btn],
+      queue=True,
+      api_name="battle_bots"
     )
     vote_a_btn.click(
       fn=on_vote_a_click,
       inputs=[weight_class_radio, model_dropdown_a, model_dropdown_b],
-      outputs=[vote_message, vote_a_btn, vote_b_btn, user_input, next_battle_btn]
+      outputs=[vote_message, vote_a_btn, vote_b_btn, user_input, next_battle_btn],
+      api_name="battle_vote_a"
     )
     vote_b_btn.click(
       fn=on_vote_b_click,
       inputs=[weight_class_radio, model_dropdown_a, model_dropdown_b],
-      outputs=[vote_message, vote_a_btn, vote_b_btn, user_input, next_battle_btn]
+      outputs=[vote_message, vote_a_btn, vote_b_btn, user_input, next_battle_btn],
+      api_name="battle_vote_b"
     )
     next_battle_btn.click(
       fn=reset_battle,
-      inputs=[dropdown_options_state],
+      inputs=[dropdown_options_state, weight_class_radio],
       outputs=[
         chatbot_a, chatbot_b, user_input, vote_a_btn,
         vote_b_btn, vote_message, next_battle_btn,
         model_dropdown_a, model_dropdown_b, weight_class_radio
-      ]
+      ],
+      api_name="battle_reset"
     )
+    gr.api(generation_metrics, api_name="generation_metrics", queue=False)
 
   battle_ui.load(
     fn=fetch_model_dropdown,
@@ -1,19 +1,39 @@
 import os
+import time
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Dict, Tuple
 
 import gradio as gr
 import pandas as pd
 
+from indiebot_arena.config import RATING_TREND_DAYS, RATING_TREND_REFRESH_SEC, LEADERBOARD_PUSH_INTERVAL_SEC, \
+  LEADERBOARD_PUSH_MAX_AGE_SEC
 from indiebot_arena.service.arena_service import ArenaService
+from indiebot_arena.util.traffic_recorder import record_event
+from indiebot_arena.util.tracing import traced
 
 DESCRIPTION = "### 🏆️ リーダーボード"
+TREND_TOP_N = 5
 
 base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
 docs_path = os.path.join(base_dir, "docs", "leaderboard_header.md")
 
 
-def leaderboard_content(dao, language):
+def leaderboard_content(dao, language, invalidation_bus=None):
   arena_service = ArenaService(dao)
 
+  def on_invalidation(event):
+    # Writes of other processes: re-render and push without waiting for LEADERBOARD_PUSH_MAX_AGE_SEC.
+    if event.language is None:
+      arena_service.channel.publish_all()
+    elif event.language==language:
+      arena_service.channel.publish(event.language, event.weight_class)
+
+  if invalidation_bus is not None:
+    invalidation_bus.subscribe(["models", "leaderboard"], on_invalidation)
+
+  @traced("ui")
   def fetch_leaderboard_data(weight_class):
     entries = arena_service.get_leaderboard(language, weight_class)
     data = []
@@ -50,6 +70,67 @@ def leaderboard_content(dao, language):
     df["Model Name"] = df.apply(add_emoji, axis=1)
     return df
 
+  @traced("ui")
+  def fetch_rating_trend(weight_class):
+    since = datetime.utcnow() - timedelta(days=RATING_TREND_DAYS)
+    snapshots = arena_service.get_rating_history(language, weight_class, since)
+    top_ids = [str(entry.model_id) for entry in arena_service.get_leaderboard(language, weight_class)[:TREND_TOP_N]]
+    names = {str(model._id): model.model_name for model in arena_service.dao.find_models(language, weight_class)}
+    data = [
+      [snapshot.timestamp, names.get(model_id, "Unknown"), snapshot.ratings[model_id]]
+      for snapshot in snapshots for model_id in top_ids if model_id in snapshot.ratings
+    ]
+    return pd.DataFrame(data, columns=["Time", "Model", "Elo Score"])
+
+  # Shared by all sessions. weight_class -> (channel version, rendered at, leaderboard table)
+  rendered: Dict[str, Tuple[int, float, pd.DataFrame]] = {}
+  # weight_class -> (loaded at, rating trend)
+  trends: Dict[str, Tuple[float, pd.DataFrame]] = {}
+  # One lock per division, so a slow read of one division doesn't hold up the others.
+  render_locks = {weight_class: Lock() for weight_class in ("U-5GB", "U-10GB")}
+  trend_locks = {weight_class: Lock() for weight_class in ("U-5GB", "U-10GB")}
+
+  def render(weight_class):
+    """
+    Returns (version, table) of a division. Mongo is only read again when update_leaderboard
+    published a change, or after LEADERBOARD_PUSH_MAX_AGE_SEC to pick up votes of other processes.
+    """
+    with render_locks[weight_class]:
+      version = arena_service.channel.version(language, weight_class)
+      cached = rendered.get(weight_class)
+      if cached and cached[0]==version and time.monotonic() - cached[1] < LEADERBOARD_PUSH_MAX_AGE_SEC:
+        return version, cached[2]
+      table = fetch_leaderboard_data(weight_class)
+      if cached and cached[0]==version and not table.equals(cached[2]):
+        # Changed by another process; publish so sessions of this process get the push too.
+        version = arena_service.channel.publish(language, weight_class)
+      rendered[weight_class] = (version, time.monotonic(), table)
+      return version, table
+
+  def render_trend(weight_class):
+    """The rating trend only changes slowly, so it is read at most every RATING_TREND_REFRESH_SEC."""
+    with trend_locks[weight_class]:
+      cached = trends.get(weight_class)
+      if cached and time.monotonic() - cached[0] < RATING_TREND_REFRESH_SEC:
+        return cached[1]
+      trend = fetch_rating_trend(weight_class)
+      trends[weight_class] = (time.monotonic(), trend)
+      return trend
+
+  def show_leaderboard(weight_class, trend_open):
+    record_event("leaderboard", l=language, w=weight_class)
+    version, table = render(weight_class)
+    return table, render_trend(weight_class) if trend_open else gr.skip(), version
+
+  def push_leaderboard(weight_class, seen_version, trend_open):
+    version, table = render(weight_class)
+    if version==seen_version:
+      return gr.skip(), gr.skip(), gr.skip()
+    return table, render_trend(weight_class) if trend_open else gr.skip(), version
+
+  def open_trend(weight_class):
+    return render_trend(weight_class), True
+
   initial_weight_class = "U-5GB"
   with gr.Blocks(css="style.css") as leaderboard_ui:
     with open(docs_path, "r", encoding="utf-8") as f:
@@ -63,8 +144,21 @@ def leaderboard_content(dao, language):
       datatype="markdown"
     )
     refresh_btn = gr.Button("更新", variant="primary")
-    refresh_btn.click(fn=fetch_leaderboard_data, inputs=weight_class_radio, outputs=leaderboard_table)
-    weight_class_radio.change(fn=fetch_leaderboard_data, inputs=weight_class_radio, outputs=leaderboard_table)
+    trend_label = f"📈 レーティングの推移（上位{TREND_TOP_N}モデル・直近{RATING_TREND_DAYS}日）"
+    with gr.Accordion(trend_label, open=False) as trend_accordion:
+      trend_plot = gr.LinePlot(x="Time", y="Elo Score", color="Model", height=320)
+    version_state = gr.State(-1)
+    # The trend is only loaded while its accordion is open.
+    trend_open_state = gr.State(False)
+    push_timer = gr.Timer(LEADERBOARD_PUSH_INTERVAL_SEC)
+    outputs = [leaderboard_table, trend_plot, version_state]
+    inputs = [weight_class_radio, trend_open_state]
+    refresh_btn.click(fn=show_leaderboard, inputs=inputs, outputs=outputs)
+    weight_class_radio.change(fn=show_leaderboard, inputs=inputs, outputs=outputs)
+    trend_accordion.expand(fn=open_trend, inputs=weight_class_radio, outputs=[trend_plot, trend_open_state])
+    trend_accordion.collapse(fn=lambda: False, outputs=trend_open_state)
+    push_timer.tick(fn=push_leaderboard, inputs=[weight_class_radio, version_state, trend_open_state],
+                    outputs=outputs, show_progress="hidden", concurrency_limit=None)
 
-  leaderboard_ui.load(fn=fetch_leaderboard_data, inputs=weight_class_radio, outputs=leaderboard_table)
+  leaderboard_ui.load(fn=show_leaderboard, inputs=inputs, outputs=outputs)
   return leaderboard_ui
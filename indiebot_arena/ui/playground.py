@@ -3,7 +3,8 @@ import os
 import gradio as gr
 
 from indiebot_arena.service.arena_service import ArenaService
-from indiebot_arena.ui.battle import generate, remove_chat_tokens
+from indiebot_arena.ui.battle import conversation_store, get_session_id, stream_bot_message, admit_chat_request, \
+  generation_budget, start_generation, release_session, restore_conversation
 from indiebot_arena.util.cache_manager import clear_hf_cache_if_low_disk_space
 
 DESCRIPTION = "### 💬 Playground"
@@ -12,21 +13,30 @@ base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
 docs_path = os.path.join(base_dir, "docs", "battle_header.md")
 
 
-def update_user_message(user_message, history_a):
+def update_user_message(user_message, shown_a, request: gr.Request):
+  session_id = get_session_id(request, "playground")
+  admit_chat_request(request, session_id)
   clear_hf_cache_if_low_disk_space()
+  restore_conversation(session_id, {"a": shown_a})
 
-  new_history_a = history_a + [{"role": "user", "content": user_message}]
+  generation_budget.submitted(session_id)
+  new_history_a = conversation_store.append_message(session_id, "a", "user", user_message)
   return "", new_history_a
 
 
-def bot1_response(history, model_id):
-  history = history.copy()
-  history.append({"role": "assistant", "content": ""})
-  conv_history = history[:-1]
-  for text in generate(conv_history, model_id):
-    cleaned_text = remove_chat_tokens(text)
-    history[-1]["content"] = cleaned_text
-    yield history
+def bot1_response(session_id, model_id, runtime="transformers", file_size_gb=0.0):
+  budget = start_generation(session_id)
+  yield from stream_bot_message(session_id, "a", model_id, runtime, budget.max_new_tokens, file_size_gb,
+                                budget.max_history_messages)
+
+
+def release_playground_session(request: gr.Request):
+  release_session(get_session_id(request, "playground"))
+
+
+def clear_conversation(_, request: gr.Request):
+  conversation_store.clear(get_session_id(request, "playground"))
+  return []
 
 
 def playground_content(dao, language):
@@ -42,6 +52,12 @@ def playground_content(dao, language):
     update_obj_a = gr.update(choices=model_labels, value=model_labels[0])
     return update_obj_a
 
+  def bot1_response_for_model(model_name, weight_class, request: gr.Request):
+    model = arena_service.get_one_model(language, weight_class, model_name)
+    runtime = model.runtime if model else "transformers"
+    file_size_gb = model.file_size_gb if model else 0.0
+    yield from bot1_response(get_session_id(request, "playground"), model_name, runtime, file_size_gb)
+
   with gr.Blocks(css="style.css") as battle_ui:
     gr.Markdown(DESCRIPTION)
     with open(docs_path, "r", encoding="utf-8") as f:
@@ -70,9 +86,9 @@ def playground_content(dao, language):
       outputs=[user_input, chatbot_a],
       queue=False
     )
-    user_event.then(
-      bot1_response,
-      inputs=[chatbot_a, model_dropdown_a],
+    user_event.success(
+      bot1_response_for_model,
+      inputs=[model_dropdown_a, weight_class_radio],
       outputs=[chatbot_a],
       queue=True
     )
@@ -82,13 +98,13 @@ def playground_content(dao, language):
       outputs=[model_dropdown_a]
     )
     weight_class_radio.change(
-      fn=lambda _: [],
+      fn=clear_conversation,
       inputs=weight_class_radio,
       outputs=chatbot_a,
       queue=False
     )
     model_dropdown_a.change(
-      fn=lambda _: [],
+      fn=clear_conversation,
       inputs=model_dropdown_a,
       outputs=chatbot_a,
       queue=False
@@ -1,21 +1,28 @@
 import os
 import re
 from dataclasses import dataclass
+from typing import Optional
 
 import gradio as gr
-import spaces
-import torch
-from huggingface_hub import hf_hub_url, get_hf_file_metadata, model_info
-from transformers import AutoTokenizer, AutoModelForCausalLM, AutoConfig
 
+from indiebot_arena.config import MAX_NEW_TOKENS
+from indiebot_arena.engine.engine_registry import get_engine
+from indiebot_arena.engine.llama_cpp_engine import select_gguf_file, detect_gguf_quantization
+from indiebot_arena.model.domain_model import Model
 from indiebot_arena.service.arena_service import ArenaService
-from indiebot_arena.ui.battle import generate
+from indiebot_arena.service.registration_job_service import RegistrationJobQueue
+from indiebot_arena.util.gpu import gpu
+from indiebot_arena.util.traffic_recorder import record_event
+from indiebot_arena.util.tracing import traced
 
 DESCRIPTION = "### 📚️ 登録済みモデル"
 
 base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
 docs_path = os.path.join(base_dir, "docs", "model_registration_guide.md")
 
+CHAT_TEST_QUESTION = "日本の首都は？"
+CHAT_TEST_EXPECTED_WORD = "東京"
+
 
 @dataclass
 class ModelMeta:
@@ -26,11 +33,15 @@ class ModelMeta:
   weights_file_size: float
   weights_format: str
   quantization: str
+  runtime: str = "transformers"
+  revision: str = ""
+  local_path: str = ""
 
 
 def format_model_meta(meta: ModelMeta) -> str:
   return (
     f"Model ID: {meta.model_id}\n"
+    f"Runtime: {meta.runtime}\n"
     f"Architecture: {meta.architecture}\n"
     f"Parameters: {meta.parameters}\n"
     f"Model Type: {meta.model_type}\n"
@@ -40,48 +51,165 @@ def format_model_meta(meta: ModelMeta) -> str:
   )
 
 
-@spaces.GPU(duration=30)
-def get_model_meta(model_id: str):
+def registration_fields(meta: ModelMeta):
+  if meta.runtime=="llama.cpp":
+    return meta.quantization.lower(), "gguf"
+  quantization = "bnb" if meta.quantization.lower()=="bitsandbytes" else meta.quantization.lower()
+  file_format = "safetensors" if "safetensors" in meta.weights_format.lower() else meta.weights_format
+  return quantization, file_format
+
+
+def registration_error(meta: ModelMeta, weight_class: str) -> Optional[str]:
+  """Why a checked model can't be registered in weight_class, or None."""
+  if weight_class=="U-5GB" and meta.weights_file_size >= 5.0:
+    return f"File size exceeds U-5GB limit. {meta.weights_file_size} GB"
+  if weight_class=="U-10GB" and meta.weights_file_size >= 10.0:
+    return f"File size exceeds U-10GB limit. {meta.weights_file_size} GB"
+  quantization, file_format = registration_fields(meta)
   try:
-    config = AutoConfig.from_pretrained(model_id)
-    model = AutoModelForCausalLM.from_pretrained(
-      model_id,
-      device_map="auto",
-      torch_dtype=torch.bfloat16,
-      use_safetensors=True
-    )
-    tokenizer = AutoTokenizer.from_pretrained(model_id)
-    repo_info = model_info(model_id)
-    weights_files = [file.rfilename for file in repo_info.siblings if
-                     file.rfilename.endswith('.bin') or file.rfilename.endswith('.safetensors')]
-    total_size = 0
-    file_formats = set()
-    for file_name in weights_files:
-      file_formats.add(file_name.split('.')[-1])
-      file_url = hf_hub_url(model_id, filename=file_name)
-      metadata = get_hf_file_metadata(file_url)
-      total_size += metadata.size or 0
-    total_size_gb = round(total_size / (1024 ** 3), 2)
-    model_type = type(model).__name__
-    quant_config = getattr(config, 'quantization_config', {})
-    quant_method = quant_config.get('quant_method', 'none')
-    meta = ModelMeta(
-      model_id=model_id,
-      architecture=config.architectures if hasattr(config, 'architectures') else [],
-      parameters=f"{round(sum(p.numel() for p in model.parameters()) / 1e9, 2)} Billion",
-      model_type=model_type,
-      weights_file_size=total_size_gb,
-      weights_format=", ".join(file_formats),
-      quantization=quant_method,
-    )
-    return meta
-  except Exception as e:
-    return f"Error: {str(e)}"
+    get_engine(meta.runtime).validate_registration(quantization, file_format)
+  except ValueError as e:
+    return str(e)
+  return None
+
+
+def get_gguf_model_meta(model_id: str, revision: Optional[str] = None) -> ModelMeta:
+  from huggingface_hub import hf_hub_url, get_hf_file_metadata
+
+  file_name = select_gguf_file(model_id, revision=revision)
+  metadata = get_hf_file_metadata(hf_hub_url(model_id, filename=file_name, revision=revision))
+  return ModelMeta(
+    model_id=model_id,
+    architecture=[],
+    parameters="N/A",
+    model_type="GGUF",
+    weights_file_size=round((metadata.size or 0) / (1024 ** 3), 2),
+    weights_format="gguf",
+    quantization=detect_gguf_quantization(file_name),
+    runtime="llama.cpp",
+  )
+
+
+@dataclass
+class RegistrationCheck:
+  meta: ModelMeta
+  chat_response: str
+  chat_passed: bool
+
+
+@dataclass
+class LoadTestResult:
+  model_type: str
+  num_parameters: int
+  chat_response: str
+
+
+def resolve_revision(model_id: str) -> str:
+  from huggingface_hub import model_info
+
+  return model_info(model_id).sha
+
+
+def get_transformers_model_meta(model_id: str, repo_info, config, load_test: LoadTestResult) -> ModelMeta:
+  from huggingface_hub import hf_hub_url, get_hf_file_metadata
+
+  weights_files = [file.rfilename for file in repo_info.siblings if
+                   file.rfilename.endswith('.bin') or file.rfilename.endswith('.safetensors')]
+  total_size = 0
+  file_formats = set()
+  for file_name in weights_files:
+    file_formats.add(file_name.split('.')[-1])
+    file_url = hf_hub_url(model_id, filename=file_name, revision=repo_info.sha)
+    metadata = get_hf_file_metadata(file_url)
+    total_size += metadata.size or 0
+  total_size_gb = round(total_size / (1024 ** 3), 2)
+  quant_config = getattr(config, 'quantization_config', {})
+  quant_method = quant_config.get('quant_method', 'none')
+  return ModelMeta(
+    model_id=model_id,
+    architecture=config.architectures if hasattr(config, 'architectures') else [],
+    parameters=f"{round(load_test.num_parameters / 1e9, 2)} Billion",
+    model_type=load_test.model_type,
+    weights_file_size=total_size_gb,
+    weights_format=", ".join(file_formats),
+    quantization=quant_method,
+  )
+
+
+@gpu(duration=60)
+def load_and_chat_test(runtime: str, model_id: str, local_path: str) -> LoadTestResult:
+  """
+  Load the candidate snapshot once and use it for both the load test and the chat test.
+  The copy is only borrowed for the test: it isn't pinned or made resident, so live traffic keeps its snapshot.
+  This is the only GPU step; on ZeroGPU it runs in a separate process, so it neither reports progress
+  nor changes engine state.
+  """
+  engine = get_engine(runtime)
+  loaded = engine.load_model(model_id, local_path)
+  model = loaded[1] if isinstance(loaded, tuple) else loaded
+  conv_history = [{"role": "user", "content": CHAT_TEST_QUESTION}]
+  final_response = ""
+  with engine.using_model(model_id, loaded) as borrowed_id:
+    for text in engine.generate(conv_history, borrowed_id, MAX_NEW_TOKENS, 0.6, 0.9, 50, 1.2):
+      final_response = text
+  num_parameters = sum(p.numel() for p in model.parameters()) if hasattr(model, "parameters") else 0
+  return LoadTestResult(type(model).__name__, num_parameters, final_response)
+
+
+def run_registration_check(model_id: str, revision: str, progress) -> RegistrationCheck:
+  from huggingface_hub import model_info
+  from transformers import AutoConfig
+
+  repo_info = model_info(model_id, revision=revision)
+  file_names = [file.rfilename for file in repo_info.siblings]
+  meta = None
+  if not any(f.endswith(".safetensors") or f.endswith(".bin") for f in file_names) and \
+      any(f.endswith(".gguf") for f in file_names):
+    meta = get_gguf_model_meta(model_id, revision)
+  runtime = meta.runtime if meta else "transformers"
+  engine = get_engine(runtime)
+
+  progress(f"{model_id} (revision {revision[:7]}) をダウンロードしています...")
+  local_path = engine.snapshot(model_id, revision)
+  progress(f"{model_id} (revision {revision[:7]}) をロードし、チャットテストを実行しています...")
+  load_test = load_and_chat_test(runtime, model_id, local_path)
+  if meta is None:
+    config = AutoConfig.from_pretrained(local_path, local_files_only=True)
+    meta = get_transformers_model_meta(model_id, repo_info, config, load_test)
+  meta.revision = revision
+  meta.local_path = local_path
+  progress(format_model_meta(meta) + "\n\nロードテストが成功しました。")
+  progress(f"質問: {CHAT_TEST_QUESTION}\n応答: {load_test.chat_response}")
+  return RegistrationCheck(meta, load_test.chat_response, CHAT_TEST_EXPECTED_WORD in load_test.chat_response)
+
+
+registration_jobs = RegistrationJobQueue(run_registration_check)
+
+
+def verify_revision(model: Model, revision: str) -> Optional[str]:
+  """
+  Re-run the registration check of a registered model on a new upstream revision, for ModelPinService.
+  Returns why the revision can't replace the pinned one, or None.
+  """
+  job = registration_jobs.submit(model.model_name, revision)
+  for _ in job.follow():
+    pass
+  if job.status=="failed":
+    return job.error
+  error = registration_error(job.result.meta, model.weight_class)
+  if error:
+    return error
+  if job.result.meta.runtime!=model.runtime:
+    return f"Runtime changed to {job.result.meta.runtime}."
+  if not job.result.chat_passed:
+    return "Chat test failed."
+  return None
 
 
 def registration_content(dao, language):
   arena_service = ArenaService(dao)
 
+  @traced("ui")
   def fetch_models(weight_class):
     models = arena_service.dao.find_models(language, weight_class)
     data = []
@@ -94,45 +222,42 @@ def registration_content(dao, language):
   def load_test(model_id, weight_class, current_output):
     if not re.match(r'^[a-zA-Z0-9._-]+/[a-zA-Z0-9._-]+$', model_id):
       err = "Error: Invalid model_id format. It must be in the format 'owner/model'."
-      return (current_output + "\n" + err, gr.update(interactive=False), None)
-    meta = get_model_meta(model_id)
-    if isinstance(meta, str) and meta.startswith("Error:"):
-      return (current_output + "\n" + meta, gr.update(interactive=False), None)
-    if weight_class=="U-5GB" and meta.weights_file_size >= 5.0:
-      err = f"Error: File size exceeds U-5GB limit. {meta.weights_file_size} GB"
-      return (current_output + "\n" + err, gr.update(interactive=False), None)
-    if weight_class=="U-10GB" and meta.weights_file_size >= 10.0:
-      err = f"Error: File size exceeds U-10GB limit. {meta.weights_file_size} GB"
-      return (current_output + "\n" + err, gr.update(interactive=False), None)
-    if "safetensors" not in meta.weights_format.lower():
-      err = "Error: Weights Format must include safetensors."
-      return (current_output + "\n" + err, gr.update(interactive=False), None)
-    if meta.quantization.lower() not in ["bitsandbytes", "none"]:
-      err = "Error: Quantization must be bitsandbytes or none."
-      return (current_output + "\n" + err, gr.update(interactive=False), None)
-    display_str = format_model_meta(meta) + "\n\nロードテストが成功しました。\nチャットテストを実施して下さい。\n"
-    return (current_output + "\n" + display_str, gr.update(interactive=True), meta)
-
-  def chat_test(model_id, current_output):
-    question = "日本の首都は？"
-    expected_word = "東京"
-    conv_history = [{"role": "user", "content": question}]
-    final_response = ""
+      yield current_output + "\n" + err, gr.update(interactive=False), None
+      return
     try:
-      for text in generate(conv_history, model_id):
-        final_response = text
+      revision = resolve_revision(model_id)
     except Exception as e:
-      error_msg = f"エラー: {str(e)}"
-      return (current_output + "\n" + error_msg, gr.update(interactive=False))
+      yield current_output + "\n" + f"Error: {str(e)}", gr.update(interactive=False), None
+      return
 
-    result_text = f"質問: {question}\n応答: {final_response}\n"
-    if expected_word in final_response:
-      result_text += "成功: 応答に期待するワードが含まれています。\nモデル登録を実施して下さい。\n"
-      register_enabled = True
+    job = registration_jobs.submit(model_id, revision)
+    for lines in job.follow():
+      yield current_output + "\n" + "\n".join(lines), gr.update(interactive=False), None
+    output = current_output + "\n" + "\n".join(job.progress)
+    if job.status=="failed":
+      yield output + "\n" + f"Error: {job.error}", gr.update(interactive=False), None
+      return
+
+    meta = job.result.meta
+    error = registration_error(meta, weight_class)
+    if error:
+      yield output + "\n" + f"Error: {error}", gr.update(interactive=False), None
+      return
+    if job.result.chat_passed:
+      result_text = "成功: 応答に期待するワードが含まれています。\nモデル登録を実施して下さい。\n"
     else:
-      result_text += "失敗: 応答に期待するワードが含まれていません。\n"
-      register_enabled = False
-    return (current_output + "\n" + result_text, gr.update(interactive=register_enabled))
+      result_text = "失敗: 応答に期待するワードが含まれていません。\n"
+    yield output + "\n" + result_text, gr.update(interactive=job.result.chat_passed), meta
+
+  def fetch_job_history():
+    data = []
+    for job in registration_jobs.history():
+      if job.status=="failed":
+        result = f"Error: {job.error}"
+      else:
+        result = "チャットテスト成功" if job.result.chat_passed else "チャットテスト失敗"
+      data.append([job.model_id, job.revision[:7], result, job.finished_at.strftime("%Y-%m-%d %H:%M:%S")])
+    return data
 
   def register_model(meta, weight_class, description, current_output):
     try:
@@ -140,11 +265,15 @@ def registration_content(dao, language):
         raise ValueError("No meta info available.")
       model_id_extracted = meta.model_id
       file_size_gb = meta.weights_file_size
-      quantization = "bnb" if meta.quantization.lower()=="bitsandbytes" else "none"
-      weights_format = meta.weights_format
-      file_format = "safetensors" if "safetensors" in weights_format.lower() else weights_format
+      quantization, file_format = registration_fields(meta)
       desc = description if description else ""
-      arena_service.register_model(language, weight_class, model_id_extracted, "transformers", quantization, file_format, file_size_gb, desc)
+      record_event("register", l=language, w=weight_class, m=model_id_extracted, r=meta.runtime, q=quantization,
+                   f=file_format, g=file_size_gb)
+      arena_service.register_model(language, weight_class, model_id_extracted, meta.runtime, quantization, file_format,
+                                   file_size_gb, desc, meta.revision or None, meta.local_path or None)
+      if meta.local_path:
+        # Live traffic moves to the checked snapshot only once it is registered.
+        get_engine(meta.runtime).pin(model_id_extracted, meta.local_path)
       arena_service.update_leaderboard(language, weight_class)
       result = "モデルの登録が完了しました。"
       disable = True
@@ -156,11 +285,11 @@ def registration_content(dao, language):
       btn_update = gr.update(interactive=False)
     else:
       btn_update = gr.update()
-    return new_output, meta, btn_update, btn_update, btn_update
+    return new_output, meta, btn_update, btn_update
 
   def clear_all():
     initial_weight = "U-5GB"
-    return "", initial_weight, "", "", gr.update(interactive=True), gr.update(interactive=False), gr.update(interactive=False), None
+    return "", initial_weight, "", "", gr.update(interactive=True), gr.update(interactive=False), None
 
   with gr.Blocks(css="style.css") as registration_ui:
     gr.Markdown(DESCRIPTION)
@@ -183,19 +312,19 @@ def registration_content(dao, language):
       output_box = gr.Textbox(label="結果出力", lines=10)
       meta_state = gr.State(None)
       with gr.Row():
-        test_btn = gr.Button("ロードテスト", variant="primary")
-        chat_test_btn = gr.Button("チャットテスト", variant="primary", interactive=False)
+        test_btn = gr.Button("ロード・チャットテスト", variant="primary")
         register_btn = gr.Button("モデル登録", variant="primary", interactive=False)
         clear_btn = gr.Button("クリア")
-      test_btn.click(fn=load_test, inputs=[model_id_input, reg_weight_class_radio, output_box], outputs=[output_box,
-                                                                                                         chat_test_btn,
-                                                                                                         meta_state])
-      chat_test_btn.click(fn=chat_test, inputs=[model_id_input, output_box], outputs=[output_box, register_btn])
+      with gr.Accordion("🕒 テスト履歴", open=False):
+        history_table = gr.Dataframe(headers=["Model ID", "Revision", "Result", "Finished At"], value=[],
+                                     interactive=False)
+      test_btn.click(fn=load_test, inputs=[model_id_input, reg_weight_class_radio, output_box],
+                     outputs=[output_box, register_btn, meta_state]).then(fn=fetch_job_history, outputs=history_table)
       register_btn.click(fn=register_model, inputs=[meta_state, reg_weight_class_radio, description_input,
                                                     output_box], outputs=[output_box, meta_state, test_btn,
-                                                                          chat_test_btn, register_btn])
+                                                                          register_btn])
       clear_btn.click(fn=clear_all, inputs=[], outputs=[model_id_input, reg_weight_class_radio, description_input,
-                                                        output_box, test_btn, chat_test_btn, register_btn, meta_state])
+                                                        output_box, test_btn, register_btn, meta_state])
 
   registration_ui.load(fn=fetch_models, inputs=weight_class_radio, outputs=mdl_list)
   return registration_ui
@@ -0,0 +1,147 @@
+import logging
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Deque, Dict, Optional, Sequence, Tuple
+
+from indiebot_arena.config import MAX_NEW_TOKENS, LOAD_DEGRADATION_ENABLED, LOAD_DEGRADATION_QUEUE_DEPTH, \
+  LOAD_DEGRADATION_WAIT_SEC, LOAD_DEGRADATION_WINDOW_SEC, LOAD_DEGRADATION_COOLDOWN_SEC
+
+
+@dataclass(frozen=True)
+class DegradationLevel:
+  level: int
+  name: str
+  max_new_tokens: int
+  max_history_messages: Optional[int]  # None: the whole conversation (still trimmed to MAX_INPUT_TOKEN_LENGTH)
+  notice: str                          # shown to users while the level is active
+
+
+def degradation_levels(max_new_tokens: int = MAX_NEW_TOKENS) -> Tuple[DegradationLevel, ...]:
+  return (
+    DegradationLevel(0, "normal", max_new_tokens, None, ""),
+    DegradationLevel(1, "short", max(1, max_new_tokens // 2), None,
+                     "混雑しているため、応答を通常より短くしています。"),
+    DegradationLevel(2, "minimal", max(1, max_new_tokens // 4), 3,
+                     "混雑しているため、応答を短くし、直近のやり取りだけをモデルに渡しています。"),
+  )
+
+
+class GenerationBudget:
+  """
+  Load-adaptive generation budget.
+  Chat submissions are tracked from submitted() until their generation started(), which gives the number
+  of chat jobs waiting in the queue and how long they waited. The level rises as soon as the queue depth
+  or the longest wait within window_sec reaches one of its thresholds, and drops one level at a time
+  once load has stayed below it for cooldown_sec. When disabled, load is still measured but the level
+  stays at 0.
+  A submission that is cancelled() (e.g. its tab was closed while queued) stops counting right away;
+  one that hasn't started after pending_timeout_sec (default: the highest wait threshold) is dropped,
+  so a lost cancellation raises the level at most as far as a real wait of that length would.
+  """
+
+  def __init__(self,
+               enabled: bool = LOAD_DEGRADATION_ENABLED,
+               depth_thresholds: Sequence[int] = LOAD_DEGRADATION_QUEUE_DEPTH,
+               wait_thresholds: Sequence[float] = LOAD_DEGRADATION_WAIT_SEC,
+               window_sec: float = LOAD_DEGRADATION_WINDOW_SEC,
+               cooldown_sec: float = LOAD_DEGRADATION_COOLDOWN_SEC,
+               levels: Optional[Sequence[DegradationLevel]] = None,
+               pending_timeout_sec: Optional[float] = None):
+    self.levels = tuple(levels or degradation_levels())
+    if len(depth_thresholds)!=len(self.levels) - 1 or len(wait_thresholds)!=len(self.levels) - 1:
+      raise ValueError(f"Need one queue depth and one wait threshold for each of the {len(self.levels) - 1} levels.")
+    self.enabled = enabled
+    self.depth_thresholds = tuple(depth_thresholds)
+    self.wait_thresholds = tuple(wait_thresholds)
+    self.window_sec = window_sec
+    self.cooldown_sec = cooldown_sec
+    self.pending_timeout_sec = max(self.wait_thresholds) if pending_timeout_sec is None else pending_timeout_sec
+    self._pending: "OrderedDict[str, float]" = OrderedDict()
+    self._waits: Deque[Tuple[float, float]] = deque()
+    self._level = 0
+    self._below_since: Optional[float] = None
+    self._level_changes = 0
+    self._lock = Lock()
+
+  def submitted(self, key: str, now: Optional[float] = None) -> None:
+    now = time.monotonic() if now is None else now
+    with self._lock:
+      self._pending.pop(key, None)
+      self._pending[key] = now
+      self._update(now)
+
+  def cancelled(self, key: str, now: Optional[float] = None) -> None:
+    """Forget a submission that will never start."""
+    now = time.monotonic() if now is None else now
+    with self._lock:
+      self._pending.pop(key, None)
+      self._update(now)
+
+  def started(self, key: str, now: Optional[float] = None) -> DegradationLevel:
+    """Record that the generation for key started and return the level it should run at."""
+    now = time.monotonic() if now is None else now
+    with self._lock:
+      submitted = self._pending.pop(key, None)
+      if submitted is not None:
+        self._waits.append((now, now - submitted))
+      self._update(now)
+      return self.levels[self._level]
+
+  def current(self, now: Optional[float] = None) -> DegradationLevel:
+    now = time.monotonic() if now is None else now
+    with self._lock:
+      self._update(now)
+      return self.levels[self._level]
+
+  # ---------- Load ----------
+
+  def _load(self, now: float) -> Tuple[int, float]:
+    while self._pending and now - next(iter(self._pending.values())) > self.pending_timeout_sec:
+      self._pending.popitem(last=False)
+    while self._waits and now - self._waits[0][0] > self.window_sec:
+      self._waits.popleft()
+    oldest_pending = now - next(iter(self._pending.values())) if self._pending else 0.0
+    return len(self._pending), max([oldest_pending] + [wait for _, wait in self._waits])
+
+  def _update(self, now: float) -> None:
+    depth, wait = self._load(now)
+    target = 0
+    if self.enabled:
+      for level, (max_depth, max_wait) in enumerate(zip(self.depth_thresholds, self.wait_thresholds), start=1):
+        if depth >= max_depth or wait >= max_wait:
+          target = level
+    if target > self._level:
+      self._set_level(target, depth, wait)
+    elif target < self._level:
+      if self._below_since is None:
+        self._below_since = now
+      elif now - self._below_since >= self.cooldown_sec:
+        self._set_level(self._level - 1, depth, wait)
+        self._below_since = now
+    else:
+      self._below_since = None
+
+  def _set_level(self, level: int, depth: int, wait: float) -> None:
+    logging.warning(f"Generation budget: level {self._level} -> {level} ({self.levels[level].name}), "
+                    f"queue depth {depth}, wait {wait:.1f}s")
+    self._level = level
+    self._level_changes += 1
+    self._below_since = None
+
+  def get_metrics(self, now: Optional[float] = None) -> Dict[str, Any]:
+    now = time.monotonic() if now is None else now
+    with self._lock:
+      self._update(now)
+      depth, wait = self._load(now)
+      level = self.levels[self._level]
+      return {
+        "level": level.level,
+        "level_name": level.name,
+        "max_new_tokens": level.max_new_tokens,
+        "max_history_messages": level.max_history_messages,
+        "queue_depth": depth,
+        "max_wait_sec": round(wait, 3),
+        "level_changes": self._level_changes,
+      }
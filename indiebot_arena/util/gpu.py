@@ -0,0 +1,16 @@
+import os
+
+
+def gpu(duration: int = 30):
+  """
+  Apply spaces.GPU only when running on ZeroGPU Spaces.
+  Elsewhere the function is returned as is, so the spaces package (and torch) are never imported at startup.
+  """
+
+  def decorator(fn):
+    if os.getenv("SPACES_ZERO_GPU", "False").lower() not in ["true", "1", "yes"]:
+      return fn
+    import spaces
+    return spaces.GPU(duration=duration)(fn)
+
+  return decorator
@@ -0,0 +1,200 @@
+import contextvars
+import queue
+import time
+from collections import deque
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from threading import Event, Lock, Thread
+from typing import Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+
+from indiebot_arena.config import PAIRED_BATTLE_MODE, PAIRED_BATTLE_METRICS_WINDOW
+from indiebot_arena.util.stats import percentile
+
+T = TypeVar("T")
+SIDES = ("a", "b")
+
+
+@dataclass
+class SideTiming:
+  # Seconds since the pair was admitted.
+  started: Optional[float] = None
+  first_chunk: Optional[float] = None
+  finished: Optional[float] = None
+
+  @property
+  def duration(self) -> Optional[float]:
+    if self.started is None or self.finished is None:
+      return None
+    return self.finished - self.started
+
+
+@dataclass
+class PairTiming:
+  admitted: float = field(default_factory=time.monotonic)
+  sides: Tuple[SideTiming, SideTiming] = field(default_factory=lambda: (SideTiming(), SideTiming()))
+
+  def elapsed(self) -> float:
+    return time.monotonic() - self.admitted
+
+  @property
+  def start_skew(self) -> Optional[float]:
+    a, b = self.sides
+    if a.started is None or b.started is None:
+      return None
+    return abs(a.started - b.started)
+
+  @property
+  def completion(self) -> Optional[float]:
+    if any(s.finished is None for s in self.sides):
+      return None
+    return max(s.finished for s in self.sides)
+
+  @property
+  def slower_side(self) -> Optional[float]:
+    durations = [s.duration for s in self.sides]
+    return None if None in durations else max(durations)
+
+
+class PairedBattleExecutor:
+  """
+  Runs both sides of a battle as one unit, so neither side waits in the queue behind other requests
+  after its opponent has started. run() yields (latest_a, latest_b) whenever either side produced output.
+  mode "concurrent" pulls each side's stream on its own thread; "interleaved" takes one step of each
+  side in turn on the caller's thread, for runtimes that can't decode two models at once.
+  A failing side doesn't stop the other; its error is raised after both finished.
+  Per-side start, first chunk and finish times of recent battles are kept for get_metrics().
+  """
+
+  def __init__(self, mode: str = PAIRED_BATTLE_MODE, metrics_window: int = PAIRED_BATTLE_METRICS_WINDOW):
+    if mode not in ("concurrent", "interleaved"):
+      raise ValueError("Mode must be 'concurrent' or 'interleaved'.")
+    self.mode = mode
+    self._timings: Deque[PairTiming] = deque(maxlen=metrics_window)
+    self._active = 0
+    self._lock = Lock()
+
+  def run(self, side_a: Callable[[], Iterator[T]],
+          side_b: Callable[[], Iterator[T]]) -> Iterator[Tuple[Optional[T], Optional[T]]]:
+    timing = PairTiming()
+    with self._lock:
+      self._active += 1
+    try:
+      if self.mode=="interleaved":
+        yield from self._run_interleaved((side_a, side_b), timing)
+      else:
+        yield from self._run_concurrent((side_a, side_b), timing)
+    finally:
+      with self._lock:
+        self._active -= 1
+        if timing.completion is not None:
+          self._timings.append(timing)
+
+  def _run_concurrent(self, factories, timing: PairTiming):
+    events: queue.Queue = queue.Queue()
+    stop = Event()
+
+    def pump(index: int) -> None:
+      side = timing.sides[index]
+      side.started = timing.elapsed()
+      error = None
+      iterator = None
+      try:
+        iterator = factories[index]()
+        for item in iterator:
+          if side.first_chunk is None:
+            side.first_chunk = timing.elapsed()
+          events.put((index, item, None, False))
+          if stop.is_set():
+            break
+      except Exception as e:
+        error = e
+      finally:
+        if hasattr(iterator, "close"):
+          iterator.close()
+      side.finished = timing.elapsed()
+      events.put((index, None, error, True))
+
+    for index in range(2):
+      # Each side runs in a copy of the caller's context, so Gradio's request context (gr.Warning, ZeroGPU)
+      # is still there on the side's thread.
+      ctx = contextvars.copy_context()
+      Thread(target=ctx.run, args=(pump, index), name=f"battle-side-{SIDES[index]}", daemon=True).start()
+
+    latest: List[Optional[T]] = [None, None]
+    errors: List[Exception] = []
+    running = 2
+    try:
+      while running:
+        pending = [events.get()]
+        # Coalesce whatever else already arrived, so a fast side doesn't queue up stale updates.
+        while True:
+          try:
+            pending.append(events.get_nowait())
+          except queue.Empty:
+            break
+        changed = False
+        for index, item, error, done in pending:
+          if done:
+            running -= 1
+            if error is not None:
+              errors.append(error)
+          else:
+            latest[index] = item
+            changed = True
+        if changed:
+          yield latest[0], latest[1]
+    finally:
+      stop.set()
+    if errors:
+      raise errors[0]
+
+  def _run_interleaved(self, factories, timing: PairTiming):
+    iterators: List[Optional[Iterator[T]]] = [None, None]
+    latest: List[Optional[T]] = [None, None]
+    errors: List[Exception] = []
+    active = [0, 1]
+    try:
+      while active:
+        for index in list(active):
+          side = timing.sides[index]
+          try:
+            if iterators[index] is None:
+              side.started = timing.elapsed()
+              iterators[index] = iter(factories[index]())
+            item = next(iterators[index])
+          except StopIteration:
+            side.finished = timing.elapsed()
+            active.remove(index)
+            continue
+          except Exception as e:
+            side.finished = timing.elapsed()
+            errors.append(e)
+            active.remove(index)
+            continue
+          if side.first_chunk is None:
+            side.first_chunk = timing.elapsed()
+          latest[index] = item
+          yield latest[0], latest[1]
+    finally:
+      for iterator in iterators:
+        if hasattr(iterator, "close"):
+          iterator.close()
+    if errors:
+      raise errors[0]
+
+  def get_metrics(self) -> Dict[str, float]:
+    with self._lock:
+      timings = list(self._timings)
+      active = self._active
+    skews = [t.start_skew for t in timings]
+    completions = [t.completion for t in timings]
+    slower = [t.slower_side for t in timings]
+    return {
+      "active": active,
+      "battles": len(timings),
+      "start_skew_p50_ms": percentile(skews, 50) * 1000,
+      "start_skew_p95_ms": percentile(skews, 95) * 1000,
+      "completion_p50_ms": percentile(completions, 50) * 1000,
+      "completion_p95_ms": percentile(completions, 95) * 1000,
+      "slower_side_p50_ms": percentile(slower, 50) * 1000,
+    }
@@ -0,0 +1,71 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Tuple
+
+from indiebot_arena.config import ADMISSION_USER_RATE_PER_MIN, ADMISSION_USER_BURST, ADMISSION_GLOBAL_RATE_PER_MIN, \
+  ADMISSION_GLOBAL_BURST, ADMISSION_MAX_DELAY_SEC
+
+
+class TokenBucket:
+  def __init__(self, rate_per_sec: float, capacity: float, now: float):
+    self.rate_per_sec = rate_per_sec
+    self.capacity = capacity
+    self.tokens = capacity
+    self.updated = now
+
+  def wait_time(self, cost: float, now: float) -> float:
+    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_sec)
+    self.updated = now
+    if self.tokens >= cost:
+      return 0.0
+    return (cost - self.tokens) / self.rate_per_sec
+
+  def consume(self, cost: float) -> None:
+    # Tokens may go negative: the request is then admitted after the returned wait time.
+    self.tokens -= cost
+
+
+class AdmissionController:
+  """
+  Per-user and global token buckets applied to chat submissions before any model work is queued.
+  A request that would have to wait longer than max_delay_sec is rejected.
+  """
+
+  def __init__(self,
+               user_rate_per_min: float = ADMISSION_USER_RATE_PER_MIN,
+               user_burst: int = ADMISSION_USER_BURST,
+               global_rate_per_min: float = ADMISSION_GLOBAL_RATE_PER_MIN,
+               global_burst: int = ADMISSION_GLOBAL_BURST,
+               max_delay_sec: float = ADMISSION_MAX_DELAY_SEC,
+               max_users: int = 10000):
+    self.user_rate_per_sec = user_rate_per_min / 60
+    self.user_burst = user_burst
+    self.max_delay_sec = max_delay_sec
+    self.max_users = max_users
+    self._global_bucket = TokenBucket(global_rate_per_min / 60, global_burst, time.monotonic())
+    self._user_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+    self._lock = Lock()
+
+  def admit(self, user_id: str, cost: float = 1) -> Tuple[bool, float]:
+    """
+    Returns (admitted, wait_sec). When admitted the caller should wait wait_sec before starting the work;
+    when rejected wait_sec is the time after which a retry would be admitted.
+    """
+    with self._lock:
+      now = time.monotonic()
+      user_bucket = self._user_buckets.get(user_id)
+      if user_bucket is None:
+        user_bucket = TokenBucket(self.user_rate_per_sec, self.user_burst, now)
+        self._user_buckets[user_id] = user_bucket
+        while len(self._user_buckets) > self.max_users:
+          self._user_buckets.popitem(last=False)
+      else:
+        self._user_buckets.move_to_end(user_id)
+
+      wait_sec = max(user_bucket.wait_time(cost, now), self._global_bucket.wait_time(cost, now))
+      if wait_sec > self.max_delay_sec:
+        return False, wait_sec
+      user_bucket.consume(cost)
+      self._global_bucket.consume(cost)
+      return True, wait_sec
@@ -0,0 +1,94 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List
+
+from indiebot_arena.config import SESSION_STORE_MAX_SESSIONS, SESSION_IDLE_TIMEOUT_SEC
+
+
+class ConversationStore:
+  """
+  Server-side store of chat histories keyed by session id.
+  Each session holds one conversation per slot (e.g. "a" and "b" in a battle).
+  The number of sessions is bounded and sessions idle longer than idle_timeout_sec are evicted; the client
+  still shows an evicted conversation, so it can be put back with restore().
+  """
+
+  def __init__(self,
+               max_sessions: int = SESSION_STORE_MAX_SESSIONS,
+               idle_timeout_sec: float = SESSION_IDLE_TIMEOUT_SEC):
+    self.max_sessions = max_sessions
+    self.idle_timeout_sec = idle_timeout_sec
+    self._sessions: "OrderedDict[str, Dict[str, List[dict]]]" = OrderedDict()
+    self._last_access: Dict[str, float] = {}
+    self._lock = Lock()
+
+  def _touch(self, session_id: str) -> Dict[str, List[dict]]:
+    now = time.monotonic()
+    self._evict_idle(now)
+    session = self._sessions.get(session_id)
+    if session is None:
+      session = {}
+      self._sessions[session_id] = session
+      while len(self._sessions) > self.max_sessions:
+        evicted_id, _ = self._sessions.popitem(last=False)
+        self._last_access.pop(evicted_id, None)
+    else:
+      self._sessions.move_to_end(session_id)
+    self._last_access[session_id] = now
+    return session
+
+  def _evict_idle(self, now: float) -> None:
+    while self._sessions:
+      oldest_id = next(iter(self._sessions))
+      if now - self._last_access.get(oldest_id, now) <= self.idle_timeout_sec:
+        break
+      self._sessions.popitem(last=False)
+      self._last_access.pop(oldest_id, None)
+
+  def get_history(self, session_id: str, slot: str) -> List[dict]:
+    with self._lock:
+      return list(self._touch(session_id).get(slot, []))
+
+  def append_message(self, session_id: str, slot: str, role: str, content: str) -> List[dict]:
+    with self._lock:
+      history = self._touch(session_id).setdefault(slot, [])
+      history.append({"role": role, "content": content})
+      return list(history)
+
+  def update_last_message(self, session_id: str, slot: str, content: str) -> List[dict]:
+    with self._lock:
+      history = self._touch(session_id).setdefault(slot, [])
+      if history:
+        history[-1] = {"role": history[-1]["role"], "content": content}
+      return list(history)
+
+  def discard_empty_reply(self, session_id: str, slot: str) -> List[dict]:
+    """Remove the last message if it is an assistant reply that never received any text."""
+    with self._lock:
+      history = self._touch(session_id).setdefault(slot, [])
+      if history and history[-1]["role"]=="assistant" and not history[-1]["content"]:
+        history.pop()
+      return list(history)
+
+  def restore(self, session_id: str, slot: str, messages: List[dict]) -> bool:
+    """
+    Put back the conversation the client shows if the slot has none (e.g. it was evicted).
+    Returns True if the conversation was restored.
+    """
+    with self._lock:
+      session = self._touch(session_id)
+      if session.get(slot) or not messages:
+        return False
+      session[slot] = [{"role": m["role"], "content": m["content"]} for m in messages
+                       if m.get("role") in ("user", "assistant") and isinstance(m.get("content"), str)]
+      return True
+
+  def clear(self, session_id: str) -> None:
+    with self._lock:
+      self._sessions.pop(session_id, None)
+      self._last_access.pop(session_id, None)
+
+  def __len__(self) -> int:
+    with self._lock:
+      return len(self._sessions)
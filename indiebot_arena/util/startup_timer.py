@@ -0,0 +1,23 @@
+import time
+from contextlib import contextmanager
+from typing import List, Tuple
+
+
+class StartupTimer:
+  def __init__(self):
+    self.phases: List[Tuple[str, float]] = []
+
+  @contextmanager
+  def phase(self, name: str):
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.phases.append((name, time.perf_counter() - start))
+
+  def report(self) -> str:
+    lines = ["Startup timing:"]
+    for name, elapsed in self.phases:
+      lines.append(f"  {name:<24} {elapsed:8.3f}s")
+    lines.append(f"  {'total':<24} {sum(e for _, e in self.phases):8.3f}s")
+    return "\n".join(lines)
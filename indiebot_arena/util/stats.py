@@ -0,0 +1,11 @@
+import math
+from typing import List
+
+
+def percentile(values: List[float], q: float) -> float:
+  """Nearest-rank percentile, q in [0, 100]."""
+  if not values:
+    return float("nan")
+  ordered = sorted(values)
+  rank = max(1, math.ceil(q / 100 * len(ordered)))
+  return ordered[rank - 1]
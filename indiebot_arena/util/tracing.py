@@ -0,0 +1,204 @@
+import atexit
+import functools
+import inspect
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from pymongo import monitoring
+
+from indiebot_arena.config import TRACING_ENABLED, TRACE_EXPORT_PATH, TRACE_MAX_SPANS, TRACE_SLOW_UI_MS, \
+  TRACE_SLOW_SERVICE_MS, TRACE_SLOW_DAO_MS, TRACE_EXPORT_INTERVAL_SEC, TRACE_EXPORT_BATCH_SPANS
+
+
+class Tracer:
+  """
+  Collects timing spans for the ui, service, dao and mongo layers and exports them in the Chrome trace
+  event format (open the file in chrome://tracing or https://ui.perfetto.dev).
+  Spans slower than the threshold of their layer are also logged as warnings. Mongo commands have no
+  threshold of their own: a slow command is reported by the DAO span around it.
+  start_export() rewrites the trace file periodically, so spans survive a crash of the process.
+  When disabled, traced()/trace_methods() return the original functions and no listener is attached.
+  """
+
+  def __init__(self, enabled: bool, slow_ms: Dict[str, float], max_spans: int = TRACE_MAX_SPANS):
+    self.enabled = enabled
+    self.slow_ms = slow_ms
+    self._spans = deque(maxlen=max_spans)
+    self._local = threading.local()
+    self._ids = itertools.count(1)
+    self._origin_ns = time.perf_counter_ns()
+    self._pid = os.getpid()
+    self._unexported = 0
+    self._export_batch_spans = 0
+    self._export_due = threading.Event()
+    self._export_lock = threading.Lock()
+
+  def _stack(self) -> List[int]:
+    if not hasattr(self._local, "stack"):
+      self._local.stack = []
+    return self._local.stack
+
+  def _add(self, name: str, layer: str, start_ns: int, duration_ns: int, args: Dict) -> None:
+    self._spans.append({
+      "name": name,
+      "cat": layer,
+      "ph": "X",
+      "ts": (start_ns - self._origin_ns) / 1000,
+      "dur": duration_ns / 1000,
+      "pid": self._pid,
+      "tid": threading.get_ident(),
+      "args": args,
+    })
+    self._unexported += 1
+    if self._export_batch_spans and self._unexported >= self._export_batch_spans:
+      self._export_due.set()
+    duration_ms = duration_ns / 1e6
+    threshold = self.slow_ms.get(layer)
+    if threshold is not None and duration_ms >= threshold:
+      logging.warning(f"Slow {layer} operation {name}: {duration_ms:.1f}ms (trace {args.get('trace_id')})")
+
+  @contextmanager
+  def span(self, name: str, layer: str, **args):
+    if not self.enabled:
+      yield
+      return
+    stack = self._stack()
+    span_id = next(self._ids)
+    trace_id = stack[0] if stack else span_id
+    stack.append(span_id)
+    start_ns = time.perf_counter_ns()
+    try:
+      yield
+    finally:
+      duration_ns = time.perf_counter_ns() - start_ns
+      stack.pop()
+      self._add(name, layer, start_ns, duration_ns, {"trace_id": trace_id, **args})
+
+  def record_completed(self, name: str, layer: str, duration_ns: int, **args) -> None:
+    """Add a span that just ended on this thread, e.g. from a pymongo command event."""
+    stack = self._stack()
+    args = {"trace_id": stack[0] if stack else None, **args}
+    self._add(name, layer, time.perf_counter_ns() - duration_ns, duration_ns, args)
+
+  def spans(self) -> List[Dict]:
+    return list(self._spans)
+
+  def export(self, path: str = TRACE_EXPORT_PATH) -> int:
+    with self._export_lock:
+      self._unexported = 0
+      spans = self.spans()
+      tmp_path = path + ".tmp"
+      with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": spans, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+      os.replace(tmp_path, path)
+      return len(spans)
+
+  def start_export(self, path: str, interval_sec: float = TRACE_EXPORT_INTERVAL_SEC,
+                   batch_spans: int = TRACE_EXPORT_BATCH_SPANS) -> None:
+    """Export to path every interval_sec, as soon as batch_spans new spans were recorded, and at exit."""
+    self._export_batch_spans = batch_spans
+
+    def run():
+      while True:
+        self._export_due.wait(interval_sec)
+        self._export_due.clear()
+        if not self._unexported:
+          continue
+        try:
+          self.export(path)
+        except Exception as e:
+          logging.error(f"Error exporting trace to {path}: {e}")
+
+    threading.Thread(target=run, name="trace-export", daemon=True).start()
+    atexit.register(self.export, path)
+
+  def clear(self) -> None:
+    self._spans.clear()
+
+
+class MongoCommandTracer(monitoring.CommandListener):
+  """
+  Adds one "mongo" span per server command, nested under the DAO span that issued it.
+  """
+
+  def __init__(self, tracer: Tracer):
+    self.tracer = tracer
+
+  def started(self, event):
+    pass
+
+  def succeeded(self, event):
+    self.tracer.record_completed(event.command_name, "mongo", event.duration_micros * 1000,
+                                 database=event.database_name)
+
+  def failed(self, event):
+    self.tracer.record_completed(event.command_name, "mongo", event.duration_micros * 1000,
+                                 database=event.database_name, failure=str(event.failure))
+
+
+tracer = Tracer(
+  TRACING_ENABLED,
+  {"ui": TRACE_SLOW_UI_MS, "service": TRACE_SLOW_SERVICE_MS, "dao": TRACE_SLOW_DAO_MS},
+)
+if TRACING_ENABLED and TRACE_EXPORT_PATH:
+  tracer.start_export(TRACE_EXPORT_PATH)
+
+
+def mongo_event_listeners() -> List[monitoring.CommandListener]:
+  return [MongoCommandTracer(tracer)] if tracer.enabled else []
+
+
+def traced(layer: str, name: Optional[str] = None):
+  """
+  Decorator that records a span per call. Generator functions are timed until they are exhausted.
+  """
+
+  def decorator(fn):
+    if not tracer.enabled:
+      return fn
+    span_name = name or fn.__qualname__
+
+    if inspect.isgeneratorfunction(fn):
+      @functools.wraps(fn)
+      def generator_wrapper(*args, **kwargs):
+        # Not pushed on the span stack: the generator may be resumed on other threads.
+        start_ns = time.perf_counter_ns()
+        try:
+          yield from fn(*args, **kwargs)
+        finally:
+          tracer.record_completed(span_name, layer, time.perf_counter_ns() - start_ns)
+
+      return generator_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+      with tracer.span(span_name, layer):
+        return fn(*args, **kwargs)
+
+    return wrapper
+
+  return decorator
+
+
+def trace_methods(layer: str):
+  """
+  Class decorator applying traced(layer) to every public method.
+  """
+
+  def decorator(cls):
+    if not tracer.enabled:
+      return cls
+    for attr, value in list(vars(cls).items()):
+      if attr.startswith("_") or not inspect.isfunction(value):
+        continue
+      setattr(cls, attr, traced(layer, f"{cls.__name__}.{attr}")(value))
+    return cls
+
+  return decorator
@@ -0,0 +1,51 @@
+import hashlib
+import json
+import time
+from threading import Lock
+from typing import Dict, Iterator, Optional
+
+from indiebot_arena.config import TRAFFIC_RECORD_PATH
+
+
+class TrafficRecorder:
+  """
+  Appends service-level events to a JSON-lines log for offline replay (see tools/replay_traffic.py).
+  Each line is {"t": seconds since the recorder started, "op": ..., ...}.
+  Prompts are recorded only by length and session/user ids only as short hashes.
+  """
+
+  def __init__(self, path: str):
+    self.path = path
+    self._started = time.monotonic()
+    self._file = open(path, "a", encoding="utf-8")
+    self._lock = Lock()
+
+  def record(self, op: str, **fields) -> None:
+    event = {"t": round(time.monotonic() - self._started, 3), "op": op, **fields}
+    line = json.dumps(event, ensure_ascii=False, separators=(",", ":"))
+    with self._lock:
+      self._file.write(line + "\n")
+      self._file.flush()
+
+  def close(self) -> None:
+    with self._lock:
+      self._file.close()
+
+
+def short_hash(value: str) -> str:
+  return hashlib.sha256(value.encode("utf-8")).hexdigest()[:12]
+
+
+def read_events(path: str) -> Iterator[Dict]:
+  with open(path, "r", encoding="utf-8") as f:
+    for line in f:
+      if line.strip():
+        yield json.loads(line)
+
+
+traffic_recorder: Optional[TrafficRecorder] = TrafficRecorder(TRAFFIC_RECORD_PATH) if TRAFFIC_RECORD_PATH else None
+
+
+def record_event(op: str, **fields) -> None:
+  if traffic_recorder is not None:
+    traffic_recorder.record(op, **fields)
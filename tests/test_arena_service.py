@@ -1,10 +1,11 @@
 import logging
 import unittest
+from datetime import datetime, timedelta
 
 from bson import ObjectId
 
 from indiebot_arena.dao.mongo_dao import MongoDAO
-from indiebot_arena.model.domain_model import Model
+from indiebot_arena.model.domain_model import Model, RatingSnapshot
 from indiebot_arena.service.arena_service import ArenaService
 
 
@@ -18,6 +19,8 @@ class TestArenaService(unittest.TestCase):
     self.dao.models_collection.delete_many({})
     self.dao.battles_collection.delete_many({})
     self.dao.leaderboard_collection.delete_many({})
+    self.dao.rating_checkpoints_collection.delete_many({})
+    self.dao.rating_history_collection.delete_many({})
 
   def test_register_and_get_model(self):
     language = "ja"
@@ -45,6 +48,30 @@ class TestArenaService(unittest.TestCase):
     self.assertIsNotNone(model)
     self.assertEqual(model.model_name, model_name)
 
+  def test_register_llama_cpp_model(self):
+    inserted_id = self.arena_service.register_model(
+      language="ja",
+      weight_class="U-5GB",
+      model_name="testuser/test-model-gguf",
+      runtime="llama.cpp",
+      quantization="q4_k_m",
+      file_format="gguf",
+      file_size_gb=1.5,
+      description="A test GGUF model"
+    )
+    self.assertIsNotNone(inserted_id)
+
+    model = self.arena_service.get_one_model("ja", "U-5GB", "testuser/test-model-gguf")
+    self.assertEqual(model.runtime, "llama.cpp")
+
+  def test_register_model_rejects_invalid_engine_settings(self):
+    with self.assertRaises(ValueError):
+      self.arena_service.register_model("ja", "U-5GB", "testuser/bad-format", "transformers", "none", "gguf", 1.0)
+    with self.assertRaises(ValueError):
+      self.arena_service.register_model("ja", "U-5GB", "testuser/bad-quant", "llama.cpp", "bnb", "gguf", 1.0)
+    with self.assertRaises(ValueError):
+      self.arena_service.register_model("ja", "U-5GB", "testuser/bad-runtime", "vllm", "none", "safetensors", 1.0)
+
   def test_get_two_random_models(self):
     language = "ja"
     weight_class = "U-5GB"
@@ -195,11 +222,113 @@ class TestArenaService(unittest.TestCase):
       )
     self.assertIn("Duplicate battle record detected", str(context.exception))
 
+  def test_rating_checkpoint_and_tail_replay(self):
+    arena_service = ArenaService(self.dao)
+    arena_service.checkpoint_interval = 2
+    arena_service.checkpoint_safety_sec = 0
+    model1_id = arena_service.register_model("ja", "U-5GB", "testuser/ckpt-model1", "transformers", "none", "safetensors", 1.0)
+    model2_id = arena_service.register_model("ja", "U-5GB", "testuser/ckpt-model2", "transformers", "none", "safetensors", 1.0)
+
+    for i, winner in enumerate([model1_id, model2_id, model1_id]):
+      arena_service.record_battle("ja", "U-5GB", model1_id, model2_id, winner, f"user{i}")
+    arena_service.update_leaderboard("ja", "U-5GB")
+    checkpoint = self.dao.find_latest_rating_checkpoint("ja", "U-5GB")
+    self.assertIsNotNone(checkpoint)
+    self.assertEqual(checkpoint.battle_count, 3)
+
+    arena_service.record_battle("ja", "U-5GB", model2_id, model1_id, model2_id, "user3")
+    arena_service.update_leaderboard("ja", "U-5GB")
+    self.assertEqual(self.dao.find_latest_rating_checkpoint("ja", "U-5GB")._id, checkpoint._id)
+
+    result = arena_service.verify_rating_checkpoint("ja", "U-5GB")
+    self.assertTrue(result["ok"])
+    self.assertEqual(result["checkpoint_battle_count"], 3)
+
+  def test_aggregate_stats_and_ratings(self):
+    arena_service = ArenaService(self.dao)
+    arena_service.rating_mode = "aggregate"
+    model1_id = arena_service.register_model("ja", "U-5GB", "testuser/agg-model1", "transformers", "none", "safetensors", 1.0)
+    model2_id = arena_service.register_model("ja", "U-5GB", "testuser/agg-model2", "transformers", "none", "safetensors", 1.0)
+
+    for i, winner in enumerate([model1_id, model1_id, model2_id]):
+      arena_service.record_battle("ja", "U-5GB", model1_id, model2_id, winner, f"user{i}")
+
+    stats = {s.model_id: s for s in arena_service.get_model_stats("ja", "U-5GB")}
+    self.assertEqual(stats[model1_id].wins, 2)
+    self.assertEqual(stats[model1_id].losses, 1)
+    self.assertEqual(stats[model2_id].battles, 3)
+    self.assertAlmostEqual(stats[model1_id].win_rate, 2 / 3)
+
+    head_to_head = arena_service.get_head_to_head("ja", "U-5GB")
+    self.assertEqual(len(head_to_head), 1)
+    self.assertEqual(head_to_head[0].battles, 3)
+
+    arena_service.update_leaderboard("ja", "U-5GB")
+    entries = {e.model_id: e for e in arena_service.get_leaderboard("ja", "U-5GB")}
+    self.assertGreater(entries[model1_id].elo_score, entries[model2_id].elo_score)
+
+  def test_update_all_leaderboards(self):
+    arena_service = ArenaService(self.dao)
+    arena_service.recompute_parallel_min_battles = 0
+    ids = {}
+    for weight_class in ("U-5GB", "U-10GB"):
+      ids[weight_class] = [
+        arena_service.register_model("ja", weight_class, f"testuser/all-{weight_class}-{i}", "transformers", "none", "safetensors", 1.0)
+        for i in range(2)
+      ]
+    for i, winner_index in enumerate([0, 0, 1]):
+      model1_id, model2_id = ids["U-5GB"]
+      arena_service.record_battle("ja", "U-5GB", model1_id, model2_id, ids["U-5GB"][winner_index], f"user{i}")
+    model1_id, model2_id = ids["U-10GB"]
+    arena_service.record_battle("ja", "U-10GB", model1_id, model2_id, model2_id, "user0")
+
+    reports = []
+    results = arena_service.update_all_leaderboards(progress=reports.append)
+    self.assertEqual(results, {("ja", "U-10GB"): True, ("ja", "U-5GB"): True})
+    self.assertEqual(len(reports), 2)
+    self.assertEqual(reports[-1].done, 2)
+
+    expected = ArenaService(self.dao).compute_ratings("ja", "U-5GB", use_checkpoint=False, save_checkpoint=False)
+    for entry in arena_service.get_leaderboard("ja", "U-5GB"):
+      self.assertEqual(entry.elo_score, round(expected[str(entry.model_id)]))
+    entries = {e.model_id: e for e in arena_service.get_leaderboard("ja", "U-10GB")}
+    self.assertGreater(entries[model2_id].elo_score, entries[model1_id].elo_score)
+
+  def test_rating_history_is_recorded_and_downsampled(self):
+    arena_service = ArenaService(self.dao)
+    model1_id = arena_service.register_model("ja", "U-5GB", "testuser/history-model1", "transformers", "none", "safetensors", 1.0)
+    model2_id = arena_service.register_model("ja", "U-5GB", "testuser/history-model2", "transformers", "none", "safetensors", 1.0)
+    arena_service.record_battle("ja", "U-5GB", model1_id, model2_id, model1_id, "user1")
+    arena_service.update_leaderboard("ja", "U-5GB")
+    history = arena_service.get_model_rating_history("ja", "U-5GB", model1_id)
+    self.assertEqual(len(history), 1)
+    self.assertGreater(history[0][1], 1000)
+
+    # Three raw snapshots per hour, 40 days ago: after compaction one daily snapshot per day remains.
+    self.dao.rating_history_collection.delete_many({})
+    start = datetime(2024, 1, 1, 0, 0)
+    for hour in range(48):
+      for minute in (0, 20, 40):
+        score = 1000 + hour * 3 + minute // 20
+        arena_service.dao.insert_rating_snapshot(
+          RatingSnapshot("ja", "U-5GB", {str(model1_id): score}, timestamp=start + timedelta(hours=hour, minutes=minute))
+        )
+    now = start + timedelta(days=40)
+    service = ArenaService(self.dao)
+    self.assertEqual(service.compact_rating_history("ja", "U-5GB", now), 144 + 48)
+    history = service.get_rating_history("ja", "U-5GB")
+    self.assertEqual([s.resolution for s in history], ["day", "day"])
+    self.assertEqual([s.ratings[str(model1_id)] for s in history], [1000 + 23 * 3 + 2, 1000 + 47 * 3 + 2])
+    # Already compacted up to the cutoff: no further queries or changes.
+    self.assertEqual(service.compact_rating_history("ja", "U-5GB", now), 0)
+
   @classmethod
   def tearDownClass(cls):
     cls.dao.models_collection.delete_many({})
     cls.dao.battles_collection.delete_many({})
     cls.dao.leaderboard_collection.delete_many({})
+    cls.dao.rating_checkpoints_collection.delete_many({})
+    cls.dao.rating_history_collection.delete_many({})
     cls.dao.client.close()
 
 
@@ -0,0 +1,82 @@
+import logging
+import unittest
+
+from bson import ObjectId
+
+from indiebot_arena.dao.battle_write_buffer import BattleWriteBuffer
+from indiebot_arena.dao.mongo_dao import MongoDAO
+from indiebot_arena.model.domain_model import Battle
+
+
+class TestBattleWriteBuffer(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.dao = MongoDAO(uri="mongodb://localhost:27017", db_name="test_db_write_buffer")
+
+  def setUp(self):
+    self.dao.battles_collection.delete_many({})
+
+  def _battle(self, user_id):
+    return Battle(
+      language="ja",
+      weight_class="U-5GB",
+      model_a_id=ObjectId(),
+      model_b_id=ObjectId(),
+      winner_model_id=ObjectId(),
+      user_id=user_id
+    )
+
+  def test_flush_on_batch_size(self):
+    buffer = BattleWriteBuffer(self.dao, max_batch_size=2, flush_interval_sec=60)
+    buffer.submit(self._battle("user1"))
+    buffer.submit(self._battle("user2"))
+    buffer.close()
+    self.assertEqual(self.dao.battles_collection.count_documents({}), 2)
+    self.assertEqual(buffer.get_metrics()["flushed_battles"], 2)
+
+  def test_flush_on_close(self):
+    buffer = BattleWriteBuffer(self.dao, max_batch_size=100, flush_interval_sec=60)
+    battle_id = buffer.submit(self._battle("user1"))
+    self.assertEqual(self.dao.battles_collection.count_documents({}), 0)
+    buffer.close()
+    self.assertIsNotNone(self.dao.get_battle(battle_id))
+
+  def test_back_pressure_when_full(self):
+    buffer = BattleWriteBuffer(self.dao, max_batch_size=100, flush_interval_sec=60, max_pending=1,
+                               submit_timeout_sec=0.1)
+    buffer.submit(self._battle("user1"))
+    with self.assertRaises(ValueError):
+      buffer.submit(self._battle("user2"))
+    self.assertEqual(buffer.get_metrics()["rejected"], 1)
+    buffer.close()
+
+  def test_retried_battles_get_new_id_and_timestamp(self):
+    buffer = BattleWriteBuffer(self.dao, max_batch_size=100, flush_interval_sec=60)
+    flushed = []
+    buffer.flush_listeners.append(flushed.append)
+    battle = self._battle("user1")
+    old_timestamp = battle.vote_timestamp
+    insert_battles = self.dao.insert_battles
+    self.dao.insert_battles = lambda battles: (_ for _ in ()).throw(ConnectionError("down"))
+    try:
+      old_id = buffer.submit(battle)
+      self.assertEqual(buffer.flush(), 0)
+      self.assertEqual(flushed, [])
+    finally:
+      self.dao.insert_battles = insert_battles
+    self.assertEqual(buffer.flush(), 1)
+    buffer.close()
+    written = self.dao.battles_collection.find_one({})
+    self.assertNotEqual(written["_id"], old_id)
+    self.assertGreaterEqual(written["vote_timestamp"], old_timestamp.replace(microsecond=0))
+    self.assertEqual([[b._id for b in batch] for batch in flushed], [[written["_id"]]])
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.dao.battles_collection.delete_many({})
+    cls.dao.client.close()
+
+
+if __name__=="__main__":
+  logging.basicConfig(level=logging.INFO)
+  unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from datetime import datetime
+
+from bson import ObjectId
+
+from indiebot_arena.dao.document_codec import BATTLE_CODEC, MODEL_CODEC
+from indiebot_arena.model.domain_model import Battle
+
+
+class TestDocumentCodec(unittest.TestCase):
+  def _battle(self, _id=None):
+    return Battle(
+      language="ja",
+      weight_class="U-5GB",
+      model_a_id=ObjectId(),
+      model_b_id=ObjectId(),
+      winner_model_id=ObjectId(),
+      user_id="user1",
+      vote_timestamp=datetime(2025, 1, 1),
+      _id=_id
+    )
+
+  def test_round_trip(self):
+    battle = self._battle(ObjectId())
+    doc = BATTLE_CODEC.encode(battle)
+    self.assertEqual(doc["_id"], battle._id)
+    self.assertEqual(BATTLE_CODEC.decode(doc), battle)
+
+  def test_encode_omits_missing_id(self):
+    self.assertNotIn("_id", BATTLE_CODEC.encode(self._battle()))
+
+  def test_decode_fills_defaults_and_ignores_unknown_keys(self):
+    doc = {
+      "_id": ObjectId(),
+      "language": "ja",
+      "weight_class": "U-5GB",
+      "model_name": "user/model",
+      "runtime": "transformers",
+      "quantization": "none",
+      "file_format": "safetensors",
+      "file_size_gb": 1.0,
+      "legacy_field": "ignored",
+    }
+    model = MODEL_CODEC.decode(doc)
+    self.assertEqual(model.model_name, "user/model")
+    self.assertIsNone(model.description)
+    self.assertIsInstance(model.created_at, datetime)
+
+
+if __name__=="__main__":
+  unittest.main()
@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+import pyarrow.dataset as ds
+from bson import ObjectId
+
+from indiebot_arena.model.domain_model import Battle
+from indiebot_arena.tools.export_battles import export_battles, load_state
+
+
+class InMemoryBattles:
+  """The part of MongoDAO the battle export reads."""
+
+  def __init__(self):
+    self.battles = []
+
+  def add(self, count):
+    for _ in range(count):
+      self.battles.append(Battle(
+        language="ja",
+        weight_class="U-5GB",
+        model_a_id=ObjectId(),
+        model_b_id=ObjectId(),
+        winner_model_id=ObjectId(),
+        user_id="user",
+        vote_timestamp=datetime(2025, 1, 15),
+        _id=ObjectId()
+      ))
+
+  def iter_battle_batches(self, after_id=None, batch_size=10000):
+    battles = [b for b in self.battles if after_id is None or b._id > after_id]
+    for i in range(0, len(battles), batch_size):
+      yield battles[i:i + batch_size]
+
+
+class TestExportBattles(unittest.TestCase):
+  def _exported_ids(self, out_dir, file_format):
+    dataset = ds.dataset(os.path.join(out_dir, "battles"), format="ipc" if file_format=="arrow" else file_format,
+                         partitioning="hive")
+    return sorted(dataset.to_table(columns=["battle_id"]).column("battle_id").to_pylist())
+
+  def test_incremental_then_full_round_trip(self):
+    dao = InMemoryBattles()
+    with tempfile.TemporaryDirectory() as out_dir:
+      dao.add(3)
+      self.assertEqual(export_battles(dao, out_dir, batch_size=2), 3)
+      dao.add(2)
+      self.assertEqual(export_battles(dao, out_dir, batch_size=2), 2)
+      expected = sorted(str(b._id) for b in dao.battles)
+      self.assertEqual(self._exported_ids(out_dir, "parquet"), expected)
+
+      self.assertEqual(export_battles(dao, out_dir, batch_size=4, full=True), 5)
+      self.assertEqual(self._exported_ids(out_dir, "parquet"), expected)
+      self.assertEqual(load_state(out_dir)["battles_last_id"], str(dao.battles[-1]._id))
+
+  def test_full_export_replaces_other_format(self):
+    dao = InMemoryBattles()
+    dao.add(3)
+    with tempfile.TemporaryDirectory() as out_dir:
+      export_battles(dao, out_dir, file_format="arrow")
+      with self.assertRaises(ValueError):
+        export_battles(dao, out_dir, file_format="parquet")
+      export_battles(dao, out_dir, file_format="parquet", full=True)
+      files = [f for _, _, names in os.walk(os.path.join(out_dir, "battles")) for f in names]
+      self.assertTrue(files)
+      self.assertTrue(all(f.endswith(".parquet") for f in files))
+      self.assertEqual(self._exported_ids(out_dir, "parquet"), sorted(str(b._id) for b in dao.battles))
+
+
+if __name__=="__main__":
+  unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+
+from indiebot_arena.util.generation_budget import GenerationBudget, degradation_levels
+
+
+def budget(**kwargs):
+  params = dict(enabled=True, depth_thresholds=(3, 6), wait_thresholds=(10, 30), window_sec=60, cooldown_sec=20,
+                levels=degradation_levels(512))
+  params.update(kwargs)
+  return GenerationBudget(**params)
+
+
+class TestGenerationBudget(unittest.TestCase):
+  def test_levels_follow_queue_depth_with_cooldown(self):
+    b = budget()
+    self.assertEqual(b.current(0).max_new_tokens, 512)
+    for i in range(6):
+      b.submitted(f"s{i}", now=0)
+    level = b.current(0)
+    self.assertEqual((level.level, level.max_new_tokens, level.max_history_messages), (2, 128, 3))
+    for i in range(6):
+      b.started(f"s{i}", now=1)
+    # The queue is empty again, but levels are restored one at a time after the cooldown.
+    self.assertEqual(b.current(5).level, 2)
+    self.assertEqual(b.current(25).level, 1)
+    self.assertEqual(b.current(30).level, 1)
+    self.assertEqual(b.current(45).level, 0)
+    self.assertEqual(b.get_metrics(45)["level_changes"], 4)
+
+  def test_wait_of_queued_and_recent_jobs(self):
+    b = budget()
+    b.submitted("s1", now=0)
+    self.assertEqual(b.current(5).level, 0)
+    self.assertEqual(b.current(12).level, 1)  # still waiting in the queue
+    self.assertEqual(b.started("s1", now=12).level, 1)
+    metrics = b.get_metrics(12)
+    self.assertEqual((metrics["queue_depth"], metrics["max_wait_sec"]), (0, 12))
+    # The recent wait is forgotten after the window, then the cooldown applies.
+    self.assertEqual(b.current(70).level, 1)
+    self.assertEqual(b.current(73).level, 1)
+    self.assertEqual(b.current(93).level, 0)
+
+  def test_abandoned_and_cancelled_submissions(self):
+    b = budget()
+    b.submitted("abandoned", now=0)
+    self.assertEqual(b.current(12).level, 1)
+    # Never started: dropped after the highest wait threshold, then the level recovers after the cooldown.
+    self.assertEqual(b.get_metrics(31)["queue_depth"], 0)
+    self.assertEqual(b.current(45).level, 1)
+    self.assertEqual(b.current(51).level, 0)
+
+    b.submitted("closed", now=100)
+    b.submitted("closed", now=105)  # a resubmission replaces the earlier entry
+    self.assertEqual(b.get_metrics(110)["queue_depth"], 1)
+    b.cancelled("closed", now=110)
+    self.assertEqual(b.get_metrics(110)["queue_depth"], 0)
+    b.started("closed", now=200)
+    self.assertEqual(b.get_metrics(200)["max_wait_sec"], 0)
+
+  def test_disabled_budget_measures_but_never_degrades(self):
+    b = budget(enabled=False)
+    for i in range(10):
+      b.submitted(f"s{i}", now=0)
+    self.assertEqual(b.current(20).level, 0)
+    self.assertEqual(b.get_metrics(20)["queue_depth"], 10)
+    with self.assertRaises(ValueError):
+      budget(depth_thresholds=(3,))
+
+
+if __name__=="__main__":
+  unittest.main()
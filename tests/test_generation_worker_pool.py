@@ -0,0 +1,128 @@
+import threading
+import unittest
+from multiprocessing import Pipe
+from unittest import mock
+
+from indiebot_arena.engine.base_engine import BaseEngine
+from indiebot_arena.engine.fake_engine import FakeEngine
+from indiebot_arena.engine.worker_pool import GenerationWorkerPool, serve
+
+FAKE_ENV = {"GENERATION_BACKEND": "fake", "FAKE_ENGINE_TOKENS_PER_SEC": "0",
+            "FAKE_ENGINE_FIRST_TOKEN_LATENCY_SEC": "0", "FAKE_ENGINE_MAX_NEW_TOKENS": "16"}
+HISTORY = [{"role": "user", "content": "こんにちは"}]
+
+
+def generate(pool, model_id, size_gb=1.0, max_new_tokens=16):
+  return list(pool.generate(HISTORY, model_id, max_new_tokens, 0.6, 0.9, 50, 1.2, "transformers", size_gb))
+
+
+class TestPlacement(unittest.TestCase):
+  def test_models_are_packed_by_size(self):
+    pool = GenerationWorkerPool(num_workers=2, memory_budget_gb=10)
+    first, _ = pool.place("a", "transformers", 6)
+    second, _ = pool.place("b", "transformers", 5)
+    self.assertIsNot(first, second)
+    # Best fit: the 4GB model goes next to the 6GB one, leaving room for a 5GB model on the other worker.
+    self.assertIs(pool.place("c", "transformers", 4)[0], first)
+    self.assertIs(pool.place("a", "transformers", 6)[0], first)
+
+  def test_least_recently_used_models_are_evicted(self):
+    pool = GenerationWorkerPool(num_workers=1, memory_budget_gb=10)
+    pool.place("a", "transformers", 4)
+    pool.place("b", "transformers", 4)
+    pool.place("a", "transformers", 4)
+    worker, evicted = pool.place("c", "llama_cpp", 5)
+    self.assertEqual([model_id for model_id, _ in evicted], ["b"])
+    self.assertEqual(list(worker.models), ["a", "c"])
+    _, evicted = pool.place("huge", "transformers", 12)
+    self.assertEqual(len(evicted), 2)
+    self.assertEqual(list(worker.models), ["huge"])
+
+
+class TestGenerationWorkerPool(unittest.TestCase):
+  def setUp(self):
+    self.pool = GenerationWorkerPool(num_workers=2, memory_budget_gb=1.5, health_interval_sec=60, env=FAKE_ENV)
+    self.pool.start()
+    self.addCleanup(self.pool.stop)
+
+  def test_streams_the_same_text_as_in_process(self):
+    expected = list(FakeEngine(0, 0, 16).generate(HISTORY, "m1", 16, 0.6, 0.9, 50, 1.2))
+    self.assertEqual(generate(self.pool, "m1"), expected)
+    self.assertEqual(generate(self.pool, "m1"), expected)
+    generate(self.pool, "m2")
+    self.assertEqual(sorted(m for s in self.pool.status() for m in s["models"]), ["m1", "m2"])
+
+  def test_crashed_worker_is_restarted(self):
+    worker, _ = self.pool.place("m1", "transformers", 1.0)
+    worker.process.kill()
+    worker.process.wait()
+    self.pool.check_health()
+    self.assertEqual(worker.restarts, 1)
+    self.assertTrue(worker.is_alive())
+    self.assertEqual(worker.models, {})
+    self.assertEqual(len(generate(self.pool, "m1")), 16)
+
+  def test_restart_does_not_block_placement(self):
+    worker, _ = self.pool.place("m1", "transformers", 1.0)
+    worker.process.kill()
+    worker.process.wait()
+    release = threading.Event()
+    restart = worker.restart
+    with mock.patch.object(worker, "restart", side_effect=lambda reason: (release.wait(5), restart(reason))):
+      monitor = threading.Thread(target=self.pool.check_health)
+      monitor.start()
+      try:
+        # m1 goes to the other worker while its worker restarts.
+        other, _ = self.pool.place("m1", "transformers", 1.0)
+        self.assertIsNot(other, worker)
+      finally:
+        release.set()
+        monitor.join(10)
+    self.assertTrue(worker.is_alive())
+    self.assertFalse(worker.restarting)
+
+  def test_preload_loads_on_the_placed_worker(self):
+    self.pool.preload("m1", "transformers", 1.0)
+    self.assertTrue(self.pool.is_placed("m1"))
+    self.assertEqual(len(generate(self.pool, "m1")), 16)
+
+  def test_warnings_are_shown_in_the_app_process(self):
+    pool = GenerationWorkerPool(num_workers=1, health_interval_sec=60, env=dict(FAKE_ENV, MAX_INPUT_TOKEN_LENGTH="4"))
+    pool.start()
+    self.addCleanup(pool.stop)
+    history = [{"role": "user", "content": "one two three four five six"}]
+    with mock.patch.object(BaseEngine, "warn") as warn:
+      list(pool.generate(history, "m1", 16, 0.6, 0.9, 50, 1.2))
+    warn.assert_called_once_with("Trimmed input from conversation as it was longer than 4 tokens.")
+
+  def test_request_in_flight_fails_when_its_worker_dies(self):
+    pool = GenerationWorkerPool(num_workers=1, health_interval_sec=60, env=dict(FAKE_ENV, FAKE_ENGINE_TOKENS_PER_SEC="2"))
+    pool.start()
+    self.addCleanup(pool.stop)
+    worker, _ = pool.place("m1", "transformers", 1.0)
+    stream = pool.generate(HISTORY, "m1", 16, 0.6, 0.9, 50, 1.2)
+    next(stream)
+    worker.process.kill()
+    with self.assertRaises(RuntimeError):
+      list(stream)
+
+
+class TestWorkerProcess(unittest.TestCase):
+  def test_cancel_for_an_unknown_request_is_ignored(self):
+    pool_conn, worker_conn = Pipe()
+    with mock.patch("indiebot_arena.engine.worker_pool.get_engine", return_value=FakeEngine(0, 0, 16)):
+      thread = threading.Thread(target=serve, args=(worker_conn,), daemon=True)
+      thread.start()
+      # A late cancel of a finished generation must not stop a later one that reuses the id.
+      pool_conn.send(("cancel", "r1", None))
+      pool_conn.send(("generate", "r1", ("transformers", "m1", None, (HISTORY, "m1", 16, 0.6, 0.9, 50, 1.2))))
+      kinds = []
+      while not kinds or kinds[-1] not in ("done", "error"):
+        kinds.append(pool_conn.recv()[0])
+      pool_conn.send(("stop", None, None))
+      thread.join(5)
+    self.assertEqual(kinds, ["chunk"] * 16 + ["done"])
+
+
+if __name__=="__main__":
+  unittest.main()
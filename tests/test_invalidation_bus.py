@@ -0,0 +1,196 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+
+from indiebot_arena.dao.invalidation_bus import InvalidationBus, InvalidationEvent
+from indiebot_arena.dao.mongo_dao import MongoDAO
+from indiebot_arena.model.domain_model import Battle, Model
+
+# Change streams need a replica set; a single-node one is enough:
+#   mongod --replSet rs0  &&  mongosh --eval "rs.initiate()"
+REPLICA_SET_URI = "mongodb://localhost:27017/?replicaSet=rs0"
+
+
+class Collector:
+  def __init__(self):
+    self.events = []
+    self.received = threading.Event()
+
+  def __call__(self, event):
+    self.events.append(event)
+    self.received.set()
+
+  def wait_for(self, predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+      if predicate(self.events):
+        return True
+      self.received.wait(0.1)
+      self.received.clear()
+    return False
+
+
+class TestInvalidationDispatch(unittest.TestCase):
+  def test_dispatch_coalesces_and_filters(self):
+    bus = InvalidationBus(MongoDAO(REPLICA_SET_URI, "test_db_invalidation"), mode="polling")
+    leaderboard, models = Collector(), Collector()
+    bus.subscribe(["leaderboard"], leaderboard)
+    unsubscribe = bus.subscribe(["models", "battles"], models)
+    bus.dispatch([
+      InvalidationEvent("leaderboard", "ja", "U-5GB"),
+      InvalidationEvent("leaderboard", "ja", "U-5GB"),
+      InvalidationEvent("models", "ja", "U-5GB"),
+      InvalidationEvent("models"),
+    ])
+    self.assertEqual(leaderboard.events, [InvalidationEvent("leaderboard", "ja", "U-5GB")])
+    self.assertEqual(models.events, [InvalidationEvent("models")])
+    unsubscribe()
+    bus.dispatch([InvalidationEvent("battles", "ja", "U-10GB")])
+    self.assertEqual(len(models.events), 1)
+
+  def test_event_from_change(self):
+    change = {"ns": {"db": "x", "coll": "battles"}, "operationType": "insert",
+              "fullDocument": {"language": "ja", "weight_class": "U-10GB"}}
+    self.assertEqual(InvalidationBus.event_from_change(change), InvalidationEvent("battles", "ja", "U-10GB"))
+    delete = {"ns": {"db": "x", "coll": "models"}, "operationType": "delete"}
+    self.assertEqual(InvalidationBus.event_from_change(delete), InvalidationEvent("models"))
+
+  def test_write_batch_notifies_once_per_division(self):
+    dao = MongoDAO(REPLICA_SET_URI, "test_db_invalidation")
+    calls = []
+    dao.write_listeners.append(lambda *args: calls.append(args))
+    ids = [ObjectId() for _ in range(3)]
+    with dao.write_batch():
+      for entry_id in ids:
+        dao._notify_write("leaderboard", "ja", "U-5GB", [entry_id])
+      dao._notify_write("battles", "ja", "U-10GB", [ids[0]])
+      self.assertEqual(calls, [])
+    self.assertEqual(calls, [("leaderboard", "ja", "U-5GB", ids), ("battles", "ja", "U-10GB", [ids[0]])])
+
+  def test_watch_loop_skips_own_writes(self):
+    dao = MongoDAO(REPLICA_SET_URI, "test_db_invalidation")
+    bus = InvalidationBus(dao, mode="change_stream")
+    collector = Collector()
+    bus.subscribe(["battles"], collector)
+    own_id, other_id = ObjectId(), ObjectId()
+    bus.record_own_write("battles", "ja", "U-5GB", [own_id])
+    changes = [
+      {"ns": {"coll": "battles"}, "documentKey": {"_id": own_id},
+       "fullDocument": {"language": "ja", "weight_class": "U-5GB"}},
+      {"ns": {"coll": "battles"}, "documentKey": {"_id": other_id},
+       "fullDocument": {"language": "ja", "weight_class": "U-10GB"}},
+    ]
+    stream = mock.MagicMock()
+    stream.__enter__.return_value = stream
+    stream.try_next.side_effect = lambda: changes.pop(0) if changes else None
+    with mock.patch.object(dao, "db") as db:
+      db.watch.return_value = stream
+      thread = threading.Thread(target=bus._watch_loop, daemon=True)
+      thread.start()
+      self.assertTrue(collector.wait_for(lambda events: events))
+      bus._stop.set()
+      thread.join(5)
+    self.assertEqual(collector.events, [InvalidationEvent("battles", "ja", "U-10GB")])
+    self.assertFalse(bus.is_own_change(
+      {"ns": {"coll": "battles"}, "documentKey": {"_id": own_id}}))
+
+  def test_failed_bump_does_not_fail_the_write(self):
+    bus = InvalidationBus(MongoDAO(REPLICA_SET_URI, "test_db_invalidation"), mode="polling")
+    with mock.patch.object(bus, "versions_collection") as versions:
+      versions.update_one.side_effect = PyMongoError("connection reset")
+      with self.assertLogs(level="ERROR"):
+        bus.bump_version("battles", "ja", "U-5GB", [ObjectId()])
+      versions.update_one.assert_called_once()
+
+
+class TestInvalidationBus(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.writer = MongoDAO(REPLICA_SET_URI, "test_db_invalidation")
+    cls.reader = MongoDAO(REPLICA_SET_URI, "test_db_invalidation")
+
+  def setUp(self):
+    for collection in (self.writer.models_collection, self.writer.battles_collection,
+                       self.writer.leaderboard_collection, self.writer.db["invalidation_versions"]):
+      collection.delete_many({})
+
+  def _start(self, mode, collections=("models", "battles", "leaderboard")):
+    # Two buses on two DAOs stand in for two processes; the reader bus only listens.
+    writer_bus = InvalidationBus(self.writer, mode, poll_interval_sec=0.1)
+    reader_bus = InvalidationBus(self.reader, mode, poll_interval_sec=0.1)
+    collector = Collector()
+    reader_bus.subscribe(collections, collector)
+    self.assertEqual(writer_bus.start(), mode)
+    self.assertEqual(reader_bus.start(), mode)
+    self.addCleanup(writer_bus.stop)
+    self.addCleanup(reader_bus.stop)
+    time.sleep(0.5)  # let the change stream open before writing
+    return collector
+
+  def _write(self):
+    model_id = self.writer.insert_model(
+      Model("ja", "U-5GB", "testuser/bus-model", "transformers", "none", "safetensors", 1.0)
+    )
+    self.writer.insert_battle(Battle("ja", "U-10GB", model_id, model_id, model_id, "user1"))
+
+  def _assert_division_events(self, collector):
+    expected = {InvalidationEvent("models", "ja", "U-5GB"), InvalidationEvent("battles", "ja", "U-10GB")}
+    self.assertTrue(collector.wait_for(lambda events: expected <= set(events)), collector.events)
+
+  def test_change_stream_delivers_writes_of_other_processes(self):
+    collector = self._start("change_stream")
+    self._write()
+    self._assert_division_events(collector)
+
+  def test_polling_fallback_delivers_writes_of_other_processes(self):
+    collector = self._start("polling")
+    self._write()
+    self._assert_division_events(collector)
+    self.writer.delete_model(self.writer.find_all_models()[0]._id)
+    self.assertTrue(collector.wait_for(lambda events: InvalidationEvent("models") in events))
+
+  def test_writes_of_this_process_are_not_delivered(self):
+    for mode in ("polling", "change_stream"):
+      with self.subTest(mode=mode):
+        self.setUp()
+        writer_bus = InvalidationBus(self.writer, mode, poll_interval_sec=0.1)
+        reader_bus = InvalidationBus(self.reader, mode, poll_interval_sec=0.1)
+        own, other = Collector(), Collector()
+        writer_bus.subscribe(["models", "battles", "leaderboard"], own)
+        reader_bus.subscribe(["models", "battles", "leaderboard"], other)
+        writer_bus.start()
+        reader_bus.start()
+        time.sleep(0.5)
+        self._write()
+        self._assert_division_events(other)
+        time.sleep(0.5)
+        writer_bus.stop()
+        reader_bus.stop()
+        self.assertEqual(own.events, [])
+
+  def test_leaderboard_update_bumps_once(self):
+    from indiebot_arena.service.arena_service import ArenaService
+
+    bus = InvalidationBus(self.writer, "polling")
+    bus.start()
+    self.addCleanup(bus.stop)
+    arena_service = ArenaService(self.writer)
+    for name in ("testuser/a", "testuser/b", "testuser/c"):
+      arena_service.register_model("ja", "U-5GB", name, "transformers", "none", "safetensors", 1.0)
+    arena_service.update_leaderboard("ja", "U-5GB")
+    doc = self.writer.db["invalidation_versions"].find_one({"_id": "leaderboard|ja|U-5GB"})
+    self.assertEqual(doc["versions"], {bus.origin: 1})
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.writer.db.client.drop_database("test_db_invalidation")
+    cls.writer.client.close()
+    cls.reader.client.close()
+
+
+if __name__=="__main__":
+  unittest.main()
@@ -0,0 +1,35 @@
+import threading
+import unittest
+
+from indiebot_arena.service.leaderboard_channel import LeaderboardChannel
+
+
+class TestLeaderboardChannel(unittest.TestCase):
+  def test_versions_are_per_division(self):
+    channel = LeaderboardChannel()
+    self.assertEqual(channel.version("ja", "U-5GB"), 0)
+    self.assertEqual(channel.publish("ja", "U-5GB"), 1)
+    self.assertEqual(channel.publish("ja", "U-5GB"), 2)
+    self.assertEqual(channel.version("ja", "U-10GB"), 0)
+
+  def test_subscribers_and_unsubscribe(self):
+    channel = LeaderboardChannel()
+    received = []
+    unsubscribe = channel.subscribe(lambda language, weight_class, version: received.append((weight_class, version)))
+    channel.subscribe(lambda *args: 1 / 0)  # a failing subscriber doesn't stop the others
+    channel.publish("ja", "U-10GB")
+    unsubscribe()
+    channel.publish("ja", "U-10GB")
+    self.assertEqual(received, [("U-10GB", 1)])
+
+  def test_wait_returns_on_publish(self):
+    channel = LeaderboardChannel()
+    self.assertEqual(channel.wait("ja", "U-5GB", 0, timeout=0.01), 0)
+    timer = threading.Timer(0.05, channel.publish, args=("ja", "U-5GB"))
+    timer.start()
+    self.assertEqual(channel.wait("ja", "U-5GB", 0, timeout=5), 1)
+    timer.join()
+
+
+if __name__=="__main__":
+  unittest.main()
@@ -0,0 +1,86 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from indiebot_arena.engine import llama_cpp_engine
+from indiebot_arena.engine.fake_engine import FakeEngine
+from indiebot_arena.engine.llama_cpp_engine import LlamaCppEngine, detect_gguf_quantization, trim_chat_history
+
+
+def history(n_exchanges):
+  messages = []
+  for i in range(n_exchanges):
+    messages.append({"role": "user", "content": f"q{i}"})
+    messages.append({"role": "assistant", "content": f"a{i}"})
+  messages.append({"role": "user", "content": "latest"})
+  return messages
+
+
+class TestLlamaCppEngine(unittest.TestCase):
+  def test_detected_quantizations_are_accepted(self):
+    engine = LlamaCppEngine()
+    for file_name in ("m-Q4_K_S.gguf", "m-Q3_K_L.gguf", "m-q5_k_s.gguf", "m-Q4_1.gguf", "m-Q5_1.gguf",
+                      "m-Q8_0.gguf", "m-Q6_K.gguf", "m-BF16.gguf", "m-f16.gguf"):
+      quantization = detect_gguf_quantization(file_name)
+      self.assertNotEqual(quantization, "unknown", file_name)
+      engine.validate_registration(quantization, "gguf")
+    self.assertEqual(detect_gguf_quantization("m-IQ4_XS.gguf"), "unknown")
+
+  def test_trimming_drops_whole_exchanges(self):
+    messages, trimmed = trim_chat_history(history(3), len, 4)
+    self.assertTrue(trimmed)
+    self.assertEqual([m["content"] for m in messages], ["q2", "a2", "latest"])
+    messages, trimmed = trim_chat_history(history(3), len, 0)
+    self.assertEqual([m["content"] for m in messages], ["latest"])
+    messages, trimmed = trim_chat_history(history(1), len, 10)
+    self.assertFalse(trimmed)
+    self.assertEqual(len(messages), 3)
+
+  def test_gguf_file_is_looked_up_once(self):
+    engine = LlamaCppEngine()
+    with mock.patch.object(llama_cpp_engine, "select_gguf_file", return_value="m-Q4_K_M.gguf") as select:
+      self.assertEqual(engine._gguf_file("user/m"), "m-Q4_K_M.gguf")
+      self.assertEqual(engine._gguf_file("user/m"), "m-Q4_K_M.gguf")
+    self.assertEqual(select.call_count, 1)
+
+  def test_generation_on_one_model_is_serialized(self):
+    engine = LlamaCppEngine()
+    active, overlaps = [], []
+
+    def fake_generate(llm, *args):
+      active.append(1)
+      overlaps.append(len(active))
+      time.sleep(0.02)
+      yield "text"
+      active.pop()
+
+    with mock.patch.object(engine, "get_model", return_value=object()), \
+        mock.patch.object(engine, "_generate", side_effect=fake_generate):
+      threads = [threading.Thread(target=lambda: list(engine.generate([], "user/m", 8, 0.6, 0.9, 50, 1.2)))
+                 for _ in range(3)]
+      for t in threads:
+        t.start()
+      for t in threads:
+        t.join()
+    self.assertEqual(max(overlaps), 1)
+
+  def test_concurrent_preloads_load_once(self):
+    engine = FakeEngine()
+    loads = []
+
+    def slow_load(model_id):
+      loads.append(model_id)
+      time.sleep(0.05)
+
+    with mock.patch.object(engine, "load_model", side_effect=slow_load):
+      threads = [threading.Thread(target=engine.preload, args=("user/m",)) for _ in range(4)]
+      for t in threads:
+        t.start()
+      for t in threads:
+        t.join()
+    self.assertEqual(loads, ["user/m"])
+
+
+if __name__=="__main__":
+  unittest.main()
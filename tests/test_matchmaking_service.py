@@ -0,0 +1,32 @@
+import random
+import unittest
+
+from indiebot_arena.service.matchmaking_service import pair_weights, sample_pair
+
+
+class TestPairWeights(unittest.TestCase):
+  def test_prefers_under_sampled_models(self):
+    weights = dict(pair_weights(["a", "b", "c"], {"a": 100, "b": 100, "c": 0}, {}))
+    self.assertGreater(weights[("a", "c")], weights[("a", "b")])
+    self.assertGreater(weights[("b", "c")], weights[("a", "b")])
+
+  def test_prefers_close_ratings(self):
+    counts = {"a": 10, "b": 10, "c": 10}
+    weights = dict(pair_weights(["a", "b", "c"], counts, {"a": 1000, "b": 1010, "c": 1400}))
+    self.assertGreater(weights[("a", "b")], weights[("a", "c")])
+
+  def test_every_pair_has_positive_weight(self):
+    weights = pair_weights(["a", "b", "c"], {"a": 1000}, {"a": 3000, "b": 0, "c": 1000})
+    self.assertEqual(len(weights), 3)
+    self.assertTrue(all(w > 0 for _, w in weights))
+
+  def test_sample_pair_returns_distinct_models(self):
+    rng = random.Random(0)
+    weights = pair_weights(["a", "b", "c"], {}, {})
+    for _ in range(20):
+      a, b = sample_pair(weights, rng)
+      self.assertNotEqual(a, b)
+
+
+if __name__=='__main__':
+  unittest.main()
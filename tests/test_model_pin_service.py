@@ -0,0 +1,127 @@
+import os
+import tempfile
+import unittest
+
+from indiebot_arena.dao.mongo_dao import MongoDAO
+from indiebot_arena.engine.engine_registry import set_engine_override
+from indiebot_arena.engine.fake_engine import FakeEngine
+from indiebot_arena.engine.transformers_engine import TransformersEngine
+from indiebot_arena.service.arena_service import ArenaService
+from indiebot_arena.service.model_pin_service import ModelPinService
+
+
+class SnapshotEngine(FakeEngine):
+  """FakeEngine whose snapshots are real directories, one per revision."""
+
+  def __init__(self, root: str):
+    super().__init__(tokens_per_sec=0, first_token_latency_sec=0)
+    self.root = root
+    self.downloads = []
+
+  def snapshot(self, model_id: str, revision: str) -> str:
+    self.downloads.append((model_id, revision))
+    path = os.path.join(self.root, model_id.replace("/", "--"), revision)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class TestPinnedEngineLoad(unittest.TestCase):
+  def test_pinned_model_loads_from_local_snapshot(self):
+    from indiebot_arena.tools.bench_generation import build_tiny_model
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      build_tiny_model(tmp_dir, vocab_words=16, hidden_size=16, num_layers=1, max_position_embeddings=64)
+      engine = TransformersEngine()
+      # The repo does not exist on the Hub, so this only works without any Hub lookup.
+      engine.pin("nobody/not-on-the-hub", tmp_dir)
+      tokenizer, model = engine.load_model("nobody/not-on-the-hub")
+      self.assertEqual(model.config.num_hidden_layers, 1)
+      self.assertEqual(engine.pinned_path("nobody/not-on-the-hub"), tmp_dir)
+
+  def test_repin_evicts_resident_model(self):
+    engine = FakeEngine()
+    engine.preload("user/model")
+    self.assertFalse(engine.pin("user/other", "/snapshots/other"))
+    self.assertTrue(engine.pin("user/model", "/snapshots/rev1"))
+    self.assertEqual(engine.resident_models(), [])
+    self.assertFalse(engine.pin("user/model", "/snapshots/rev1"))
+
+  def test_borrowed_models_do_not_serve_normal_traffic(self):
+    engine = FakeEngine()
+    with engine.using_model("user/model", "rev1 copy") as rev1, engine.using_model("user/model", "rev2 copy") as rev2:
+      self.assertEqual(engine.get_model(rev1), "rev1 copy")
+      self.assertEqual(engine.get_model(rev2), "rev2 copy")
+      self.assertIsNone(engine.get_model("user/model"))
+    self.assertEqual(engine._borrowed, {})
+
+
+class TestModelPinService(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.dao = MongoDAO(uri="mongodb://localhost:27017", db_name="test_db_model_pins")
+    cls.arena_service = ArenaService(cls.dao)
+
+  def setUp(self):
+    self.dao.models_collection.delete_many({})
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp_dir.cleanup)
+    self.engine = SnapshotEngine(self.tmp_dir.name)
+    set_engine_override(self.engine)
+    self.addCleanup(set_engine_override, None)
+    self.revisions = {"testuser/pin-model": "rev1"}
+    self.check_errors = {}
+    self.checked = []
+    self.deleted = []
+    self.pin_service = ModelPinService(self.dao, resolve_revision=lambda name: self.revisions[name],
+                                       verify_revision=self.verify_revision,
+                                       delete_revision=lambda name, revision: self.deleted.append((name, revision)))
+
+  def verify_revision(self, model, revision):
+    self.checked.append((model.model_name, revision))
+    return self.check_errors.get(revision)
+
+  def test_refresh_pins_models_and_follows_new_revisions(self):
+    model_id = self.arena_service.register_model("ja", "U-5GB", "testuser/pin-model", "transformers", "none",
+                                                 "safetensors", 1.0)
+    self.assertEqual(self.pin_service.refresh_all(), 1)
+    model = self.dao.get_model(model_id)
+    self.assertEqual(model.revision, "rev1")
+    self.assertEqual(self.engine.pinned_path("testuser/pin-model"), model.local_path)
+
+    self.assertEqual(self.pin_service.refresh_all(), 0)
+    self.revisions["testuser/pin-model"] = "rev2"
+    self.assertEqual(self.pin_service.refresh_all(), 1)
+    model = self.dao.get_model(model_id)
+    self.assertEqual(model.revision, "rev2")
+    self.assertEqual(self.engine.pinned_path("testuser/pin-model"), model.local_path)
+    self.assertEqual(self.engine.downloads, [("testuser/pin-model", "rev1"), ("testuser/pin-model", "rev2")])
+    self.assertEqual(self.checked, [("testuser/pin-model", "rev2")])
+    self.assertEqual(self.deleted, [("testuser/pin-model", "rev1")])
+
+  def test_rejected_revision_keeps_the_pinned_snapshot(self):
+    local_path = self.engine.snapshot("testuser/pin-model", "rev1")
+    model_id = self.arena_service.register_model("ja", "U-5GB", "testuser/pin-model", "transformers", "none",
+                                                 "safetensors", 1.0, "", "rev1", local_path)
+    self.revisions["testuser/pin-model"] = "rev2"
+    self.check_errors["rev2"] = "Chat test failed."
+    self.assertEqual(self.pin_service.refresh_all(), 0)
+    self.assertEqual(self.pin_service.refresh_all(), 0)
+    model = self.dao.get_model(model_id)
+    self.assertEqual((model.revision, model.local_path), ("rev1", local_path))
+    self.assertEqual(self.engine.pinned_path("testuser/pin-model"), local_path)
+    self.assertEqual(self.checked, [("testuser/pin-model", "rev2")])
+    self.assertEqual(self.deleted, [])
+
+  def test_apply_pins_uses_local_snapshots_only(self):
+    local_path = self.engine.snapshot("testuser/pin-model", "rev1")
+    self.arena_service.register_model("ja", "U-5GB", "testuser/pin-model", "transformers", "none", "safetensors",
+                                      1.0, "", "rev1", local_path)
+    self.arena_service.register_model("ja", "U-5GB", "testuser/missing-model", "transformers", "none",
+                                      "safetensors", 1.0, "", "rev1", os.path.join(self.tmp_dir.name, "gone"))
+    self.assertEqual(self.pin_service.apply_pins(), 1)
+    self.assertEqual(self.engine.pinned_path("testuser/pin-model"), local_path)
+    self.assertIsNone(self.engine.pinned_path("testuser/missing-model"))
+
+
+if __name__=="__main__":
+  unittest.main()
@@ -0,0 +1,67 @@
+import contextvars
+import time
+import unittest
+
+from indiebot_arena.util.paired_battle import PairedBattleExecutor
+
+
+def side(name, steps, delay):
+  def stream():
+    for i in range(1, steps + 1):
+      time.sleep(delay)
+      yield f"{name}{i}"
+
+  return stream
+
+request_context = contextvars.ContextVar("request_context", default=None)
+
+
+def context_side():
+  yield request_context.get()
+
+
+def failing_side():
+  yield "x1"
+  raise RuntimeError("model crashed")
+
+
+class TestPairedBattleExecutor(unittest.TestCase):
+  def test_concurrent_sides_take_as_long_as_the_slower_one(self):
+    executor = PairedBattleExecutor("concurrent")
+    started = time.monotonic()
+    updates = list(executor.run(side("a", 5, 0.04), side("b", 2, 0.1)))
+    elapsed = time.monotonic() - started
+    self.assertEqual(updates[-1], ("a5", "b2"))
+    self.assertLess(elapsed, 0.35)  # sequential would be 0.4
+    metrics = executor.get_metrics()
+    self.assertEqual(metrics["battles"], 1)
+    self.assertEqual(metrics["active"], 0)
+    self.assertLess(metrics["start_skew_p50_ms"], 50)
+    self.assertGreaterEqual(metrics["completion_p50_ms"], metrics["slower_side_p50_ms"])
+
+  def test_interleaved_alternates_steps(self):
+    executor = PairedBattleExecutor("interleaved")
+    updates = list(executor.run(side("a", 3, 0), side("b", 1, 0)))
+    self.assertEqual(updates, [("a1", None), ("a1", "b1"), ("a2", "b1"), ("a3", "b1")])
+
+  def test_sides_see_the_callers_context(self):
+    for mode in ("concurrent", "interleaved"):
+      token = request_context.set("request-1")
+      try:
+        updates = list(PairedBattleExecutor(mode).run(context_side, context_side))
+      finally:
+        request_context.reset(token)
+      self.assertEqual(updates[-1], ("request-1", "request-1"), mode)
+
+  def test_failing_side_lets_the_other_finish(self):
+    for mode in ("concurrent", "interleaved"):
+      executor = PairedBattleExecutor(mode)
+      updates = []
+      with self.assertRaises(RuntimeError):
+        for update in executor.run(failing_side, side("b", 3, 0.01)):
+          updates.append(update)
+      self.assertEqual(updates[-1][1], "b3", mode)
+
+
+if __name__=="__main__":
+  unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+from unittest import mock
+
+from indiebot_arena.util.rate_limiter import AdmissionController
+
+
+class TestAdmissionController(unittest.TestCase):
+  def setUp(self):
+    self.now = 1000.0
+    patcher = mock.patch("indiebot_arena.util.rate_limiter.time.monotonic", side_effect=lambda: self.now)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def test_user_burst_then_reject(self):
+    controller = AdmissionController(user_rate_per_min=6, user_burst=2, global_rate_per_min=600, global_burst=100,
+                                     max_delay_sec=0)
+    self.assertEqual(controller.admit("user1"), (True, 0.0))
+    self.assertEqual(controller.admit("user1"), (True, 0.0))
+    admitted, wait_sec = controller.admit("user1")
+    self.assertFalse(admitted)
+    self.assertAlmostEqual(wait_sec, 10.0)
+    # Other users are not affected
+    self.assertTrue(controller.admit("user2")[0])
+
+  def test_refill_over_time(self):
+    controller = AdmissionController(user_rate_per_min=6, user_burst=1, global_rate_per_min=600, global_burst=100,
+                                     max_delay_sec=0)
+    self.assertTrue(controller.admit("user1")[0])
+    self.assertFalse(controller.admit("user1")[0])
+    self.now += 10
+    self.assertTrue(controller.admit("user1")[0])
+
+  def test_delay_within_max_delay(self):
+    controller = AdmissionController(user_rate_per_min=60, user_burst=1, global_rate_per_min=600, global_burst=100,
+                                     max_delay_sec=2)
+    self.assertEqual(controller.admit("user1"), (True, 0.0))
+    admitted, wait_sec = controller.admit("user1")
+    self.assertTrue(admitted)
+    self.assertAlmostEqual(wait_sec, 1.0)
+
+  def test_global_limit(self):
+    controller = AdmissionController(user_rate_per_min=60, user_burst=10, global_rate_per_min=6, global_burst=2,
+                                     max_delay_sec=0)
+    self.assertTrue(controller.admit("user1", cost=2)[0])
+    self.assertFalse(controller.admit("user2")[0])
+
+
+if __name__=='__main__':
+  unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+from datetime import datetime, timedelta
+
+from indiebot_arena.model.domain_model import RatingSnapshot
+from indiebot_arena.service.rating_history import bucket_start, compaction_cutoff, downsample
+
+
+class TestRatingHistory(unittest.TestCase):
+  def test_downsample_keeps_last_snapshot_per_bucket(self):
+    start = datetime(2024, 5, 1, 10, 0)
+    snapshots = [
+      RatingSnapshot("ja", "U-5GB", {"m": 1000 + i}, timestamp=start + timedelta(minutes=25 * i))
+      for i in range(6)
+    ]
+    hourly = downsample(list(reversed(snapshots)), "hour")
+    self.assertEqual([s.ratings["m"] for s in hourly], [1002, 1004, 1005])
+    self.assertEqual({s.resolution for s in hourly}, {"hour"})
+    self.assertEqual(hourly[-1].timestamp, snapshots[-1].timestamp)
+    self.assertEqual([s.ratings["m"] for s in downsample(snapshots, "day")], [1005])
+
+  def test_cutoff_is_bucket_aligned(self):
+    now = datetime(2024, 5, 3, 15, 42, 10)
+    self.assertEqual(compaction_cutoff(now, timedelta(hours=24), "hour"), datetime(2024, 5, 2, 15, 0))
+    self.assertEqual(compaction_cutoff(now, timedelta(days=1), "day"), datetime(2024, 5, 2))
+    with self.assertRaises(ValueError):
+      bucket_start(now, "week")
+
+
+if __name__=="__main__":
+  unittest.main()
@@ -0,0 +1,68 @@
+import threading
+import unittest
+
+from indiebot_arena.service.registration_job_service import RegistrationJobQueue
+
+
+class TestRegistrationJobQueue(unittest.TestCase):
+  def setUp(self):
+    self.calls = []
+    self.release = threading.Event()
+    self.fail = set()
+
+  def runner(self, model_id, revision, progress):
+    self.calls.append((model_id, revision))
+    progress(f"loading {model_id}")
+    self.release.wait(5)
+    if model_id in self.fail:
+      raise RuntimeError("load failed")
+    progress("done")
+    return f"{model_id}@{revision}"
+
+  def make_queue(self, **kwargs):
+    queue = RegistrationJobQueue(self.runner, **kwargs)
+    self.addCleanup(queue._executor.shutdown)
+    self.addCleanup(self.release.set)
+    return queue
+
+  def test_concurrent_submits_share_one_job(self):
+    queue = self.make_queue(max_workers=2)
+    job1 = queue.submit("owner/model", "abc")
+    job2 = queue.submit("owner/model", "abc")
+    other = queue.submit("owner/model", "def")
+    self.assertIs(job1, job2)
+    self.assertIsNot(job1, other)
+    self.release.set()
+    snapshots = list(job1.follow(poll_sec=0.1))
+    self.assertEqual(snapshots[-1], ["loading owner/model", "done"])
+    self.assertEqual(job1.status, "succeeded")
+    self.assertEqual(job1.result, "owner/model@abc")
+    list(other.follow(poll_sec=0.1))
+    # A succeeded revision is served from the history without loading again.
+    self.assertIs(queue.submit("owner/model", "abc"), job1)
+    self.assertEqual(sorted(self.calls), [("owner/model", "abc"), ("owner/model", "def")])
+
+  def test_failed_jobs_are_retried(self):
+    self.fail.add("owner/broken")
+    self.release.set()
+    queue = self.make_queue()
+    job = queue.submit("owner/broken", "abc")
+    list(job.follow(poll_sec=0.1))
+    self.assertEqual(job.status, "failed")
+    self.assertEqual(job.error, "load failed")
+    retry = queue.submit("owner/broken", "abc")
+    self.assertIsNot(retry, job)
+    list(retry.follow(poll_sec=0.1))
+    self.assertEqual(len(self.calls), 2)
+
+  def test_history_is_bounded(self):
+    self.release.set()
+    queue = self.make_queue(max_history=2)
+    for revision in ("r1", "r2", "r3"):
+      list(queue.submit("owner/model", revision).follow(poll_sec=0.1))
+    self.assertEqual([job.revision for job in queue.history()], ["r3", "r2"])
+    self.assertEqual(queue.active_jobs(), [])
+
+
+if __name__=="__main__":
+  unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+from unittest import mock
+
+from indiebot_arena.util.session_store import ConversationStore
+
+
+class TestConversationStore(unittest.TestCase):
+  def test_append_and_update_last_message(self):
+    store = ConversationStore()
+    store.append_message("s1", "a", "user", "こんにちは")
+    store.append_message("s1", "a", "assistant", "")
+    history = store.update_last_message("s1", "a", "こんにちは！")
+    self.assertEqual(history, [
+      {"role": "user", "content": "こんにちは"},
+      {"role": "assistant", "content": "こんにちは！"},
+    ])
+    self.assertEqual(store.get_history("s1", "b"), [])
+
+  def test_discard_empty_reply(self):
+    store = ConversationStore()
+    store.append_message("s1", "a", "user", "hello")
+    store.append_message("s1", "a", "assistant", "")
+    self.assertEqual(store.discard_empty_reply("s1", "a"), [{"role": "user", "content": "hello"}])
+    store.append_message("s1", "a", "assistant", "partial")
+    self.assertEqual(len(store.discard_empty_reply("s1", "a")), 2)
+
+  def test_returned_history_is_snapshot(self):
+    store = ConversationStore()
+    history = store.append_message("s1", "a", "user", "hello")
+    history.append({"role": "user", "content": "not stored"})
+    self.assertEqual(len(store.get_history("s1", "a")), 1)
+
+  def test_bounded_sessions(self):
+    store = ConversationStore(max_sessions=2)
+    for session_id in ("s1", "s2", "s3"):
+      store.append_message(session_id, "a", "user", "hello")
+    self.assertEqual(len(store), 2)
+    self.assertEqual(store.get_history("s1", "a"), [])
+
+  def test_idle_eviction(self):
+    store = ConversationStore(idle_timeout_sec=10)
+    with mock.patch("indiebot_arena.util.session_store.time.monotonic", return_value=100.0):
+      store.append_message("s1", "a", "user", "hello")
+    with mock.patch("indiebot_arena.util.session_store.time.monotonic", return_value=200.0):
+      store.append_message("s2", "a", "user", "hello")
+    self.assertEqual(len(store), 1)
+
+  def test_restore_evicted_conversation(self):
+    store = ConversationStore(max_sessions=1)
+    store.append_message("s1", "a", "user", "hello")
+    store.append_message("s1", "a", "assistant", "hi")
+    shown = store.get_history("s1", "a")
+    store.append_message("s2", "a", "user", "hello")  # evicts s1
+    self.assertEqual(store.get_history("s1", "a"), [])
+    self.assertTrue(store.restore("s1", "a", shown + [{"role": "assistant", "content": {"path": "image.png"}}]))
+    self.assertEqual(store.append_message("s1", "a", "user", "again")[:2], shown)
+    self.assertFalse(store.restore("s1", "a", [{"role": "user", "content": "other"}]))
+    self.assertFalse(store.restore("s3", "a", []))
+
+  def test_clear(self):
+    store = ConversationStore()
+    store.append_message("s1", "a", "user", "hello")
+    store.clear("s1")
+    self.assertEqual(len(store), 0)
+
+
+if __name__=='__main__':
+  unittest.main()
@@ -0,0 +1,64 @@
+import json
+import os
+import tempfile
+import unittest
+
+from indiebot_arena.engine.shard_loader import checkpoint_bytes, find_shards, load_causal_lm
+from indiebot_arena.tools.bench_generation import build_tiny_model
+
+
+class TestShardLoader(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    cls.tmp_dir = tempfile.TemporaryDirectory()
+    cls.model_path = cls.tmp_dir.name
+    build_tiny_model(cls.model_path, vocab_words=64, hidden_size=32, num_layers=2, max_position_embeddings=64)
+    model = AutoModelForCausalLM.from_pretrained(cls.model_path, torch_dtype=torch.bfloat16)
+    os.remove(os.path.join(cls.model_path, "model.safetensors"))
+    model.save_pretrained(cls.model_path, max_shard_size="20KB")
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.tmp_dir.cleanup()
+
+  def test_matches_from_pretrained(self):
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    self.assertGreater(len(find_shards(self.model_path)), 1)
+    model, report = load_causal_lm(self.model_path, torch.bfloat16, device="cpu", max_workers=3)
+    reference = AutoModelForCausalLM.from_pretrained(self.model_path, torch_dtype=torch.bfloat16)
+    input_ids = torch.tensor([[1, 6, 7, 8, 9]])
+    with torch.no_grad():
+      self.assertTrue(torch.equal(model(input_ids).logits, reference(input_ids).logits))
+    self.assertEqual([s.file_name for s in report.shards], find_shards(self.model_path))
+    self.assertEqual(sum(s.tensors for s in report.shards), len(reference.state_dict()))
+    self.assertIsNone(model.generation_config.eos_token_id)
+
+  def test_quantized_checkpoints_fall_back(self):
+    import torch
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      with open(os.path.join(self.model_path, "config.json"), encoding="utf-8") as f:
+        config = json.load(f)
+      config["quantization_config"] = {"quant_method": "bitsandbytes", "load_in_4bit": True}
+      with open(os.path.join(tmp_dir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f)
+      for name in find_shards(self.model_path) + ["model.safetensors.index.json"]:
+        os.symlink(os.path.join(self.model_path, name), os.path.join(tmp_dir, name))
+      self.assertIsNone(load_causal_lm(tmp_dir, torch.bfloat16, device="cpu"))
+    self.assertIsNone(load_causal_lm(os.path.join(self.model_path, "missing"), torch.bfloat16, device="cpu"))
+
+  def test_checkpoints_too_large_for_the_device_fall_back(self):
+    import torch
+
+    size = checkpoint_bytes(self.model_path)
+    self.assertIsNone(load_causal_lm(self.model_path, torch.bfloat16, device="cpu", max_bytes=size - 1))
+    self.assertIsNotNone(load_causal_lm(self.model_path, torch.bfloat16, device="cpu", max_bytes=size))
+
+
+if __name__=="__main__":
+  unittest.main()
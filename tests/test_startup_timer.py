@@ -0,0 +1,26 @@
+import unittest
+from unittest import mock
+
+from indiebot_arena.util.startup_timer import StartupTimer
+
+
+class TestStartupTimer(unittest.TestCase):
+  def test_report_lists_phases_and_total(self):
+    timer = StartupTimer()
+    with mock.patch("time.perf_counter", side_effect=[0.0, 1.5, 2.0, 2.25]):
+      with timer.phase("connect database"):
+        pass
+      with self.assertRaises(ValueError):
+        with timer.phase("build ui"):
+          raise ValueError()
+    self.assertEqual(timer.phases, [("connect database", 1.5), ("build ui", 0.25)])
+    lines = timer.report().splitlines()
+    self.assertEqual(lines[0], "Startup timing:")
+    self.assertIn("connect database", lines[1])
+    self.assertTrue(lines[1].endswith("1.500s"))
+    self.assertTrue(lines[-1].strip().startswith("total"))
+    self.assertTrue(lines[-1].endswith("1.750s"))
+
+
+if __name__=="__main__":
+  unittest.main()
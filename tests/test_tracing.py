@@ -0,0 +1,99 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from indiebot_arena.util import tracing
+from indiebot_arena.util.tracing import Tracer, traced, trace_methods
+
+
+class TestTracing(unittest.TestCase):
+  def setUp(self):
+    self.default_slow_ms = tracing.tracer.slow_ms
+    self.tracer = Tracer(True, {"service": 0.0})
+    patcher = mock.patch.object(tracing, "tracer", self.tracer)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def test_nested_spans_share_trace_id(self):
+    with self.tracer.span("outer", "ui"):
+      with self.tracer.span("inner", "dao"):
+        pass
+    inner, outer = self.tracer.spans()
+    self.assertEqual(inner["name"], "inner")
+    self.assertEqual(inner["args"]["trace_id"], outer["args"]["trace_id"])
+    self.assertLessEqual(outer["ts"], inner["ts"])
+    self.assertGreaterEqual(outer["dur"], inner["dur"])
+
+  def test_traced_functions_and_methods(self):
+    @trace_methods("service")
+    class Service:
+      def compute(self):
+        return 1
+
+      def stream(self):
+        yield from range(3)
+
+    @traced("ui")
+    def handler():
+      return Service().compute()
+
+    with self.assertLogs(level="WARNING") as logs:
+      self.assertEqual(handler(), 1)
+      self.assertEqual(list(Service().stream()), [0, 1, 2])
+    names = [s["name"] for s in self.tracer.spans()]
+    self.assertEqual(names[0], "Service.compute")
+    self.assertTrue(names[1].endswith("handler"))
+    self.assertEqual(names[2], "Service.stream")
+    self.assertIn("Slow service operation Service.compute", logs.output[0])
+
+  def test_disabled_returns_original(self):
+    self.tracer.enabled = False
+
+    def fn():
+      return 1
+
+    self.assertIs(traced("ui")(fn), fn)
+    self.assertEqual(tracing.mongo_event_listeners(), [])
+
+  def test_export_chrome_trace(self):
+    with self.tracer.span("op", "dao"):
+      pass
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      path = os.path.join(tmp_dir, "trace.json")
+      self.assertEqual(self.tracer.export(path), 1)
+      with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    event = data["traceEvents"][0]
+    self.assertEqual((event["name"], event["cat"], event["ph"]), ("op", "dao", "X"))
+
+  def test_export_after_batch_of_spans(self):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      path = os.path.join(tmp_dir, "trace.json")
+      with mock.patch.object(tracing.atexit, "register"):
+        self.tracer.start_export(path, interval_sec=60, batch_spans=2)
+      with self.tracer.span("first", "dao"):
+        pass
+      self.assertFalse(os.path.exists(path))
+      with self.tracer.span("second", "dao"):
+        pass
+      deadline = time.monotonic() + 5
+      while not os.path.exists(path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+      with open(path, "r", encoding="utf-8") as f:
+        self.assertEqual(len(json.load(f)["traceEvents"]), 2)
+
+  def test_mongo_commands_are_not_logged_as_slow(self):
+    tracer = Tracer(True, dict(self.default_slow_ms, dao=0.0))
+    with self.assertLogs(level="WARNING") as logs:
+      with tracer.span("MongoDAO.find", "dao"):
+        tracing.MongoCommandTracer(tracer).succeeded(
+          mock.Mock(command_name="find", duration_micros=500000, database_name="db"))
+    self.assertEqual(len(logs.output), 1)
+    self.assertIn("Slow dao operation", logs.output[0])
+
+
+if __name__=="__main__":
+  unittest.main()
@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+
+from indiebot_arena.engine.engine_registry import set_engine_override
+from indiebot_arena.engine.fake_engine import FakeEngine
+from indiebot_arena.tools.latency_stats import LatencyStats
+from indiebot_arena.tools.replay_traffic import TrafficReplayer
+from indiebot_arena.util.stats import percentile
+from indiebot_arena.util.traffic_recorder import TrafficRecorder, read_events
+
+
+class TestTrafficReplay(unittest.TestCase):
+  def test_record_and_read_events(self):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      path = os.path.join(tmp_dir, "traffic.jsonl")
+      recorder = TrafficRecorder(path)
+      recorder.record("leaderboard", l="ja", w="U-5GB")
+      recorder.record("chat", s="abc", slot="a", m="user/model", r="transformers", n=12, turns=1)
+      recorder.close()
+      events = list(read_events(path))
+    self.assertEqual([e["op"] for e in events], ["leaderboard", "chat"])
+    self.assertEqual(events[1]["n"], 12)
+    self.assertLessEqual(events[0]["t"], events[1]["t"])
+
+  def test_fake_engine_is_deterministic(self):
+    engine = FakeEngine(tokens_per_sec=0, first_token_latency_sec=0, max_new_tokens=8)
+    history = [{"role": "user", "content": "hello"}]
+    first = list(engine.generate(history, "user/model", 100, 0.6, 0.9, 50, 1.2))
+    second = list(engine.generate(history, "user/model", 100, 0.6, 0.9, 50, 1.2))
+    self.assertEqual(first, second)
+    self.assertEqual(len(first), 8)
+    self.assertNotEqual(first[-1], list(engine.generate(history, "user/other", 100, 0.6, 0.9, 50, 1.2))[-1])
+
+  def test_replay_chat_events(self):
+    set_engine_override(FakeEngine(tokens_per_sec=0, first_token_latency_sec=0, max_new_tokens=4))
+    self.addCleanup(set_engine_override, None)
+    stats = LatencyStats()
+    events = [
+      {"t": 0.0, "op": "chat", "s": "s1", "slot": "a", "m": "user/model-a", "r": "transformers", "n": 5, "turns": 1},
+      {"t": 0.0, "op": "chat", "s": "s1", "slot": "b", "m": "user/model-b", "r": "transformers", "n": 5, "turns": 1},
+    ]
+    TrafficReplayer(arena_service=None, stats=stats).replay(events, speedup=0, workers=2)
+    summary = stats.summary()
+    self.assertEqual(summary["chat"]["count"], 2)
+    self.assertEqual(summary["chat"]["errors"], 0)
+    self.assertEqual(summary["chat_ttft"]["count"], 2)
+
+  def test_percentile(self):
+    values = [float(v) for v in range(1, 101)]
+    self.assertEqual(percentile(values, 50), 50.0)
+    self.assertEqual(percentile(values, 99), 99.0)
+    self.assertEqual(percentile(values, 100), 100.0)
+
+
+if __name__=="__main__":
+  unittest.main()
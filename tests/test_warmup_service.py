@@ -0,0 +1,54 @@
+import logging
+import unittest
+
+from indiebot_arena.dao.mongo_dao import MongoDAO
+from indiebot_arena.service.arena_service import ArenaService
+from indiebot_arena.service.warmup_service import WarmupService
+
+
+class TestWarmupService(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.dao = MongoDAO(uri="mongodb://localhost:27017", db_name="test_db_warmup")
+    cls.arena_service = ArenaService(cls.dao)
+    cls.warmup_service = WarmupService(cls.dao)
+
+  def setUp(self):
+    self.dao.models_collection.delete_many({})
+    self.dao.battles_collection.delete_many({})
+    self.dao.leaderboard_collection.delete_many({})
+
+  def _register(self, name):
+    return self.arena_service.register_model("ja", "U-5GB", name, "transformers", "none", "safetensors", 1.0)
+
+  def test_select_most_battled_models(self):
+    model1_id = self._register("testuser/warm-model1")
+    model2_id = self._register("testuser/warm-model2")
+    model3_id = self._register("testuser/warm-model3")
+    self.arena_service.record_battle("ja", "U-5GB", model2_id, model3_id, model2_id, "user1")
+    self.arena_service.record_battle("ja", "U-5GB", model3_id, model2_id, model3_id, "user2")
+    self.arena_service.record_battle("ja", "U-5GB", model1_id, model3_id, model1_id, "user3")
+
+    models = self.warmup_service.select_models("ja", "U-5GB", 2, "battles")
+    self.assertEqual([m.model_name for m in models], ["testuser/warm-model3", "testuser/warm-model2"])
+
+  def test_select_top_ranked_models(self):
+    model1_id = self._register("testuser/warm-model1")
+    model2_id = self._register("testuser/warm-model2")
+    self.arena_service.record_battle("ja", "U-5GB", model1_id, model2_id, model2_id, "user1")
+    self.arena_service.update_leaderboard("ja", "U-5GB")
+
+    models = self.warmup_service.select_models("ja", "U-5GB", 1, "leaderboard")
+    self.assertEqual(models[0].model_name, "testuser/warm-model2")
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.dao.models_collection.delete_many({})
+    cls.dao.battles_collection.delete_many({})
+    cls.dao.leaderboard_collection.delete_many({})
+    cls.dao.client.close()
+
+
+if __name__=="__main__":
+  logging.basicConfig(level=logging.INFO)
+  unittest.main()